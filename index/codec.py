@@ -0,0 +1,279 @@
+from typing import List
+import heapq
+import struct
+import numpy as np
+
+#cada ocorrência é gravada como 3 inteiros de 4 bytes (big-endian): doc_id, term_id e term_freq
+OCCURRENCE_RECORD = struct.Struct(">III")
+RECORD_SIZE = OCCURRENCE_RECORD.size
+RECORD_DTYPE = np.dtype([("doc_id", ">u4"), ("term_id", ">u4"), ("term_freq", ">u4")])
+
+#entrada de salto (skip) de cada bloco de ocorrências de um termo: term_id, ultimo doc_id do bloco,
+#posição (em bytes) do inicio do bloco no arquivo e maior term_freq do bloco
+SKIP_DTYPE = np.dtype([("term_id", ">u4"), ("last_doc_id", ">u4"), ("offset", ">u8"), ("max_term_freq", ">u4")])
+#ocorrências por bloco
+SKIP_BLOCK_SIZE = 128
+
+#quantidade de ocorrências lidas por vez (12 MB)
+CHUNK_RECORDS = 1 << 20
+#buffer de escrita em bytes
+WRITE_BUFFER_SIZE = 16 << 20
+
+
+def encode_occurrences(doc_ids, term_ids, term_freqs) -> np.ndarray:
+    """
+    Cria o array de registros (no formato do arquivo) a partir das colunas doc_id, term_id e term_freq
+    """
+    records = np.empty(len(doc_ids), dtype=RECORD_DTYPE)
+    records["doc_id"] = doc_ids
+    records["term_id"] = term_ids
+    records["term_freq"] = term_freqs
+    return records
+
+
+def decode_occurrences(buffer) -> np.ndarray:
+    """
+    Interpreta os bytes lidos do arquivo como um array de registros (sem cópia)
+    """
+    return np.frombuffer(buffer, dtype=RECORD_DTYPE, count=len(buffer)//RECORD_SIZE)
+
+
+def unpack_occurrences(buffer) -> List[tuple]:
+    """
+    Retorna as tuplas (doc_id, term_id, term_freq) dos registros do buffer
+    Mais rápido que o NumPy quando há poucos registros (ex.: lista de ocorrências de um termo raro)
+    """
+    return list(OCCURRENCE_RECORD.iter_unpack(buffer))
+
+
+def occurrence_keys(records:np.ndarray) -> np.ndarray:
+    """
+    Chave de ordenação das ocorrências (term_id, doc_id) empacotada em um inteiro de 64 bits
+    """
+    return (records["term_id"].astype(np.uint64) << np.uint64(32)) | records["doc_id"].astype(np.uint64)
+
+
+class OccurrenceReader:
+    """
+    Leitura sequencial de um arquivo de ocorrências em blocos de chunk_records registros
+    """
+    def __init__(self, file_name:str, chunk_records:int=CHUNK_RECORDS, start_pos:int=0):
+        self.file = open(file_name, "rb")
+        self.file.seek(start_pos)
+        self.chunk_records = chunk_records
+
+    def read_chunk(self) -> np.ndarray:
+        """
+        Retorna o próximo bloco de registros (vazio ao final do arquivo)
+        """
+        return decode_occurrences(self.file.read(self.chunk_records*RECORD_SIZE))
+
+    def __iter__(self):
+        records = self.read_chunk()
+        while len(records) > 0:
+            yield records
+            records = self.read_chunk()
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def postings_blocks(term_ids:np.ndarray, first_position:int, block_size:int) -> (np.ndarray, np.ndarray, np.ndarray):
+    """
+    Divide registros ordenados por term_id em blocos de até block_size ocorrências de um mesmo termo.
+    first_position é a posição, na lista do seu termo, do primeiro registro.
+    Retorna o inicio, o fim e a posição na lista do termo (do primeiro registro) de cada bloco
+    """
+    starts = np.concatenate(([0], np.flatnonzero(term_ids[1:] != term_ids[:-1]) + 1))
+    counts = np.diff(np.append(starts, len(term_ids)))
+    positions = np.arange(len(term_ids)) - np.repeat(starts, counts)
+    positions[:counts[0]] += first_position
+    segments = np.repeat(np.arange(len(starts)), counts)
+    blocks = positions//block_size
+    bounds = np.flatnonzero((segments[1:] != segments[:-1]) | (blocks[1:] != blocks[:-1])) + 1
+    block_starts = np.concatenate(([0], bounds))
+    return block_starts, np.append(bounds, len(term_ids)), positions[block_starts]
+
+
+class TermDirectory:
+    """
+    Diretório dos termos de um arquivo de ocorrências ordenado por term_id, montado à medida que o arquivo
+    é gravado: term_id, posição (em bytes) da primeira ocorrência e quantidade de ocorrências (df) de cada termo.
+    Caso skip_block_size seja informado, a lista de cada termo é dividida em blocos de skip_block_size ocorrências
+    e é criada uma entrada de salto (SKIP_DTYPE) por bloco
+    """
+    def __init__(self, skip_block_size:int=0):
+        self.lst_term_ids = []
+        self.lst_offsets = []
+        self.lst_doc_counts = []
+        self.skip_block_size = skip_block_size
+        self.lst_skips = []
+
+    def add(self, records:np.ndarray, start_record:int):
+        """
+        Registra os termos de records, gravados (no formato de registros) a partir da posição start_record do arquivo
+        """
+        if len(records) == 0:
+            return
+        term_ids = records["term_id"]
+        starts = np.concatenate(([0], np.flatnonzero(term_ids[1:] != term_ids[:-1]) + 1))
+        doc_counts = np.diff(np.append(starts, len(records)))
+        if self.skip_block_size:
+            self.add_record_skips(records, start_record)
+        self.add_terms(term_ids[starts], (starts.astype(np.int64)+start_record)*RECORD_SIZE, doc_counts)
+
+    def continues(self, term_id:int) -> bool:
+        return bool(self.lst_term_ids) and self.lst_term_ids[-1][-1] == term_id
+
+    def add_terms(self, term_ids:np.ndarray, offsets:np.ndarray, doc_counts:np.ndarray):
+        """
+        Registra termos (ordenados) gravados a partir de offsets. Caso o primeiro seja o ultimo termo já registrado,
+        suas ocorrências são somadas a ele
+        """
+        if len(term_ids) > 0 and self.continues(term_ids[0]):
+            self.lst_doc_counts[-1][-1] += doc_counts[0]
+            term_ids, offsets, doc_counts = term_ids[1:], offsets[1:], doc_counts[1:]
+        if len(term_ids) > 0:
+            self.lst_term_ids.append(np.asarray(term_ids, dtype=np.uint32))
+            self.lst_offsets.append(np.asarray(offsets, dtype=np.int64))
+            self.lst_doc_counts.append(np.asarray(doc_counts, dtype=np.int64))
+
+    def add_skips(self, skips:np.ndarray):
+        if len(skips) > 0:
+            self.lst_skips.append(skips)
+
+    def add_record_skips(self, records:np.ndarray, start_record:int):
+        term_ids = records["term_id"]
+        first_position = 0
+        if self.continues(term_ids[0]):
+            first_position = start_record - int(self.lst_offsets[-1][-1])//RECORD_SIZE
+        block_starts, block_ends, positions = postings_blocks(term_ids, first_position, self.skip_block_size)
+
+        skips = np.empty(len(block_starts), dtype=SKIP_DTYPE)
+        skips["term_id"] = term_ids[block_starts]
+        skips["last_doc_id"] = records["doc_id"][block_ends-1]
+        skips["offset"] = (block_starts+start_record)*RECORD_SIZE
+        skips["max_term_freq"] = np.maximum.reduceat(records["term_freq"], block_starts)
+        if positions[0] % self.skip_block_size != 0:
+            #continuação do ultimo bloco registrado
+            last_skip = self.lst_skips[-1][-1:]
+            last_skip["last_doc_id"] = skips["last_doc_id"][0]
+            last_skip["max_term_freq"] = max(last_skip["max_term_freq"][0], skips["max_term_freq"][0])
+            skips = skips[1:]
+        self.add_skips(skips)
+
+    def skips(self) -> np.ndarray:
+        """
+        Entradas de salto (SKIP_DTYPE), ordenadas por term_id e pelos blocos de cada termo
+        """
+        if not self.lst_skips:
+            return np.zeros(0, dtype=SKIP_DTYPE)
+        return np.concatenate(self.lst_skips)
+
+    def columns(self) -> (np.ndarray, np.ndarray, np.ndarray):
+        """
+        Retorna os arrays (term_ids, offsets, doc_counts), ordenados por term_id
+        """
+        if not self.lst_term_ids:
+            return np.zeros(0, dtype=np.uint32), np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        return np.concatenate(self.lst_term_ids), np.concatenate(self.lst_offsets), np.concatenate(self.lst_doc_counts)
+
+    @staticmethod
+    def read(file_name:str, chunk_records:int=CHUNK_RECORDS, skip_block_size:int=0) -> "TermDirectory":
+        """
+        Monta o diretório a partir de um arquivo (no formato de registros) já gravado: uma leitura completa do arquivo
+        """
+        term_directory = TermDirectory(skip_block_size)
+        num_records = 0
+        with OccurrenceReader(file_name, chunk_records) as reader:
+            for records in reader:
+                term_directory.add(records, num_records)
+                num_records += len(records)
+        return term_directory
+
+
+class OccurrenceWriter:
+    """
+    Escrita de registros de ocorrências em blocos, com um buffer grande.
+    Caso term_directory seja informado, o diretório dos termos é montado durante a gravação
+    """
+    def __init__(self, file_name:str, buffer_size:int=WRITE_BUFFER_SIZE, term_directory:TermDirectory=None):
+        self.file = open(file_name, "wb", buffering=buffer_size)
+        self.num_records = 0
+        self.term_directory = term_directory
+
+    def write(self, records:np.ndarray):
+        if len(records) > 0:
+            self.file.write(np.ascontiguousarray(records, dtype=RECORD_DTYPE).tobytes())
+            if self.term_directory is not None:
+                self.term_directory.add(records, self.num_records)
+            self.num_records += len(records)
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def merge_occurrence_files(lst_file_names:List[str], str_out_file:str, chunk_records:int=CHUNK_RECORDS,
+                           term_directory:TermDirectory=None, writer_class=OccurrenceWriter) -> int:
+    """
+    Intercala (k-way merge) arquivos de ocorrências ordenados por (term_id, doc_id) em str_out_file.
+    Cada arquivo é lido em blocos; um heap mantém os arquivos ordenados pela ultima chave do seu bloco atual:
+    todas as ocorrências com chave até a menor delas já podem ser gravadas.
+    Caso term_directory seja informado, ele recebe o diretório dos termos do arquivo intercalado.
+    writer_class define o formato do arquivo gravado (ex.: compression.CompressedPostingsWriter).
+    Retorna a quantidade de ocorrências gravadas
+    """
+    readers = [OccurrenceReader(file_name, chunk_records) for file_name in lst_file_names]
+    arr_records = [None]*len(readers)
+    arr_keys = [None]*len(readers)
+    arr_pos = [0]*len(readers)
+    heap = []
+
+    def next_chunk(i:int):
+        records = readers[i].read_chunk()
+        if len(records) > 0:
+            arr_records[i] = records
+            arr_keys[i] = occurrence_keys(records)
+            arr_pos[i] = 0
+            heapq.heappush(heap, (int(arr_keys[i][-1]), i))
+        else:
+            arr_records[i] = None
+            readers[i].close()
+
+    try:
+        for i in range(len(readers)):
+            next_chunk(i)
+        with writer_class(str_out_file, term_directory=term_directory) as writer:
+            while heap:
+                bound_key = heap[0][0]
+                arr_parts = []
+                for i, records in enumerate(arr_records):
+                    if records is None:
+                        continue
+                    end = int(np.searchsorted(arr_keys[i], bound_key, side="right"))
+                    if end > arr_pos[i]:
+                        arr_parts.append(records[arr_pos[i]:end])
+                        arr_pos[i] = end
+                merged = np.concatenate(arr_parts) if len(arr_parts) > 1 else arr_parts[0]
+                writer.write(merged[np.argsort(occurrence_keys(merged), kind="stable")])
+
+                #os arquivos cujo bloco terminou em bound_key precisam de um novo bloco
+                while heap and heap[0][0] == bound_key:
+                    _, i = heapq.heappop(heap)
+                    next_chunk(i)
+            return writer.num_records
+    finally:
+        for reader in readers:
+            reader.close()
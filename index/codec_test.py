@@ -0,0 +1,79 @@
+from index.codec import *
+from index.structure import TermOccurrence
+import numpy as np
+import unittest
+import os
+
+
+class CodecTest(unittest.TestCase):
+    FILE_NAME = "codec_test.idx"
+
+    def tearDown(self):
+        for str_file in [CodecTest.FILE_NAME, f"{CodecTest.FILE_NAME}.1", f"{CodecTest.FILE_NAME}.2"]:
+            if os.path.exists(str_file):
+                os.remove(str_file)
+
+    def test_same_bytes_as_term_occurrence(self):
+        lst_occur = [TermOccurrence(2,1,5), TermOccurrence(10,2,1), TermOccurrence(70000,300000,2)]
+        with open(CodecTest.FILE_NAME,"wb") as file:
+            for occur in lst_occur:
+                occur.write(file)
+        with open(CodecTest.FILE_NAME,"rb") as file:
+            bytes_term_occurrence = file.read()
+
+        records = encode_occurrences([2,10,70000],[1,2,300000],[5,1,2])
+        self.assertEqual(records.tobytes(), bytes_term_occurrence, "A codificação em bloco deve gerar os mesmos bytes do TermOccurrence.write")
+        self.assertListEqual(unpack_occurrences(bytes_term_occurrence), [(2,1,5),(10,2,1),(70000,300000,2)])
+        self.assertListEqual(decode_occurrences(bytes_term_occurrence)["term_id"].tolist(), [1,2,300000])
+
+    def test_reader_writer(self):
+        num_records = 1000
+        records = encode_occurrences(np.arange(num_records), np.arange(num_records)//10, np.ones(num_records))
+        with OccurrenceWriter(CodecTest.FILE_NAME) as writer:
+            writer.write(records[:300])
+            writer.write(records[300:])
+        self.assertEqual(os.path.getsize(CodecTest.FILE_NAME), num_records*RECORD_SIZE)
+
+        with OccurrenceReader(CodecTest.FILE_NAME, chunk_records=128) as reader:
+            arr_chunks = list(reader)
+        self.assertListEqual([len(chunk) for chunk in arr_chunks], [128]*7+[104])
+        self.assertTrue(np.array_equal(np.concatenate(arr_chunks), records))
+
+    def test_occurrence_keys(self):
+        records = encode_occurrences([5,1,3],[2,2,1],[1,1,1])
+        order = np.argsort(occurrence_keys(records), kind="stable")
+        self.assertListEqual(order.tolist(), [2,1,0], "A ordenação deve ser por term_id e, em seguida, doc_id")
+
+    def test_term_directory(self):
+        #termo 1 com 5 ocorrências, dividido entre dois blocos gravados
+        records = encode_occurrences([1,2,3,4,5,1,7], [0,1,1,1,1,1,3], [1,1,1,1,1,1,1])
+        records = records[np.argsort(occurrence_keys(records), kind="stable")]
+        term_directory = TermDirectory()
+        with OccurrenceWriter(CodecTest.FILE_NAME, term_directory=term_directory) as writer:
+            writer.write(records[:3])
+            writer.write(records[3:])
+        term_ids, offsets, doc_counts = term_directory.columns()
+        self.assertListEqual(term_ids.tolist(), [0,1,3])
+        self.assertListEqual(offsets.tolist(), [0,RECORD_SIZE,6*RECORD_SIZE])
+        self.assertListEqual(doc_counts.tolist(), [1,5,1])
+
+        read_term_ids, read_offsets, read_doc_counts = TermDirectory.read(CodecTest.FILE_NAME, chunk_records=2).columns()
+        self.assertListEqual(read_term_ids.tolist(), [0,1,3])
+        self.assertListEqual(read_offsets.tolist(), [0,RECORD_SIZE,6*RECORD_SIZE])
+        self.assertListEqual(read_doc_counts.tolist(), [1,5,1])
+
+    def test_merge_term_directory(self):
+        lst_runs = [f"{CodecTest.FILE_NAME}.1", f"{CodecTest.FILE_NAME}.2"]
+        for i, str_run in enumerate(lst_runs):
+            with OccurrenceWriter(str_run) as writer:
+                writer.write(encode_occurrences([i,i+2,i], [1,1,2], [1,1,1]))
+        term_directory = TermDirectory()
+        merge_occurrence_files(lst_runs, CodecTest.FILE_NAME, chunk_records=1, term_directory=term_directory)
+        term_ids, offsets, doc_counts = term_directory.columns()
+        self.assertListEqual(term_ids.tolist(), [1,2])
+        self.assertListEqual(offsets.tolist(), [0,4*RECORD_SIZE])
+        self.assertListEqual(doc_counts.tolist(), [4,2])
+
+
+if __name__ == "__main__":
+    unittest.main()
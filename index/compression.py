@@ -0,0 +1,244 @@
+"""
+Codificação compactada das listas de ocorrências do FileIndex.
+
+A lista de cada termo é gravada em blocos de SKIP_BLOCK_SIZE ocorrências (os mesmos blocos das entradas de salto),
+sem o term_id: os doc_ids são gravados como diferenças (gaps) em relação ao doc_id anterior do termo
+(o primeiro gap do bloco é relativo ao ultimo doc_id do bloco anterior, guardado na entrada de salto)
+e os term_freqs são gravados em seguida, no mesmo bloco.
+
+    vbyte   gaps e term_freqs em VByte: 7 bits por byte, o bit mais significativo indica que há mais bytes
+    packed  largura em bits dos gaps (u8), largura em bits dos term_freqs (u8) e os valores empacotados
+            com essa largura (ordem de bits little-endian)
+"""
+from index.codec import SKIP_DTYPE, SKIP_BLOCK_SIZE, WRITE_BUFFER_SIZE, TermDirectory, postings_blocks
+import numpy as np
+
+#valores de 32 bits ocupam no máximo 5 bytes em VByte
+VBYTE_MAX_BYTES = 5
+
+
+def vbyte_encode(values:np.ndarray) -> (np.ndarray, np.ndarray):
+    """
+    Codifica os valores em VByte. Retorna os bytes e a posição inicial de cada valor
+    """
+    values = np.asarray(values, dtype=np.uint64)
+    sizes = np.ones(len(values), dtype=np.int64)
+    for shift in range(7, 7*VBYTE_MAX_BYTES, 7):
+        sizes += values >= np.uint64(1 << shift)
+    starts = np.cumsum(sizes) - sizes
+    buffer = np.empty(int(sizes.sum()), dtype=np.uint8)
+    for byte in range(int(sizes.max()) if len(sizes) > 0 else 0):
+        mask = sizes > byte
+        chunk = (values[mask] >> np.uint64(7*byte)) & np.uint64(0x7F)
+        #bit de continuação
+        chunk |= np.where(sizes[mask] > byte+1, np.uint64(0x80), np.uint64(0))
+        buffer[starts[mask]+byte] = chunk
+    return buffer, starts
+
+
+def vbyte_decode(buffer:np.ndarray, count:int=None) -> np.ndarray:
+    """
+    Decodifica os (primeiros count) valores VByte de buffer
+    """
+    buffer = np.frombuffer(buffer, dtype=np.uint8) if not isinstance(buffer, np.ndarray) else buffer
+    ends = np.flatnonzero(buffer < 0x80)
+    if count is not None:
+        ends = ends[:count]
+    if len(ends) == 0:
+        return np.zeros(0, dtype=np.uint64)
+    buffer = buffer[:ends[-1]+1]
+    starts = np.concatenate(([0], ends[:-1]+1))
+    shifts = (np.arange(len(buffer)) - np.repeat(starts, ends-starts+1))*7
+    return np.add.reduceat((buffer & 0x7F).astype(np.uint64) << shifts.astype(np.uint64), starts)
+
+
+def pack_bits(values:np.ndarray, width:int) -> np.ndarray:
+    bits = (np.asarray(values, dtype=np.uint64)[:, None] >> np.arange(width, dtype=np.uint64)) & np.uint64(1)
+    return np.packbits(bits.astype(np.uint8).ravel(), bitorder="little")
+
+
+def unpack_bits(buffer:np.ndarray, count:int, width:int) -> np.ndarray:
+    bits = np.unpackbits(buffer, count=count*width, bitorder="little").reshape(count, width)
+    return bits.astype(np.uint64) @ (np.uint64(1) << np.arange(width, dtype=np.uint64))
+
+
+def bit_width(values:np.ndarray) -> int:
+    return max(1, int(values.max()).bit_length()) if len(values) > 0 else 1
+
+
+def block_gaps(doc_ids:np.ndarray, block_starts:np.ndarray, prev_doc_ids:np.ndarray) -> np.ndarray:
+    """
+    Diferença de cada doc_id para o anterior; o primeiro de cada bloco é relativo a prev_doc_ids
+    """
+    doc_ids = doc_ids.astype(np.int64)
+    gaps = np.empty(len(doc_ids), dtype=np.int64)
+    gaps[1:] = doc_ids[1:] - doc_ids[:-1]
+    gaps[block_starts] = doc_ids[block_starts] - prev_doc_ids
+    return gaps
+
+
+class VByteCodec:
+    name = "vbyte"
+
+    def encode_blocks(self, doc_ids:np.ndarray, term_freqs:np.ndarray, block_starts:np.ndarray,
+                      prev_doc_ids:np.ndarray) -> (np.ndarray, np.ndarray):
+        """
+        Codifica os blocos (que iniciam em block_starts). Retorna os bytes e a posição inicial de cada bloco
+        """
+        gaps = block_gaps(doc_ids, block_starts, prev_doc_ids)
+        counts = np.diff(np.append(block_starts, len(doc_ids)))
+        #cada bloco: os seus gaps seguidos dos seus term_freqs
+        blocks = np.repeat(np.arange(len(block_starts)), counts)
+        pos_in_block = np.arange(len(doc_ids)) - block_starts[blocks]
+        gap_pos = 2*block_starts[blocks] + pos_in_block
+        values = np.empty(2*len(doc_ids), dtype=np.uint64)
+        values[gap_pos] = gaps
+        values[gap_pos+counts[blocks]] = term_freqs
+        buffer, starts = vbyte_encode(values)
+        return buffer, starts[2*block_starts]
+
+    def decode_block(self, buffer:np.ndarray, count:int, prev_doc_id:int) -> (np.ndarray, np.ndarray):
+        values = vbyte_decode(buffer, 2*count)
+        doc_ids = np.cumsum(values[:count]) + np.uint64(prev_doc_id)
+        return doc_ids.astype(np.uint32), values[count:].astype(np.uint32)
+
+    def decode_term(self, buffer:np.ndarray, doc_count:int, block_size:int) -> (np.ndarray, np.ndarray):
+        """
+        Decodifica todos os blocos de um termo de uma só vez
+        """
+        values = vbyte_decode(buffer, 2*doc_count)
+        positions = np.arange(len(values))
+        blocks = positions//(2*block_size)
+        counts = np.minimum(block_size, doc_count - blocks*block_size)
+        is_gap = positions - blocks*2*block_size < counts
+        #os gaps são relativos ao ultimo doc_id do bloco anterior: basta a soma acumulada
+        doc_ids = np.cumsum(values[is_gap])
+        return doc_ids.astype(np.uint32), values[~is_gap].astype(np.uint32)
+
+
+class PackedCodec:
+    name = "packed"
+
+    def encode_block(self, gaps:np.ndarray, term_freqs:np.ndarray) -> bytes:
+        gap_width, freq_width = bit_width(gaps), bit_width(term_freqs)
+        return bytes([gap_width, freq_width]) + pack_bits(gaps, gap_width).tobytes() + \
+               pack_bits(term_freqs, freq_width).tobytes()
+
+    def encode_blocks(self, doc_ids:np.ndarray, term_freqs:np.ndarray, block_starts:np.ndarray,
+                      prev_doc_ids:np.ndarray) -> (np.ndarray, np.ndarray):
+        gaps = block_gaps(doc_ids, block_starts, prev_doc_ids)
+        block_ends = np.append(block_starts[1:], len(doc_ids))
+        lst_blocks = [self.encode_block(gaps[start:end], term_freqs[start:end])
+                      for start, end in zip(block_starts.tolist(), block_ends.tolist())]
+        sizes = np.array([len(block) for block in lst_blocks], dtype=np.int64)
+        return np.frombuffer(b"".join(lst_blocks), dtype=np.uint8), np.cumsum(sizes) - sizes
+
+    def block_size_bytes(self, buffer:np.ndarray, count:int) -> int:
+        return 2 + -(-count*int(buffer[0])//8) + -(-count*int(buffer[1])//8)
+
+    def decode_block(self, buffer:np.ndarray, count:int, prev_doc_id:int) -> (np.ndarray, np.ndarray):
+        gap_width, freq_width = int(buffer[0]), int(buffer[1])
+        gaps_end = 2 + -(-count*gap_width//8)
+        gaps = unpack_bits(buffer[2:gaps_end], count, gap_width)
+        term_freqs = unpack_bits(buffer[gaps_end:], count, freq_width)
+        return (np.cumsum(gaps) + np.uint64(prev_doc_id)).astype(np.uint32), term_freqs.astype(np.uint32)
+
+    def decode_term(self, buffer:np.ndarray, doc_count:int, block_size:int) -> (np.ndarray, np.ndarray):
+        lst_doc_ids, lst_term_freqs = [], []
+        pos, prev_doc_id = 0, 0
+        for block_start in range(0, doc_count, block_size):
+            count = min(block_size, doc_count-block_start)
+            size = self.block_size_bytes(buffer[pos:pos+2], count)
+            doc_ids, term_freqs = self.decode_block(buffer[pos:pos+size], count, prev_doc_id)
+            lst_doc_ids.append(doc_ids)
+            lst_term_freqs.append(term_freqs)
+            pos += size
+            prev_doc_id = int(doc_ids[-1])
+        if not lst_doc_ids:
+            return np.zeros(0, dtype=np.uint32), np.zeros(0, dtype=np.uint32)
+        return np.concatenate(lst_doc_ids), np.concatenate(lst_term_freqs)
+
+
+POSTINGS_CODECS = {codec.name:codec for codec in [VByteCodec(), PackedCodec()]}
+
+
+class CompressedPostingsWriter:
+    """
+    Grava registros (ordenados por term_id e doc_id) com um codec de POSTINGS_CODECS.
+    Os registros do ultimo bloco (ainda incompleto) ficam pendentes até a próxima gravação (ou o close).
+    O diretório dos termos e as entradas de salto (offsets em bytes do arquivo compactado) são montados em term_directory
+    """
+    def __init__(self, file_name:str, buffer_size:int=WRITE_BUFFER_SIZE, term_directory:TermDirectory=None,
+                 codec_name:str="vbyte"):
+        self.file = open(file_name, "wb", buffering=buffer_size)
+        self.codec = POSTINGS_CODECS[codec_name]
+        self.term_directory = TermDirectory(SKIP_BLOCK_SIZE) if term_directory is None else term_directory
+        self.num_records = 0
+        self.num_bytes = 0
+        self.pending = None
+        #posição do primeiro registro pendente na lista do seu termo e o ultimo doc_id do bloco anterior
+        self.pending_position = 0
+        self.prev_doc_id = 0
+
+    def write(self, records:np.ndarray):
+        if len(records) == 0:
+            return
+        self.num_records += len(records)
+        if self.pending is not None:
+            if self.pending["term_id"][0] != records["term_id"][0]:
+                #o bloco pendente é o ultimo do seu termo
+                self.encode(self.pending, self.pending_position, len(self.pending))
+                self.pending = None
+            else:
+                records = np.concatenate([self.pending, records])
+        if self.pending is None:
+            self.pending_position = 0
+        block_starts, _, positions = postings_blocks(records["term_id"], self.pending_position, SKIP_BLOCK_SIZE)
+        #o ultimo bloco pode continuar na próxima gravação
+        last_start = int(block_starts[-1])
+        self.encode(records[:last_start], self.pending_position, last_start)
+        self.pending = records[last_start:]
+        self.pending_position = int(positions[-1])
+
+    def encode(self, records:np.ndarray, first_position:int, count:int):
+        if count == 0:
+            return
+        term_ids = records["term_id"]
+        block_starts, block_ends, positions = postings_blocks(term_ids, first_position, SKIP_BLOCK_SIZE)
+        doc_ids = records["doc_id"].astype(np.int64)
+        #o primeiro bloco de cada termo é relativo a zero
+        prev_doc_ids = np.zeros(len(block_starts), dtype=np.int64)
+        prev_doc_ids[1:] = doc_ids[block_ends[:-1]-1]
+        prev_doc_ids[positions == 0] = 0
+        if positions[0] != 0:
+            prev_doc_ids[0] = self.prev_doc_id
+        buffer, block_offsets = self.codec.encode_blocks(doc_ids, records["term_freq"], block_starts, prev_doc_ids)
+        block_offsets = block_offsets + self.num_bytes
+
+        skips = np.empty(len(block_starts), dtype=SKIP_DTYPE)
+        skips["term_id"] = term_ids[block_starts]
+        skips["last_doc_id"] = doc_ids[block_ends-1]
+        skips["offset"] = block_offsets
+        skips["max_term_freq"] = np.maximum.reduceat(records["term_freq"], block_starts)
+        self.term_directory.add_skips(skips)
+        #uma entrada por termo, no seu primeiro bloco
+        block_term_ids = skips["term_id"]
+        term_starts = np.concatenate(([0], np.flatnonzero(block_term_ids[1:] != block_term_ids[:-1]) + 1))
+        self.term_directory.add_terms(block_term_ids[term_starts], block_offsets[term_starts],
+                                      np.add.reduceat(block_ends-block_starts, term_starts))
+
+        self.file.write(buffer.tobytes())
+        self.num_bytes += len(buffer)
+        self.prev_doc_id = int(doc_ids[-1])
+
+    def close(self):
+        if self.pending is not None:
+            self.encode(self.pending, self.pending_position, len(self.pending))
+            self.pending = None
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
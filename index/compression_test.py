@@ -0,0 +1,131 @@
+from index.compression import *
+from index.codec import RECORD_SIZE, encode_occurrences, occurrence_keys
+from index.structure import FileIndex, HashIndex
+from index.postings import intersect_cursors
+from index.storage import write_index, read_index
+import numpy as np
+import unittest
+import shutil
+import os
+
+
+class CompressionTest(unittest.TestCase):
+    FILE_NAME = "compression_test.idx"
+
+    def tearDown(self):
+        if os.path.isdir(CompressionTest.FILE_NAME):
+            shutil.rmtree(CompressionTest.FILE_NAME)
+        elif os.path.exists(CompressionTest.FILE_NAME):
+            os.remove(CompressionTest.FILE_NAME)
+
+    def test_vbyte(self):
+        values = np.array([0, 1, 127, 128, 16383, 16384, (1 << 32)-1], dtype=np.uint64)
+        buffer, starts = vbyte_encode(values)
+        self.assertListEqual(starts.tolist(), [0, 1, 2, 3, 5, 7, 10])
+        self.assertListEqual(buffer[:5].tolist(), [0, 1, 127, 0x80, 1])
+        self.assertListEqual(vbyte_decode(buffer).tolist(), values.tolist())
+        self.assertListEqual(vbyte_decode(buffer, 3).tolist(), [0, 1, 127])
+
+    def test_pack_bits(self):
+        values = np.array([0, 5, 7, 1, 3])
+        self.assertEqual(bit_width(values), 3)
+        packed = pack_bits(values, 3)
+        self.assertEqual(len(packed), 2)
+        self.assertListEqual(unpack_bits(packed, 5, 3).tolist(), values.tolist())
+
+    def test_writer(self):
+        rng = np.random.default_rng(7)
+        records = encode_occurrences(rng.integers(0, 5000, 3000), rng.integers(0, 20, 3000), rng.integers(1, 50, 3000))
+        records = records[np.argsort(occurrence_keys(records), kind="stable")]
+        keys = occurrence_keys(records)
+        records = records[np.concatenate(([True], keys[1:] != keys[:-1]))]
+        for codec_name, codec in POSTINGS_CODECS.items():
+            with CompressedPostingsWriter(CompressionTest.FILE_NAME, codec_name=codec_name) as writer:
+                #gravações que dividem os blocos
+                for pos in range(0, len(records), 100):
+                    writer.write(records[pos:pos+100])
+            self.assertEqual(writer.num_records, len(records))
+            buffer = np.fromfile(CompressionTest.FILE_NAME, dtype=np.uint8)
+            self.assertLess(len(buffer), len(records)*RECORD_SIZE//2, f"O codec {codec_name} deveria compactar as ocorrências")
+
+            term_ids, offsets, doc_counts = writer.term_directory.columns()
+            ends = np.append(offsets[1:], len(buffer))
+            for term_id, start, end, doc_count in zip(term_ids, offsets, ends, doc_counts):
+                expected = records[records["term_id"] == term_id]
+                doc_ids, term_freqs = codec.decode_term(buffer[start:end], int(doc_count), SKIP_BLOCK_SIZE)
+                self.assertListEqual(doc_ids.tolist(), expected["doc_id"].tolist())
+                self.assertListEqual(term_freqs.tolist(), expected["term_freq"].tolist())
+
+            #cada bloco pode ser decodificado de forma independente
+            skips = writer.term_directory.skips()
+            skip = len(skips)-1
+            count = int(doc_counts[-1]) % SKIP_BLOCK_SIZE or SKIP_BLOCK_SIZE
+            doc_ids, _ = codec.decode_block(buffer[skips["offset"][skip]:], count, int(skips["last_doc_id"][skip-1]))
+            self.assertEqual(doc_ids[-1], skips["last_doc_id"][skip])
+
+
+class CompressedFileIndexTest(unittest.TestCase):
+    PATH = "compressed_test.idx"
+
+    def create_index(self, index):
+        rng = np.random.default_rng(3)
+        for doc_id in range(600):
+            for term_id in rng.choice(40, 8, replace=False).tolist():
+                index.index(f"termo{term_id}", doc_id, int(rng.integers(1, 20)))
+            index.index("casa", doc_id, 1)
+        index.finish_indexing()
+        return index
+
+    def setUp(self):
+        self.hash_index = self.create_index(HashIndex())
+
+    def tearDown(self):
+        if os.path.isdir(CompressedFileIndexTest.PATH):
+            shutil.rmtree(CompressedFileIndexTest.PATH)
+
+    def check_index(self, index):
+        for term in self.hash_index.vocabulary:
+            expected = [(occur.doc_id, occur.term_freq) for occur in self.hash_index.get_occurrence_list(term)]
+            self.assertListEqual([(occur.doc_id, occur.term_freq) for occur in index.get_occurrence_list(term)], expected)
+            self.assertEqual(index.document_count_with_term(term), len(expected))
+        dic_postings = {term:[occur.doc_id for occur in lst_occur] for term, lst_occur in index.iter_postings()}
+        self.assertEqual(len(dic_postings), len(self.hash_index.vocabulary))
+        self.assertListEqual(intersect_cursors([index.postings_cursor("casa"), index.postings_cursor("termo3")]),
+                             dic_postings["termo3"])
+
+    def test_codecs(self):
+        for codec_name in POSTINGS_CODECS:
+            index = self.create_index(FileIndex(tmp_occurrences_limit_bytes=1000*FileIndex.TMP_OCCURRENCE_BYTES,
+                                                postings_codec=codec_name))
+            self.assertEqual(index.compressed_file, index.str_idx_file_name)
+            self.check_index(index)
+            index.open_reader()
+            self.check_index(index)
+            index.close_reader()
+
+            #indexação após o finish_indexing
+            index.index("casa", 1000, 3)
+            index.finish_indexing()
+            self.assertEqual(index.document_count_with_term("casa"), 601)
+            self.assertEqual(index.get_occurrence_list("casa")[-1].doc_id, 1000)
+
+            write_index(index, CompressedFileIndexTest.PATH)
+            idx_lido = read_index(CompressedFileIndexTest.PATH)
+            self.assertEqual(idx_lido.postings_codec, codec_name)
+            self.assertListEqual([occur.doc_id for occur in idx_lido.get_occurrence_list("termo5")],
+                                 [occur.doc_id for occur in index.get_occurrence_list("termo5")])
+            os.remove(index.str_idx_file_name)
+
+    def test_single_run(self):
+        index = self.create_index(FileIndex(postings_codec="vbyte"))
+        self.check_index(index)
+        self.assertLess(os.path.getsize(index.str_idx_file_name), 601*9*RECORD_SIZE//3)
+        os.remove(index.str_idx_file_name)
+
+    def test_unknown_codec(self):
+        with self.assertRaises(ValueError):
+            FileIndex(postings_codec="zip")
+
+
+if __name__ == "__main__":
+    unittest.main()
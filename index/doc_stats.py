@@ -0,0 +1,202 @@
+import math
+import os
+import numpy as np
+from index.postings import postings_columns
+
+DOC_STATS_FILE = "doc_stats.npy"
+DOC_ORDINALS_FILE = "doc_ordinals.npy"
+
+#registro de cada documento, na posição do seu ordinal (ordem crescente de doc_id)
+DOC_STATS_DTYPE = np.dtype([("doc_id", "<u4"), ("length", "<u4"), ("norm", "<f8"), ("unique_terms", "<u4")],
+                           align=True)
+
+
+class DocumentStatsTable:
+    """
+    Estatísticas por documento calculadas ao final da indexação: norma tf-idf, tamanho (em tokens: soma dos tf)
+    e quantidade de termos distintos. Os registros (DOC_STATS_DTYPE) ficam em um array denso indexado pelo ordinal
+    do documento; o mapa ordinals (doc_id -> ordinal, -1 caso o documento não exista) permite obter a norma de
+    um documento com um único acesso ao array. Caso os doc_ids sejam muito esparsos, o mapa não é criado e o
+    ordinal é obtido por busca binária.
+    Os arrays são gravados no formato .npy (ver save) e podem ser lidos mapeados em memória (ver load)
+    """
+    #o mapa denso é criado apenas se tiver no máximo ORDINALS_MAX_RATIO posições por documento
+    ORDINALS_MAX_RATIO = 16
+    #quantidade de ocorrências acumuladas antes de somá-las nas estatísticas
+    ACCUMULATOR_FLUSH_SIZE = 1000000
+
+    def __init__(self, records:np.ndarray, ordinals:np.ndarray=None):
+        self.records = records
+        self.ordinals = ordinals
+
+    @property
+    def doc_ids(self) -> np.ndarray:
+        return self.records["doc_id"]
+
+    @property
+    def norms(self) -> np.ndarray:
+        return self.records["norm"]
+
+    @property
+    def lengths(self) -> np.ndarray:
+        return self.records["length"]
+
+    @property
+    def unique_terms(self) -> np.ndarray:
+        return self.records["unique_terms"]
+
+    def __len__(self):
+        return len(self.records)
+
+    @staticmethod
+    def from_columns(doc_ids:np.ndarray, norms:np.ndarray, lengths:np.ndarray=None,
+                     unique_terms:np.ndarray=None) -> "DocumentStatsTable":
+        """
+        Tabela com as colunas informadas (os tamanhos e termos distintos não informados ficam zerados)
+        """
+        doc_ids = np.asarray(doc_ids, dtype=np.int64)
+        order = np.argsort(doc_ids, kind="stable")
+        records = np.zeros(len(doc_ids), dtype=DOC_STATS_DTYPE)
+        records["doc_id"] = doc_ids[order]
+        records["norm"] = np.asarray(norms, dtype=np.float64)[order]
+        if lengths is not None:
+            records["length"] = np.asarray(lengths)[order]
+        if unique_terms is not None:
+            records["unique_terms"] = np.asarray(unique_terms)[order]
+        return DocumentStatsTable(records, DocumentStatsTable.build_ordinals(records["doc_id"]))
+
+    @staticmethod
+    def build_ordinals(doc_ids:np.ndarray) -> np.ndarray:
+        if len(doc_ids) == 0:
+            return np.zeros(0, dtype=np.int32)
+        size = int(doc_ids[-1])+1
+        if size > DocumentStatsTable.ORDINALS_MAX_RATIO*len(doc_ids)+1024:
+            return None
+        ordinals = np.full(size, -1, dtype=np.int32)
+        ordinals[np.asarray(doc_ids, dtype=np.int64)] = np.arange(len(doc_ids), dtype=np.int32)
+        return ordinals
+
+    @staticmethod
+    def from_index(index) -> "DocumentStatsTable":
+        """
+        Estatísticas dos documentos do índice, obtidas em uma única passada pelas listas de ocorrências
+        de cada termo: o tf-idf de cada ocorrência é acumulado na posição (ordinal) do seu documento
+        """
+        doc_count = index.document_count
+        records = np.zeros(doc_count, dtype=DOC_STATS_DTYPE)
+        records["doc_id"] = sorted(index.set_documents)
+        table = DocumentStatsTable(records, DocumentStatsTable.build_ordinals(records["doc_id"]))
+
+        norm_sq = np.zeros(doc_count, dtype=np.float64)
+        lengths = np.zeros(doc_count, dtype=np.float64)
+        unique_terms = np.zeros(doc_count, dtype=np.int64)
+        arr_ordinals, arr_term_freqs, arr_squared_weights = [], [], []
+        num_acumulados = 0
+        for _, occurrences in index.iter_postings():
+            num_docs_with_term = len(occurrences)
+            if num_docs_with_term == 0:
+                continue
+            doc_ids, term_freqs = postings_columns(occurrences)
+            #ocorrências de documentos fora de set_documents são desconsideradas
+            ordinals, found = table.ordinals_of(doc_ids)
+            term_freqs = term_freqs[found]
+            if len(term_freqs) == 0:
+                continue
+            weights = (1 + np.log2(term_freqs)) * math.log2(doc_count/num_docs_with_term)
+            arr_ordinals.append(ordinals[found])
+            arr_term_freqs.append(term_freqs)
+            arr_squared_weights.append(np.square(weights))
+            num_acumulados += num_docs_with_term
+            if num_acumulados >= DocumentStatsTable.ACCUMULATOR_FLUSH_SIZE:
+                table.accumulate(arr_ordinals, arr_term_freqs, arr_squared_weights, norm_sq, lengths, unique_terms)
+                arr_ordinals, arr_term_freqs, arr_squared_weights = [], [], []
+                num_acumulados = 0
+        table.accumulate(arr_ordinals, arr_term_freqs, arr_squared_weights, norm_sq, lengths, unique_terms)
+
+        records["norm"] = np.sqrt(norm_sq)
+        records["length"] = lengths
+        records["unique_terms"] = unique_terms
+        return table
+
+    @staticmethod
+    def accumulate(arr_ordinals, arr_term_freqs, arr_squared_weights, norm_sq:np.ndarray, lengths:np.ndarray,
+                   unique_terms:np.ndarray):
+        #soma as ocorrências acumuladas nas estatísticas de cada documento
+        if not arr_ordinals:
+            return
+        ordinals = np.concatenate(arr_ordinals)
+        norm_sq += np.bincount(ordinals, weights=np.concatenate(arr_squared_weights), minlength=len(norm_sq))
+        lengths += np.bincount(ordinals, weights=np.concatenate(arr_term_freqs), minlength=len(lengths))
+        unique_terms += np.bincount(ordinals, minlength=len(unique_terms))
+
+    def ordinals_of(self, doc_ids:np.ndarray) -> (np.ndarray, np.ndarray):
+        """
+        Retorna os ordinais dos documentos doc_ids e uma máscara indicando quais deles existem na tabela
+        """
+        doc_ids = np.asarray(doc_ids, dtype=np.int64)
+        if self.ordinals is not None:
+            in_range = (doc_ids >= 0) & (doc_ids < len(self.ordinals))
+            ordinals = np.full(len(doc_ids), -1, dtype=np.int64)
+            ordinals[in_range] = self.ordinals[doc_ids[in_range]]
+            found = ordinals >= 0
+            ordinals[~found] = 0
+            return ordinals, found
+        if len(self.records) == 0:
+            return np.zeros(len(doc_ids), dtype=np.int64), np.zeros(len(doc_ids), dtype=bool)
+        ordinals = np.minimum(np.searchsorted(self.doc_ids, doc_ids), len(self.records)-1)
+        return ordinals, self.doc_ids[ordinals] == doc_ids
+
+    def ordinal(self, doc_id:int) -> int:
+        #ordinal do documento ou -1 caso ele não exista
+        if self.ordinals is not None:
+            return int(self.ordinals[doc_id]) if 0 <= doc_id < len(self.ordinals) else -1
+        ordinals, found = self.ordinals_of(np.array([doc_id]))
+        return int(ordinals[0]) if found[0] else -1
+
+    def norms_of(self, doc_ids:np.ndarray) -> (np.ndarray, np.ndarray):
+        """
+        Retorna as normas dos documentos doc_ids e uma máscara indicando quais deles possuem norma
+        """
+        ordinals, found = self.ordinals_of(doc_ids)
+        norms = np.zeros(len(ordinals), dtype=np.float64)
+        norms[found] = self.norms[ordinals[found]]
+        return norms, found
+
+    def norm(self, doc_id:int) -> float:
+        #norma do documento ou None caso ele não exista
+        ordinal = self.ordinal(doc_id)
+        return float(self.records[ordinal]["norm"]) if ordinal >= 0 else None
+
+    def save(self, str_path:str):
+        """
+        Grava os arrays no diretório str_path (DOC_STATS_FILE e, caso exista o mapa denso, DOC_ORDINALS_FILE)
+        """
+        self.save_array(os.path.join(str_path, DOC_STATS_FILE), self.records)
+        if self.ordinals is not None:
+            self.save_array(os.path.join(str_path, DOC_ORDINALS_FILE), self.ordinals)
+
+    @staticmethod
+    def save_array(str_file:str, array:np.ndarray):
+        with open(str_file, "wb") as out_file:
+            np.save(out_file, np.ascontiguousarray(array))
+            out_file.flush()
+            os.fsync(out_file.fileno())
+
+    def copy(self) -> "DocumentStatsTable":
+        #arrays em memória (ex.: para serializar uma tabela mapeada em memória)
+        return DocumentStatsTable(np.array(self.records),
+                                  None if self.ordinals is None else np.array(self.ordinals))
+
+    @staticmethod
+    def exists(str_path:str) -> bool:
+        return os.path.exists(os.path.join(str_path, DOC_STATS_FILE))
+
+    @staticmethod
+    def load(str_path:str, mmap_mode:str="r") -> "DocumentStatsTable":
+        """
+        Lê a tabela gravada por save. Por padrão, os arrays são mapeados em memória (somente leitura)
+        """
+        records = np.load(os.path.join(str_path, DOC_STATS_FILE), mmap_mode=mmap_mode)
+        str_ordinals = os.path.join(str_path, DOC_ORDINALS_FILE)
+        ordinals = np.load(str_ordinals, mmap_mode=mmap_mode) if os.path.exists(str_ordinals) else None
+        return DocumentStatsTable(records, ordinals)
@@ -0,0 +1,90 @@
+from index.doc_stats import *
+from index.structure import HashIndex, FileIndex
+import numpy as np
+import unittest
+import shutil
+import math
+import os
+
+
+class DocumentStatsTableTest(unittest.TestCase):
+    PATH = "doc_stats_test"
+
+    def tearDown(self):
+        shutil.rmtree(DocumentStatsTableTest.PATH, ignore_errors=True)
+
+    def index_docs(self, index, lst_doc_ids):
+        for doc_id in lst_doc_ids:
+            for term in range(doc_id%5, 20, 4):
+                index.index(f"termo{term}", doc_id, doc_id%3+1)
+        index.finish_indexing()
+        return index
+
+    def check_stats(self, table:DocumentStatsTable, index):
+        dic_norm_sq, dic_lengths, dic_unique = {}, {}, {}
+        for term in index.vocabulary:
+            idf = math.log2(index.document_count/index.document_count_with_term(term))
+            for occur in index.get_occurrence_list(term):
+                weight = (1+math.log2(occur.term_freq))*idf
+                dic_norm_sq[occur.doc_id] = dic_norm_sq.get(occur.doc_id, 0)+weight*weight
+                dic_lengths[occur.doc_id] = dic_lengths.get(occur.doc_id, 0)+occur.term_freq
+                dic_unique[occur.doc_id] = dic_unique.get(occur.doc_id, 0)+1
+        self.assertListEqual(table.doc_ids.tolist(), sorted(dic_norm_sq))
+        for doc_id in dic_norm_sq:
+            record = table.records[table.ordinal(doc_id)]
+            self.assertAlmostEqual(table.norm(doc_id), math.sqrt(dic_norm_sq[doc_id]), places=7)
+            self.assertEqual(record["length"], dic_lengths[doc_id])
+            self.assertEqual(record["unique_terms"], dic_unique[doc_id])
+
+    def test_finish_indexing(self):
+        for index in [HashIndex(), FileIndex(), FileIndex(postings_codec="vbyte")]:
+            index = self.index_docs(index, range(1, 41))
+            self.assertEqual(len(index.doc_stats), 40)
+            self.check_stats(index.doc_stats, index)
+            #novos documentos: as estatísticas são recalculadas no próximo finish_indexing
+            index.index("termo0", 50, 1)
+            self.assertIsNone(index.doc_stats)
+            index.finish_indexing()
+            self.check_stats(index.doc_stats, index)
+            if isinstance(index, FileIndex):
+                index.close_reader()
+                for str_file in index.lst_run_files:
+                    os.remove(str_file)
+
+    def test_ordinals(self):
+        table = DocumentStatsTable.from_columns([7, 2, 30], [0.7, 0.2, 3.0], [7, 2, 30], [1, 1, 3])
+        self.assertListEqual(table.doc_ids.tolist(), [2, 7, 30])
+        self.assertListEqual(table.lengths.tolist(), [2, 7, 30])
+        self.assertEqual(table.ordinal(30), 2)
+        self.assertEqual(table.ordinal(3), -1)
+        self.assertEqual(table.ordinal(1000), -1)
+        self.assertIsNone(table.norm(3))
+        norms, found = table.norms_of(np.array([30, 3, 2, 1000]))
+        self.assertListEqual(found.tolist(), [True, False, True, False])
+        self.assertListEqual(norms[found].tolist(), [3.0, 0.2])
+
+        #doc_ids esparsos: sem mapa denso (busca binária)
+        sparse = DocumentStatsTable.from_columns([10**9, 5], [1.0, 0.5])
+        self.assertIsNone(sparse.ordinals)
+        self.assertEqual(sparse.ordinal(10**9), 1)
+        self.assertEqual(sparse.norm(5), 0.5)
+        self.assertEqual(sparse.ordinal(6), -1)
+
+    def test_save_load(self):
+        os.makedirs(DocumentStatsTableTest.PATH)
+        for table in [DocumentStatsTable.from_columns([7, 2, 30], [0.7, 0.2, 3.0], [7, 2, 30], [1, 1, 3]),
+                      DocumentStatsTable.from_columns([10**9, 5], [1.0, 0.5]),
+                      DocumentStatsTable.from_columns([], [])]:
+            shutil.rmtree(DocumentStatsTableTest.PATH)
+            os.makedirs(DocumentStatsTableTest.PATH)
+            table.save(DocumentStatsTableTest.PATH)
+            loaded = DocumentStatsTable.load(DocumentStatsTableTest.PATH)
+            self.assertIsInstance(loaded.records, np.memmap)
+            self.assertListEqual(loaded.records.tolist(), table.records.tolist())
+            self.assertEqual(loaded.ordinals is None, table.ordinals is None)
+            for doc_id in table.doc_ids.tolist():
+                self.assertEqual(loaded.norm(doc_id), table.norm(doc_id))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,5 +1,7 @@
 from .structure import *
+from .manifest import MANIFEST_FILE
 import unittest
+import shutil
 from .index_structure_test import StructureTest
 from .performance_test import PerformanceTest
 
@@ -7,6 +9,12 @@ from .performance_test import PerformanceTest
 
 class FileIndexTest(unittest.TestCase):
 
+    def add_tmp_occurrences(self, obj_index, lst_occurrences):
+        #adiciona as ocorrências na lista temporária (sem chegar ao limite que a grava em um run)
+        for occur in lst_occurrences:
+            obj_index.add_index_occur(None, occur.doc_id, occur.term_id, occur.term_freq)
+        return set(lst_occurrences)
+
     def check_idx_file(self, obj_index, set_occurrences):
         #verifica a ordem das ocorrencias
         list_size = obj_index.idx_tmp_occur_last_element - obj_index.idx_tmp_occur_first_element + 1
@@ -23,7 +31,7 @@ class FileIndexTest(unittest.TestCase):
 
         sobra_arquivo = set_file_occurrences-set_occurrences
         sobra_lista = set_occurrences-set_file_occurrences
-        self.assertEqual(len(sobra_arquivo),0, f"Existem ocorrências no arquivo que não estavam na 'lst_occurrences_tmp': {sobra_arquivo} ")
+        self.assertEqual(len(sobra_arquivo),0, f"Existem ocorrências no arquivo que não estavam na lista temporária: {sobra_arquivo} ")
         self.assertEqual(len(sobra_lista),0, f"As seguintes ocorrências não foram inseridas no arquivo de indice: {sobra_lista} ")
 
     def test_next_from_file(self):
@@ -73,49 +81,93 @@ class FileIndexTest(unittest.TestCase):
 
         #testa a primeira vez (adicionando tudo na primeira vez)
         self.index = FileIndex()
-        set_occurrences = []
-        self.index.lst_occurrences_tmp = [TermOccurrence(2,4,5),
+        set_occurrences = self.add_tmp_occurrences(self.index, [TermOccurrence(2,4,5),
                                         TermOccurrence(2,2,1),
                                         TermOccurrence(1,2,1),
-                                        TermOccurrence(1,1,3),
-                                        None,
-                                        None,
-                                        None,
-                                        None]
-        set_occurrences = set(self.index.lst_occurrences_tmp) - {None}
-        self.index.idx_tmp_occur_last_element  = 3
+                                        TermOccurrence(1,1,3)])
         self.index.save_tmp_occurrences()
         self.check_idx_file(self.index, set_occurrences)
         print("Primeira execução (criação inicial do indice) [ok]")
 
-        #adicina alguns
-        self.index.lst_occurrences_tmp = [TermOccurrence(1,3,3),
-                                        TermOccurrence(2,3,4)]
-        self.index.idx_tmp_occur_last_element  = 1
-        set_occurrences = set_occurrences | set(self.index.lst_occurrences_tmp)
+        #adicina alguns: cada chamada grava um novo run, apenas com as ocorrências da lista
+        set_run = self.add_tmp_occurrences(self.index, [TermOccurrence(1,3,3),
+                                        TermOccurrence(2,3,4)])
+        set_occurrences = set_occurrences | set_run
         self.index.save_tmp_occurrences()
-        self.check_idx_file(self.index, set_occurrences)
+        self.check_idx_file(self.index, set_run)
         print("Inserção de alguns itens - teste 1/2 [ok]")
 
 
 
 
         #adiciona mais alguns
-        self.index.lst_occurrences_tmp = [TermOccurrence(2,1,2),
+        set_run = self.add_tmp_occurrences(self.index, [TermOccurrence(2,1,2),
                                         TermOccurrence(3,2,2),
-                                        TermOccurrence(3,1,1)]
-        self.index.idx_tmp_occur_last_element  = 2
+                                        TermOccurrence(3,1,1)])
         #checa ordenação do arquivo e verifica todas as ocorrencias existem
-        set_occurrences = set_occurrences|set(self.index.lst_occurrences_tmp)
+        set_occurrences = set_occurrences|set_run
         self.index.save_tmp_occurrences()
-        self.check_idx_file(self.index, set_occurrences)
+        self.check_idx_file(self.index, set_run)
         print("Inserção de alguns itens - teste 2/2 [ok]")
 
+        self.assertEqual(len(self.index.lst_run_files), 3, "Cada chamada ao save_tmp_occurrences deveria gerar um run")
+        #intercala os runs
+        self.index.merge_runs()
+        self.check_idx_file(self.index, set_occurrences)
+        self.assertListEqual(self.index.lst_run_files, [self.index.str_idx_file_name])
+        print("Intercalação dos runs [ok]")
+
+    def test_merge_runs_multi_level(self):
+        self.index = FileIndex()
+        self.index.merge_fan_in = 2
+        set_occurrences = set()
+        for run in range(5):
+            set_occurrences = set_occurrences | self.add_tmp_occurrences(self.index, [TermOccurrence(doc_id,term_id,run+1)
+                                                                        for doc_id in range(run,20,5) for term_id in range(3)])
+            self.index.save_tmp_occurrences()
+        lst_runs = list(self.index.lst_run_files)
+        self.index.merge_runs()
+        self.check_idx_file(self.index, set_occurrences)
+        for str_run in lst_runs:
+            self.assertFalse(os.path.exists(str_run), f"O run {str_run} deveria ter sido excluído após o merge")
+        os.remove(self.index.str_idx_file_name)
+
+    def test_tmp_occurrences_limit_bytes(self):
+        self.index = FileIndex(tmp_occurrences_limit_bytes=5*FileIndex.TMP_OCCURRENCE_BYTES)
+        self.assertEqual(self.index.tmp_occurrences_limit, 5)
+        set_occurrences = self.add_tmp_occurrences(self.index, [TermOccurrence(doc_id,doc_id%2,1) for doc_id in range(4)])
+        self.assertEqual(len(self.index.lst_run_files), 0)
+        #ao atingir o limite, a lista é gravada em um run
+        set_occurrences = set_occurrences | self.add_tmp_occurrences(self.index, [TermOccurrence(4,0,1)])
+        self.assertEqual(len(self.index.lst_run_files), 1)
+        self.check_idx_file(self.index, set_occurrences)
+        os.remove(self.index.str_idx_file_name)
+
+    def test_background_flush(self):
+        self.index = FileIndex(tmp_occurrences_limit_bytes=4*FileIndex.TMP_OCCURRENCE_BYTES, background_flush=True)
+        lst_occurrences = [TermOccurrence(doc_id,term_id,doc_id+term_id+1) for doc_id in range(10) for term_id in range(3)]
+        set_occurrences = self.add_tmp_occurrences(self.index, lst_occurrences)
+        self.assertLessEqual(len(self.index.lst_run_files), 8)
+        self.index.save_tmp_occurrences()
+        self.index.wait_flush()
+        self.index.merge_runs()
+        self.check_idx_file(self.index, set_occurrences)
+        os.remove(self.index.str_idx_file_name)
+
+    def test_background_flush_error(self):
+        self.index = FileIndex(tmp_occurrences_limit_bytes=2*FileIndex.TMP_OCCURRENCE_BYTES, background_flush=True)
+        def write_run(str_file_name, term_ids, doc_ids, term_freqs):
+            raise IOError("disco cheio")
+        self.index.write_run = write_run
+        self.add_tmp_occurrences(self.index, [TermOccurrence(1,1,1),TermOccurrence(2,1,1)])
+        #o erro da gravação em segundo plano deve ser lançado na thread que indexa
+        with self.assertRaises(IOError):
+            self.index.finish_indexing()
+        self.assertIsNone(self.index.flush_executor)
+
     def test_finish_indexing(self):
         self.index = FileIndex()
-        self.index.idx_tmp_occur_last_element  = 8
-        self.index.idx_tmp_occur_first_element = 0
-        self.index.lst_occurrences_tmp = [
+        lst_occurrences = [
                                         TermOccurrence(1,1,3),
                                         TermOccurrence(1,2,1),
                                         TermOccurrence(1,3,3),
@@ -124,21 +176,18 @@ class FileIndexTest(unittest.TestCase):
                                         TermOccurrence(2,2,1),
                                         TermOccurrence(2,4,5),
                                         TermOccurrence(3,1,1),
-                                        TermOccurrence(3,2,2),
-                                        None,
-                                        None,
-                                        None,
-                                        None
+                                        TermOccurrence(3,2,2)
                                         ]
+        self.add_tmp_occurrences(self.index, lst_occurrences)
 
 
         print("Lista de ocorrências a serem testadas:")
-        for i,occ in enumerate(self.index.lst_occurrences_tmp):
+        for i,occ in enumerate(lst_occurrences):
             print(f"{occ}")
         x = 100
         int_size_of_occur = None
         with open("teste_file.idx","wb") as file:
-            self.index.lst_occurrences_tmp[0].write(file)
+            lst_occurrences[0].write(file)
             int_size_of_occur = file.tell()
 
         print(f"Tamanho de cada ocorrência: {int_size_of_occur} bytes")
@@ -168,6 +217,134 @@ class FileIndexTest(unittest.TestCase):
 
 
 
+class SpimiFileIndexTest(FileIndexTest):
+    def test_save_tmp_occurrences(self):
+        #bloco com documentos em ordem: listas gravadas sem ordenação
+        self.index = SpimiFileIndex()
+        set_occurrences = self.add_tmp_occurrences(self.index, [TermOccurrence(1,2,1),
+                                        TermOccurrence(1,1,3),
+                                        TermOccurrence(2,4,5),
+                                        TermOccurrence(2,2,1)])
+        self.assertEqual(self.index.get_tmp_occur_size(), 4)
+        self.assertTrue(self.index.block_docs_in_order)
+        self.index.save_tmp_occurrences()
+        self.assertEqual(self.index.get_tmp_occur_size(), 0)
+        self.check_idx_file(self.index, set_occurrences)
+
+        #documento fora de ordem: o bloco é ordenado
+        set_run = self.add_tmp_occurrences(self.index, [TermOccurrence(5,3,3),
+                                        TermOccurrence(3,3,4),
+                                        TermOccurrence(4,1,1)])
+        self.assertFalse(self.index.block_docs_in_order)
+        self.index.save_tmp_occurrences()
+        self.check_idx_file(self.index, set_run)
+
+        self.index.merge_runs()
+        self.check_idx_file(self.index, set_occurrences|set_run)
+        os.remove(self.index.str_idx_file_name)
+
+    def test_same_as_file_index(self):
+        def build(index):
+            for doc_id in range(100):
+                for term in range(doc_id%7, 30, 3):
+                    index.index(f"termo{term}", doc_id, doc_id%5+1)
+            index.finish_indexing()
+            #os runs dos dois indices usam os mesmos nomes de arquivo: as listas são lidas antes de criar o próximo
+            dic_postings = {term:index.get_occurrence_list(term) for term in index.vocabulary}
+            os.remove(index.str_idx_file_name)
+            return dic_postings
+
+        dic_expected = build(FileIndex(tmp_occurrences_limit_bytes=50*FileIndex.TMP_OCCURRENCE_BYTES))
+        for background_flush in [False, True]:
+            dic_postings = build(SpimiFileIndex(tmp_occurrences_limit_bytes=50*FileIndex.TMP_OCCURRENCE_BYTES,
+                                                background_flush=background_flush))
+            self.assertDictEqual(dic_postings, dic_expected)
+
+class ResumableFileIndexTest(unittest.TestCase):
+    WORK_DIR = "resume_test_build"
+    index_class = FileIndex
+
+    def tearDown(self):
+        if os.path.isdir(self.WORK_DIR):
+            shutil.rmtree(self.WORK_DIR)
+
+    def create_index(self, background_flush:bool=False) -> FileIndex:
+        return self.index_class(tmp_occurrences_limit_bytes=50*FileIndex.TMP_OCCURRENCE_BYTES,
+                                background_flush=background_flush, work_dir=self.WORK_DIR)
+
+    def index_docs(self, index, lst_doc_ids, int_big_doc=None):
+        #documentos já indexados são ignorados, como no HTMLIndexer
+        for doc_id in lst_doc_ids:
+            if doc_id in index.set_documents:
+                continue
+            int_max_term = 200 if doc_id == int_big_doc else 30
+            for term in range(doc_id%7, int_max_term, 3):
+                index.index(f"termo{term}", doc_id, doc_id%5+1)
+
+    def check_same(self, index, expected):
+        self.assertEqual(index.document_count, expected.document_count)
+        self.assertCountEqual(index.vocabulary, expected.vocabulary)
+        for term in expected.vocabulary:
+            self.assertListEqual([(occur.doc_id, occur.term_freq) for occur in index.get_occurrence_list(term)],
+                                 [(occur.doc_id, occur.term_freq) for occur in expected.get_occurrence_list(term)])
+
+    def check_resumed(self, background_flush:bool=False, int_big_doc=None):
+        expected = HashIndex()
+        self.index_docs(expected, range(100), int_big_doc)
+
+        index = self.create_index(background_flush)
+        self.index_docs(index, range(60), int_big_doc)
+        index.wait_flush()
+        #simula uma interrupção: a lista temporária é perdida e um run ficou incompleto
+        self.assertTrue(os.path.exists(os.path.join(self.WORK_DIR, MANIFEST_FILE)))
+        str_partial_run = os.path.join(self.WORK_DIR, "occur_999.idx.tmp")
+        open(str_partial_run, "wb").close()
+
+        index = self.create_index(background_flush)
+        self.assertGreater(index.document_count, 0)
+        self.assertLess(index.document_count, 60)
+        self.assertLessEqual(index.set_documents, set(range(60)))
+        self.assertFalse(os.path.exists(str_partial_run), "Arquivos não registrados no manifesto devem ser excluídos")
+
+        self.index_docs(index, range(100), int_big_doc)
+        index.finish_indexing()
+        self.check_same(index, expected)
+        #indexação concluída: resta apenas o arquivo final
+        self.assertListEqual(os.listdir(self.WORK_DIR), [os.path.basename(index.str_idx_file_name)])
+        index.close_reader()
+        shutil.rmtree(self.WORK_DIR)
+
+    def test_resume(self):
+        for background_flush in [False, True]:
+            self.check_resumed(background_flush)
+
+    def test_document_larger_than_buffer(self):
+        #o documento 30 ocupa mais que a lista temporária: o run em que ele termina não é registrado no manifesto
+        self.check_resumed(int_big_doc=30)
+
+    def test_merge_checkpoint(self):
+        index = self.create_index()
+        index.merge_fan_in = 2
+        self.index_docs(index, range(60))
+        #os runs intercalados (merge em vários níveis) são registrados no manifesto
+        index.finish_document()
+        index.save_tmp_occurrences()
+        lst_runs = list(index.lst_run_files)
+        index.replace_runs(lst_runs[:2], index.merge_run_group(lst_runs[:2]))
+
+        index = self.create_index()
+        self.assertEqual(index.document_count, 60)
+        self.assertEqual(len(index.lst_run_files), len(lst_runs)-1)
+        index.finish_indexing()
+        expected = HashIndex()
+        self.index_docs(expected, range(60))
+        self.check_same(index, expected)
+        index.close_reader()
+
+
+class ResumableSpimiFileIndexTest(ResumableFileIndexTest):
+    index_class = SpimiFileIndex
+
 
 if __name__ == "__main__":
     unittest.main()
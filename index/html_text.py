@@ -0,0 +1,66 @@
+from html.parser import HTMLParser
+from bs4 import BeautifulSoup
+try:
+    from lxml import etree
+    from lxml import html as lxml_html
+except ImportError:
+    etree = None
+    lxml_html = None
+
+#tags cujo conteúdo não é texto da página
+SKIPPED_TAGS = frozenset(["script", "style", "noscript", "template"])
+
+
+class HTMLTextExtractor(HTMLParser):
+    """
+    Extração do texto de um documento HTML em uma única passada (sem criar a árvore do documento).
+    O conteúdo das tags SKIPPED_TAGS é descartado
+    """
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.lst_text = []
+        self.skip_depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in SKIPPED_TAGS:
+            self.skip_depth += 1
+
+    def handle_startendtag(self, tag, attrs):
+        #ex.: <script src="..."/> não possui conteúdo
+        pass
+
+    def handle_endtag(self, tag):
+        if tag in SKIPPED_TAGS and self.skip_depth > 0:
+            self.skip_depth -= 1
+
+    def handle_data(self, data):
+        if self.skip_depth == 0:
+            self.lst_text.append(data)
+
+    def text(self, html_doc: str) -> str:
+        self.feed(html_doc)
+        self.close()
+        return "".join(self.lst_text)
+
+
+def bs4_text(html_doc: str) -> str:
+    return BeautifulSoup(html_doc, 'html.parser').get_text()
+
+
+def html_parser_text(html_doc: str) -> str:
+    return HTMLTextExtractor().text(html_doc)
+
+
+def lxml_text(html_doc: str) -> str:
+    if not html_doc.strip():
+        return ""
+    root = lxml_html.document_fromstring(html_doc)
+    #o texto após a tag (tail) é mantido
+    etree.strip_elements(root, *SKIPPED_TAGS, etree.Comment, with_tail=False)
+    return root.text_content()
+
+
+#extratores disponíveis (Cleaner.html_backend)
+HTML_BACKENDS = {"bs4": bs4_text, "html.parser": html_parser_text}
+if lxml_html is not None:
+    HTML_BACKENDS["lxml"] = lxml_text
@@ -0,0 +1,35 @@
+from index.html_text import *
+import unittest
+import os
+
+
+class HTMLTextTest(unittest.TestCase):
+    HTML = ("<!DOCTYPE html><html><head><title>Título</title><style>p {color: red}</style>"
+            "<script>var x = '<p>código</p>';</script></head>"
+            "<body><p>Casa &amp; <b>verde</b></p><!-- comentário --><script src='a.js'/>"
+            "<noscript>sem javascript</noscript><div>não é?</div></body></html>")
+
+    def test_html_parser(self):
+        self.assertEqual(html_parser_text(HTMLTextTest.HTML), "TítuloCasa & verdenão é?")
+        self.assertEqual(html_parser_text(""), "")
+        #tag de script sem fechamento: o restante do documento é descartado
+        self.assertEqual(html_parser_text("<p>a</p><script>b"), "a")
+
+    def test_lxml(self):
+        if "lxml" not in HTML_BACKENDS:
+            self.skipTest("lxml não instalado")
+        self.assertEqual(lxml_text(HTMLTextTest.HTML), "TítuloCasa & verdenão é?")
+        self.assertEqual(lxml_text(""), "")
+
+    def test_parity(self):
+        #mesmas palavras do BeautifulSoup nos documentos sem tags descartadas (apenas os espaços podem diferir)
+        for str_dir, _, lst_files in os.walk("index/docs_test"):
+            for str_file in lst_files:
+                with open(os.path.join(str_dir, str_file), encoding="utf-8") as file:
+                    html_doc = file.read()
+                for backend, extract in HTML_BACKENDS.items():
+                    self.assertListEqual(extract(html_doc).split(), bs4_text(html_doc).split(), backend)
+
+
+if __name__ == "__main__":
+    unittest.main()
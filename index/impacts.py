@@ -0,0 +1,135 @@
+import os
+import numpy as np
+from index.lexicon import FrozenLexicon
+from index.doc_stats import DocumentStatsTable
+from index.postings import postings_columns
+
+IDFS_FILE = "term_idfs.npy"
+IMPACT_OFFSETS_FILE = "impact_offsets.npy"
+IMPACT_DOC_IDS_FILE = "impact_doc_ids.npy"
+IMPACT_VALUES_FILE = "impact_values.npy"
+IMPACT_SCALES_FILE = "impact_scales.npy"
+
+
+class TermImpacts:
+    """
+    Valores por termo (indexados pelo term_id) calculados ao final da indexação:
+        idfs: idf (log2(N/df)) de cada termo
+        listas de impacto (opcionais): as ocorrências de cada termo ordenadas por impacto decrescente (e doc_id).
+        O impacto de uma ocorrência é o seu peso tf-idf dividido pela norma do documento, quantizado em
+        bits bits: as ocorrências do termo t estão nas posições offsets[t]:offsets[t+1] de doc_ids/impacts e
+        o impacto (aproximado) é impacts*scales[t]. Assim, o cosseno de uma consulta é apenas uma soma de produtos
+    """
+    def __init__(self, idfs:np.ndarray, offsets:np.ndarray=None, doc_ids:np.ndarray=None, impacts:np.ndarray=None,
+                 scales:np.ndarray=None):
+        self.idfs = idfs
+        self.offsets = offsets
+        self.doc_ids = doc_ids
+        self.impacts = impacts
+        self.scales = scales
+
+    @property
+    def has_impacts(self) -> bool:
+        return self.offsets is not None
+
+    @staticmethod
+    def term_columns(index) -> (np.ndarray, np.ndarray):
+        #term_ids e df dos termos do vocabulário
+        if isinstance(index.dic_index, FrozenLexicon):
+            return index.dic_index.term_ids.astype(np.int64), index.dic_index.doc_counts.astype(np.int64)
+        lst_terms = list(index.vocabulary)
+        return (np.array([index.get_term_id(term) for term in lst_terms], dtype=np.int64),
+                np.array([index.document_count_with_term(term) for term in lst_terms], dtype=np.int64))
+
+    @staticmethod
+    def from_index(index, doc_stats:DocumentStatsTable=None, bits:int=None, doc_count:int=None) -> "TermImpacts":
+        """
+        Tabela de idf do índice e, caso bits seja informado, as listas de impacto (uma passada pelas
+        listas de ocorrências, usando as normas de doc_stats). Caso doc_count não seja informado, é usado
+        o document_count do índice
+        """
+        doc_count = index.document_count if doc_count is None else doc_count
+        term_ids, doc_counts = TermImpacts.term_columns(index)
+        idfs = np.zeros(int(term_ids.max())+1 if len(term_ids) > 0 else 0, dtype=np.float64)
+        with_docs = doc_counts > 0
+        idfs[term_ids[with_docs]] = np.log2(doc_count/doc_counts[with_docs])
+        term_impacts = TermImpacts(idfs)
+        if bits is not None:
+            term_impacts.build_impacts(index, doc_stats, bits)
+        return term_impacts
+
+    def build_impacts(self, index, doc_stats:DocumentStatsTable, bits:int):
+        if not 1 <= bits <= 16:
+            raise ValueError(f"Quantidade de bits dos impactos não suportada: {bits} (de 1 a 16)")
+        max_impact = (1 << bits)-1
+        impact_dtype = np.uint8 if bits <= 8 else np.uint16
+        doc_counts = np.zeros(len(self.idfs), dtype=np.int64)
+        self.scales = np.zeros(len(self.idfs), dtype=np.float64)
+        dic_term_postings = {}
+        for term, occurrences in index.iter_postings():
+            doc_ids, term_freqs = postings_columns(occurrences)
+            norms, found = doc_stats.norms_of(doc_ids)
+            found &= norms > 0
+            if not found.any():
+                continue
+            term_id = index.get_term_id(term)
+            doc_ids = doc_ids[found]
+            weights = (1 + np.log2(term_freqs[found])) * self.idfs[term_id] / norms[found]
+            scale = weights.max()
+            if scale <= 0:
+                continue
+            impacts = np.rint(weights*(max_impact/scale)).astype(impact_dtype)
+            order = np.lexsort((doc_ids, -impacts.astype(np.int64)))
+            dic_term_postings[term_id] = (doc_ids[order].astype(np.uint32), impacts[order])
+            doc_counts[term_id] = len(doc_ids)
+            self.scales[term_id] = scale/max_impact
+
+        self.offsets = np.zeros(len(self.idfs)+1, dtype=np.int64)
+        np.cumsum(doc_counts, out=self.offsets[1:])
+        self.doc_ids = np.zeros(self.offsets[-1], dtype=np.uint32)
+        self.impacts = np.zeros(self.offsets[-1], dtype=impact_dtype)
+        for term_id, (doc_ids, impacts) in dic_term_postings.items():
+            self.doc_ids[self.offsets[term_id]:self.offsets[term_id+1]] = doc_ids
+            self.impacts[self.offsets[term_id]:self.offsets[term_id+1]] = impacts
+
+    def idf(self, term_id:int) -> float:
+        return float(self.idfs[term_id]) if 0 <= term_id < len(self.idfs) else 0.0
+
+    def impact_postings(self, term_id:int) -> (np.ndarray, np.ndarray):
+        """
+        Ocorrências do termo em ordem de impacto decrescente: (doc_ids, impactos) sem a quantização
+        """
+        if not 0 <= term_id < len(self.idfs):
+            return np.zeros(0, dtype=np.uint32), np.zeros(0, dtype=np.float64)
+        start, end = int(self.offsets[term_id]), int(self.offsets[term_id+1])
+        return self.doc_ids[start:end], self.impacts[start:end]*self.scales[term_id]
+
+    def arrays(self) -> dict:
+        dic_arrays = {IDFS_FILE:self.idfs}
+        if self.has_impacts:
+            dic_arrays.update({IMPACT_OFFSETS_FILE:self.offsets, IMPACT_DOC_IDS_FILE:self.doc_ids,
+                               IMPACT_VALUES_FILE:self.impacts, IMPACT_SCALES_FILE:self.scales})
+        return dic_arrays
+
+    def save(self, str_path:str):
+        for str_file, array in self.arrays().items():
+            DocumentStatsTable.save_array(os.path.join(str_path, str_file), array)
+
+    @staticmethod
+    def exists(str_path:str) -> bool:
+        return os.path.exists(os.path.join(str_path, IDFS_FILE))
+
+    @staticmethod
+    def load(str_path:str, mmap_mode:str="r") -> "TermImpacts":
+        """
+        Lê os arrays gravados por save (por padrão, mapeados em memória)
+        """
+        def load_array(str_file):
+            str_file = os.path.join(str_path, str_file)
+            return np.load(str_file, mmap_mode=mmap_mode) if os.path.exists(str_file) else None
+        return TermImpacts(load_array(IDFS_FILE), load_array(IMPACT_OFFSETS_FILE), load_array(IMPACT_DOC_IDS_FILE),
+                           load_array(IMPACT_VALUES_FILE), load_array(IMPACT_SCALES_FILE))
+
+    def copy(self) -> "TermImpacts":
+        return TermImpacts(*[None if array is None else np.array(array)
+                             for array in [self.idfs, self.offsets, self.doc_ids, self.impacts, self.scales]])
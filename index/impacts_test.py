@@ -0,0 +1,73 @@
+from index.impacts import *
+from index.structure import HashIndex, FileIndex
+import numpy as np
+import unittest
+import shutil
+import math
+
+
+class TermImpactsTest(unittest.TestCase):
+    PATH = "impacts_test"
+
+    def tearDown(self):
+        shutil.rmtree(TermImpactsTest.PATH, ignore_errors=True)
+
+    def index_docs(self, index, impact_bits:int=None):
+        index.impact_bits = impact_bits
+        for doc_id in range(1, 31):
+            for term in range(doc_id%4, 15, 3):
+                index.index(f"termo{term}", doc_id, doc_id%5+1)
+        index.finish_indexing()
+        return index
+
+    def test_idfs(self):
+        index = self.index_docs(HashIndex())
+        term_impacts = index.term_impacts
+        self.assertFalse(term_impacts.has_impacts)
+        for term in index.vocabulary:
+            self.assertEqual(term_impacts.idf(index.get_term_id(term)),
+                             math.log2(index.document_count/index.document_count_with_term(term)))
+        self.assertEqual(term_impacts.idf(len(term_impacts.idfs)), 0.0)
+
+    def test_impacts(self):
+        for index in [HashIndex(), FileIndex(), FileIndex(postings_codec="packed")]:
+            index = self.index_docs(index, 8)
+            term_impacts = index.term_impacts
+            for term in index.vocabulary:
+                term_id = index.get_term_id(term)
+                doc_ids, impacts = term_impacts.impact_postings(term_id)
+                #ordem de impacto decrescente, desempatada pelo doc_id
+                self.assertListEqual(list(zip((-impacts).tolist(), doc_ids.tolist())),
+                                     sorted(zip((-impacts).tolist(), doc_ids.tolist())))
+                idf = term_impacts.idf(term_id)
+                dic_impacts = dict(zip(doc_ids.tolist(), impacts.tolist()))
+                for occur in index.get_occurrence_list(term):
+                    expected = (1+math.log2(occur.term_freq))*idf/index.doc_stats.norm(occur.doc_id)
+                    #erro de quantização: metade do passo (escala do termo)
+                    self.assertLessEqual(abs(dic_impacts[occur.doc_id]-expected),
+                                         term_impacts.scales[term_id]/2+1e-12)
+            if isinstance(index, FileIndex):
+                index.close_reader()
+                for str_file in index.lst_run_files:
+                    os.remove(str_file)
+
+    def test_save_load(self):
+        index = self.index_docs(HashIndex(), 12)
+        self.assertEqual(index.term_impacts.impacts.dtype, np.uint16)
+        os.makedirs(TermImpactsTest.PATH)
+        index.term_impacts.save(TermImpactsTest.PATH)
+        loaded = TermImpacts.load(TermImpactsTest.PATH)
+        self.assertTrue(loaded.has_impacts)
+        self.assertIsInstance(loaded.doc_ids, np.memmap)
+        for term_id in range(len(index.term_impacts.idfs)):
+            self.assertEqual(loaded.idf(term_id), index.term_impacts.idf(term_id))
+            for loaded_column, column in zip(loaded.impact_postings(term_id), index.term_impacts.impact_postings(term_id)):
+                self.assertListEqual(loaded_column.tolist(), column.tolist())
+
+    def test_invalid_bits(self):
+        with self.assertRaises(ValueError):
+            self.index_docs(HashIndex(), 17)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,6 +1,8 @@
 from index.structure import *
 
 import unittest
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
 
 class StructureTest(unittest.TestCase):
     def create_terms(self):
@@ -26,21 +28,35 @@ class StructureTest(unittest.TestCase):
         self.index = HashIndex()
         self.create_terms()
 
+    def tearDown(self):
+        #arquivos de ocorrências do FileIndex
+        if isinstance(self.index, FileIndex):
+            self.index.close_reader()
+            for str_file in self.index.lst_run_files:
+                if os.path.exists(str_file):
+                    os.remove(str_file)
+
     def test_read_write(self):
-        self.index.write("teste_idx.idx")
-        
-        idx_novo = Index.read("teste_idx.idx")
+        with tempfile.TemporaryDirectory() as str_dir:
+            str_idx = os.path.join(str_dir, "teste_idx.idx")
+            self.index.write(str_idx)
+
+            idx_novo = Index.read(str_idx)
 
-        #testa document count
-        self.assertEqual(3,idx_novo.document_count)
+            #testa document count
+            self.assertEqual(3,idx_novo.document_count)
 
-        #testa a lista de ocorrencias
-        self.occur_list_test(idx_novo)
+            #testa a lista de ocorrencias
+            self.occur_list_test(idx_novo)
 
 
     def test_document_count(self):
         self.assertEqual(3,self.index.document_count)
 
+    def test_vocabulary_order(self):
+        #o vocabulário do índice finalizado mantém a ordem de inserção dos termos
+        self.assertListEqual(list(self.index.vocabulary), ["casa","vermelho","verde"])
+
     def test_vocabulary(self):
         set_expected_vocab = {"casa","vermelho","verde"}
         set_vocab = self.index.vocabulary
@@ -73,10 +89,72 @@ class StructureTest(unittest.TestCase):
     def test_get_occurrence_list(self):
         self.occur_list_test(self.index)
 
+    def test_terms_with_prefix(self):
+        self.assertIsInstance(self.index.dic_index, FrozenLexicon)
+        self.assertListEqual(self.index.terms_with_prefix("ver"), ["verde","vermelho"])
+        self.assertListEqual(self.index.terms_with_prefix("casa"), ["casa"])
+        self.assertListEqual(self.index.terms_with_prefix("x"), [])
+
+class HashIndexPostingsTest(unittest.TestCase):
+    def setUp(self):
+        self.index = HashIndex()
+        StructureTest.create_terms(self)
+
+    def test_compact_postings(self):
+        #6 ocorrências: doc_id e frequencia com 4 bytes cada
+        self.assertEqual(self.index.postings_doc_ids.nbytes+self.index.postings_term_freqs.nbytes, 6*8)
+        self.assertListEqual(self.index.postings_offsets.tolist(), [0,2,5,6])
+        self.assertFalse(self.index.postings_doc_ids.flags.writeable, "Após o finish_indexing as ocorrências devem ser imutáveis")
+
+        lst_occur = self.index.get_occurrence_list("vermelho")
+        self.assertIsInstance(lst_occur, TermPostings)
+        self.assertEqual(lst_occur[1], TermOccurrence(2,self.index.get_term_id("vermelho"),1))
+        self.assertListEqual(lst_occur[-1:], [TermOccurrence(3,self.index.get_term_id("vermelho"),1)])
+
+    def test_index_after_finish(self):
+        self.index.index("verde",4,2)
+        self.index.finish_indexing()
+        self.assertEqual(2,self.index.document_count_with_term("verde"))
+        self.assertEqual(self.index.postings_offsets[-1], 7)
+
+    def test_read_legacy_pickle(self):
+        #indices antigos guardavam uma lista de TermOccurrence por termo
+        legacy_index = HashIndex()
+        legacy_index.dic_index = {"casa":[TermOccurrence(1,0,10),TermOccurrence(2,0,3)]}
+        legacy_index.set_documents = {1,2}
+        idx_novo = pickle.loads(pickle.dumps(legacy_index))
+        self.assertEqual(idx_novo.get_term_id("casa"), 0)
+        self.assertListEqual(list(idx_novo.get_occurrence_list("casa")), [TermOccurrence(1,0,10),TermOccurrence(2,0,3)])
+
 class FileStructureTest(StructureTest):
     def setUp(self):
         self.index = FileIndex()
         self.create_terms()
 
+class FileSpimiStructureTest(StructureTest):
+    def setUp(self):
+        self.index = SpimiFileIndex()
+        self.create_terms()
+
+class FileMmapStructureTest(StructureTest):
+    def setUp(self):
+        self.index = FileIndex()
+        self.create_terms()
+        self.index.open_reader()
+
+    def tearDown(self):
+        self.index.close_reader()
+        super().tearDown()
+
+    def test_concurrent_readers(self):
+        dic_esperado = {term:[(occur.doc_id,occur.term_freq) for occur in self.index.get_occurrence_list(term)]
+                        for term in self.index.vocabulary}
+        def read_all(_):
+            return {term:[(occur.doc_id,occur.term_freq) for occur in self.index.get_occurrence_list(term)]
+                    for term in self.index.vocabulary}
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            for dic_lido in executor.map(read_all, range(64)):
+                self.assertDictEqual(dic_lido, dic_esperado)
+
 if __name__ == "__main__":
     unittest.main()
@@ -1,25 +1,78 @@
 from nltk.stem.snowball import SnowballStemmer
-from bs4 import BeautifulSoup
 import string
 import html
 from nltk.tokenize import word_tokenize
 from nltk.tokenize import RegexpTokenizer
 from tqdm import tqdm
+from concurrent.futures import ProcessPoolExecutor
+from collections import deque, OrderedDict, Counter
+from itertools import islice, chain
+import unicodedata
 import index.structure as structure
+from index.html_text import HTML_BACKENDS
 import re
 import os
 
 
+class TermCache:
+    """
+    Cache (LRU) de no máximo max_size termos já normalizados: token -> termo (ou None, caso o token seja descartado)
+    """
+    #retornado pelo get caso o token não esteja no cache (None é o termo de um token descartado)
+    MISSING = object()
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.dic_terms = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.dic_terms)
+
+    def get(self, token: str):
+        #termo do token (MISSING caso não esteja no cache); o token passa a ser o usado mais recentemente
+        term = self.dic_terms.get(token, TermCache.MISSING)
+        if term is TermCache.MISSING:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.dic_terms.move_to_end(token)
+        return term
+
+    def put(self, token: str, term: str or None):
+        #caso o cache fique cheio, remove o token usado há mais tempo
+        self.dic_terms[token] = term
+        if len(self.dic_terms) > self.max_size:
+            self.dic_terms.popitem(last=False)
+
+
 class Cleaner:
+    #quantidade padrão de tokens em cada cache de termos normalizados
+    CACHE_SIZE = 100000
+    #tokenizador rápido: sequências de letras, dígitos e "_", com hífens ou apóstrofos internos (ex.: guarda-chuva)
+    TOKEN_REGEX = re.compile(r"\w+(?:[-'’]\w+)*")
+    NOT_WORD_REGEX = re.compile(r'^[^a-zA-Z]+$')
+
     def __init__(self, stop_words_file: str, language: str,
                  perform_stop_words_removal: bool, perform_accents_removal: bool,
-                 perform_stemming: bool):
+                 perform_stemming: bool, cache_size: int = None, fold_all_accents: bool = False,
+                 html_backend: str = "bs4"):
+        """
+        cache_size: quantidade máxima de tokens em cache no preprocess_text (0 desabilita o cache).
+        Caso não seja informada, é usado CACHE_SIZE
+        fold_all_accents: remove os diacríticos de todas as letras latinas (decomposição NFKD), não apenas
+        os acentos do português
+        html_backend: extrator do texto dos documentos HTML (ver index.html_text): "bs4", "html.parser"
+        ou "lxml" (caso o lxml esteja instalado)
+        """
+        if html_backend not in HTML_BACKENDS:
+            raise ValueError(f"Extrator de HTML não disponível: {html_backend} (disponíveis: {list(HTML_BACKENDS)})")
+        self.html_backend = html_backend
         self.set_stop_words = self.read_stop_words(stop_words_file)
 
         self.stemmer = SnowballStemmer(language)
-        in_table = "áéíóúâêôçãẽõü"
-        out_table = "aeiouaeocaeou"
-        self.accents_translation_table = {in_table[pos]:out_table[pos] for pos in range(len(in_table))}
+        self.accents_translation_table = self.accents_table(fold_all_accents)
         self.set_punctuation = set(string.punctuation)
 
         # flags
@@ -27,10 +80,51 @@ class Cleaner:
         self.perform_accents_removal = perform_accents_removal
         self.perform_stemming = perform_stemming
 
+        #um cache por combinação das flags (elas podem ser alteradas após a criação do Cleaner)
+        self.cache_size = Cleaner.CACHE_SIZE if cache_size is None else cache_size
+        self.dic_term_caches = {}
+
+    @staticmethod
+    def accents_table(fold_all_accents: bool) -> dict:
+        """
+        Tabela do str.translate que remove os acentos (minúsculos e maiúsculos)
+        """
+        in_table = "áéíóúâêôçãẽõü"
+        out_table = "aeiouaeocaeou"
+        dic_table = str.maketrans(in_table+in_table.upper(), out_table+out_table.upper())
+        if fold_all_accents:
+            #Latin-1, Latin Extended-A/B e Latin Extended Additional
+            for code in chain(range(0xC0, 0x250), range(0x1E00, 0x1F00)):
+                char = chr(code)
+                base = "".join(c for c in unicodedata.normalize("NFKD", char) if not unicodedata.combining(c))
+                if base and base != char:
+                    dic_table[code] = base
+        return dic_table
+
+    @property
+    def flags(self) -> tuple:
+        return (self.perform_stop_words_removal, self.perform_accents_removal, self.perform_stemming)
+
+    @property
+    def cache_hits(self) -> int:
+        return sum(cache.hits for cache in self.dic_term_caches.values())
+
+    @property
+    def cache_misses(self) -> int:
+        return sum(cache.misses for cache in self.dic_term_caches.values())
+
+    def clear_cache(self):
+        #necessário caso as stop words ou o stemmer sejam alterados
+        self.dic_term_caches = {}
+
+    def __getstate__(self):
+        #os caches não são serializados (ex.: Cleaner enviado aos processos do HTMLIndexer)
+        state = self.__dict__.copy()
+        state["dic_term_caches"] = {}
+        return state
+
     def html_to_plain_text(self, html_doc: str) -> str:
-        soup =  BeautifulSoup(html_doc, 'html.parser')
-        cleared_html = soup.get_text()
-        return cleared_html
+        return HTML_BACKENDS[self.html_backend](html_doc)
 
     @staticmethod
     def read_stop_words(str_file) -> set:
@@ -42,7 +136,13 @@ class Cleaner:
         return set_stop_words
 
     def is_not_word(self, term: str):
-        return bool(re.match(r'^[^a-zA-Z]+$', term))
+        return bool(Cleaner.NOT_WORD_REGEX.match(term))
+
+    def tokenize(self, text: str) -> list:
+        """
+        Tokenização rápida (alternativa ao word_tokenize): uma única busca de TOKEN_REGEX no texto inteiro
+        """
+        return Cleaner.TOKEN_REGEX.findall(text)
 
     def is_stop_word(self, term: str):
         return term.lower() in self.set_stop_words
@@ -51,18 +151,49 @@ class Cleaner:
         return self.stemmer.stem(term)
 
     def remove_accents(self, term: str) -> str:
-        return "".join([self.accents_translation_table.get(char, char) for char in term])
+        return term.translate(self.accents_translation_table)
 
     def preprocess_word(self, term: str) -> str or None:
         return self.remove_accents(term.lower())
 
-    def preprocess_text(self, text: str) -> str or None:
+    def fold_tokens(self, lst_tokens) -> list:
+        """
+        preprocess_word de todos os tokens de um documento com uma única chamada ao str.translate
+        (os tokens nunca possuem espaços ou quebras de linha)
+        """
+        return "\n".join(lst_tokens).lower().translate(self.accents_translation_table).split("\n")
+
+    def term_cache(self) -> TermCache or None:
+        #cache da combinação de flags atual (None caso o cache esteja desabilitado)
+        if self.cache_size <= 0:
+            return None
+        cache = self.dic_term_caches.get(self.flags)
+        if cache is None:
+            cache = self.dic_term_caches[self.flags] = TermCache(self.cache_size)
+        return cache
+
+    def cached_preprocess_text(self, text: str, folded_text: str = None) -> str or None:
+        """
+        preprocess_text consultando o cache da combinação de flags atual: os tokens mais frequentes (lei de Zipf)
+        são normalizados uma única vez
+        """
+        cache = self.term_cache()
+        if cache is None:
+            return self.preprocess_text(text, folded_text)
+        term = cache.get(text)
+        if term is TermCache.MISSING:
+            term = self.preprocess_text(text, folded_text)
+            cache.put(text, term)
+        return term
+
+    def preprocess_text(self, text: str, folded_text: str = None) -> str or None:
+        #folded_text: preprocess_word(text) já calculado (ver fold_tokens)
         if self.is_not_word(text):
             return None
         if self.perform_stop_words_removal and self.is_stop_word(text):
             return None
         if self.perform_accents_removal:
-            text = self.preprocess_word(text)
+            text = self.preprocess_word(text) if folded_text is None else folded_text
         if self.perform_stemming:
             text = self.word_stem(text)
 
@@ -75,54 +206,116 @@ class HTMLIndexer:
                       perform_accents_removal=True,
                       perform_stemming=True)
 
-    def __init__(self, index):
+    def __init__(self, index, num_workers:int=1, chunk_size:int=32, fast_tokenizer:bool=False):
+        """
+        fast_tokenizer: usa o Cleaner.tokenize no lugar do word_tokenize (nltk). Os termos podem diferir em alguns
+        casos (ex.: URLs e abreviações são separadas nos pontos)
+        num_workers: quantidade de processos que leem e processam os arquivos no index_text_dir.
+        Com mais de um, os arquivos são processados em paralelo (em blocos de chunk_size arquivos) e as contagens
+        de termos de cada documento são indexadas neste processo, na mesma ordem da indexação sequencial
+        """
         self.index = index
+        self.num_workers = num_workers
+        self.chunk_size = chunk_size
+        self.fast_tokenizer = fast_tokenizer
 
     def text_word_count(self, plain_text: str):
         dic_word_count = {}
-
-        for word in word_tokenize(plain_text):
-            word = self.cleaner.preprocess_text(word)
+        if self.fast_tokenizer:
+            lst_tokens = self.cleaner.tokenize(plain_text)
+        else:
+            lst_tokens = word_tokenize(plain_text)
+        #cada token distinto do documento é normalizado uma única vez e os acentos são removidos de todos eles
+        #de uma só vez
+        dic_token_freq = Counter(lst_tokens)
+        if self.cleaner.perform_accents_removal:
+            lst_folded = self.cleaner.fold_tokens(dic_token_freq)
+        else:
+            lst_folded = [None]*len(dic_token_freq)
+        for (token, token_freq), folded_token in zip(dic_token_freq.items(), lst_folded):
+            word = self.cleaner.cached_preprocess_text(token, folded_token)
             if word is not None:
-                dic_word_count[word] = dic_word_count.get(word, 0) + 1
+                dic_word_count[word] = dic_word_count.get(word, 0) + token_freq
         return dic_word_count
 
-    def index_text(self, doc_id: int, text_html: str):
+    def html_word_count(self, text_html: str):
         text = self.cleaner.html_to_plain_text(text_html)
-        dic_word_count = self.text_word_count(text)
+        return self.text_word_count(text)
+
+    def index_text(self, doc_id: int, text_html: str):
+        self.index_word_count(doc_id, self.html_word_count(text_html))
+
+    def index_word_count(self, doc_id: int, dic_word_count: dict):
         for term_key, term_freq in dic_word_count.items():
-            self.index.index(term_key, doc_id, term_freq)  
-        
+            self.index.index(term_key, doc_id, term_freq)
+
+    def html_files(self, path: str):
+        """
+        Arquivos .html de path (e dos seus subdiretórios), em ordem determinística (os.listdir não garante ordem).
+        Retorna tuplas (doc_id, arquivo)
+        """
+        for str_sub_dir in sorted(os.listdir(path)):
+            path_sub_dir = f"{path}/{str_sub_dir}"
+
+            if os.path.isfile(path_sub_dir):
+                if str_sub_dir.endswith(".html"):
+                    doc_id = int(os.path.splitext(str_sub_dir)[0])
+                    #documentos já indexados (ex.: indexação retomada do FileIndex)
+                    if doc_id not in self.index.set_documents:
+                        yield doc_id, path_sub_dir
+
+            if os.path.isdir(path_sub_dir):
+                yield from self.html_files(path_sub_dir)
 
     def index_text_dir(self, path: str, top_caller=True):
+        if self.num_workers > 1:
+            self.index_text_dir_parallel(path)
+        else:
+            for doc_id, str_file in tqdm(self.html_files(path), disable=not top_caller):
+                with open(str_file, "r", encoding='utf-8') as file:
+                    self.index_text(doc_id, file.read())
         if top_caller:
-            for str_sub_dir in tqdm(os.listdir(path)):
-                path_sub_dir = f"{path}/{str_sub_dir}"
-
-                if os.path.isfile(path_sub_dir):
-                    if str_sub_dir.endswith(".html"):
-                        with open(path_sub_dir, "r", encoding='utf-8') as file:
-                            doc_id = int(os.path.splitext(str_sub_dir)[0])
-                            html_text = file.read()
-                            
-                            self.index_text(doc_id,html_text)
-                
-                if os.path.isdir(path_sub_dir):
-                    self.index_text_dir(path_sub_dir, False)
             self.index.finish_indexing()
-        else:
-            for str_sub_dir in os.listdir(path):
-                path_sub_dir = f"{path}/{str_sub_dir}"
-
-                if os.path.isfile(path_sub_dir):
-                    if str_sub_dir.endswith(".html"):
-                        with open(path_sub_dir, "r", encoding='utf-8') as file:
-                            doc_id = int(os.path.splitext(str_sub_dir)[0])
-                            html_text = file.read()
-                            
-                            self.index_text(doc_id,html_text)
-                
-                if os.path.isdir(path_sub_dir):
-                    self.index_text_dir(path_sub_dir, False)
-
-            
+
+    def index_text_dir_parallel(self, path: str):
+        """
+        Os blocos de arquivos são processados pelo pool (ver word_count_files) e indexados na ordem em que foram
+        enviados. No máximo 2*num_workers blocos ficam pendentes (a memória não cresce com a coleção)
+        """
+        files = self.html_files(path)
+        it_chunks = iter(lambda: list(islice(files, self.chunk_size)), [])
+        with ProcessPoolExecutor(max_workers=self.num_workers, initializer=init_worker,
+                                 initargs=(self.cleaner, self.fast_tokenizer)) as executor, tqdm() as progress:
+            pending = deque(executor.submit(word_count_files, lst_files)
+                            for lst_files in islice(it_chunks, 2*self.num_workers))
+            while pending:
+                lst_word_counts = pending.popleft().result()
+                lst_files = next(it_chunks, None)
+                if lst_files is not None:
+                    pending.append(executor.submit(word_count_files, lst_files))
+                for doc_id, dic_word_count in lst_word_counts:
+                    #o mesmo doc_id pode estar em mais de um diretório
+                    if doc_id not in self.index.set_documents:
+                        self.index_word_count(doc_id, dic_word_count)
+                progress.update(len(lst_word_counts))
+
+
+#indexador (sem índice) de cada processo do pool do index_text_dir_parallel
+worker_indexer = None
+
+
+def init_worker(cleaner: Cleaner, fast_tokenizer: bool):
+    global worker_indexer
+    worker_indexer = HTMLIndexer(None, fast_tokenizer=fast_tokenizer)
+    worker_indexer.cleaner = cleaner
+
+
+def word_count_files(lst_files: list) -> list:
+    """
+    Contagem dos termos de cada arquivo (doc_id, arquivo): retorna tuplas (doc_id, {termo: frequência})
+    """
+    lst_word_counts = []
+    for doc_id, str_file in lst_files:
+        with open(str_file, "r", encoding='utf-8') as file:
+            lst_word_counts.append((doc_id, worker_indexer.html_word_count(file.read())))
+    return lst_word_counts
@@ -1,6 +1,100 @@
 from index.indexer import *
 from index.structure import *
 import unittest
+import pickle
+
+class TermCacheTest(unittest.TestCase):
+    def test_lru(self):
+        cache = TermCache(2)
+        self.assertIs(cache.get("casa"), TermCache.MISSING)
+        cache.put("casa", "cas")
+        cache.put("a", None)
+        self.assertEqual(cache.get("casa"), "cas")
+        #o token descartado (None) também fica em cache
+        self.assertIsNone(cache.get("a"))
+        #"casa" foi usado há mais tempo: é removido ao inserir "verde"
+        cache.put("verde", "verd")
+        self.assertEqual(len(cache), 2)
+        self.assertIs(cache.get("casa"), TermCache.MISSING)
+        self.assertEqual(cache.get("verde"), "verd")
+        self.assertEqual(cache.hits, 3)
+        self.assertEqual(cache.misses, 2)
+
+
+class CleanerTest(unittest.TestCase):
+    def create_cleaner(self, cache_size:int=None) -> Cleaner:
+        return Cleaner(stop_words_file="stopwords.txt", language="portuguese", perform_stop_words_removal=True,
+                       perform_accents_removal=True, perform_stemming=True, cache_size=cache_size)
+
+    def test_cache(self):
+        cleaner = self.create_cleaner()
+        lst_tokens = ["Casas", "casas", "a", "123", "Ação", "casas", "a", "Ação"]
+        lst_expected = [self.create_cleaner(0).preprocess_text(token) for token in lst_tokens]
+        self.assertListEqual([cleaner.cached_preprocess_text(token) for token in lst_tokens], lst_expected)
+        self.assertEqual(cleaner.cache_misses, 5)
+        self.assertEqual(cleaner.cache_hits, 3)
+
+        #cada combinação de flags possui o seu cache
+        cleaner.perform_stemming = False
+        cleaner.perform_stop_words_removal = False
+        self.assertEqual(cleaner.cached_preprocess_text("casas"), "casas")
+        self.assertEqual(cleaner.cached_preprocess_text("a"), "a")
+        self.assertEqual(cleaner.cache_misses, 7)
+        cleaner.perform_stemming = True
+        cleaner.perform_stop_words_removal = True
+        self.assertEqual(cleaner.cached_preprocess_text("casas"), lst_expected[1])
+        self.assertIsNone(cleaner.cached_preprocess_text("a"))
+        self.assertEqual(cleaner.cache_hits, 5)
+
+    def test_cache_size(self):
+        cleaner = self.create_cleaner(2)
+        for token in ["casa", "verde", "casa", "azul", "verde"]:
+            cleaner.cached_preprocess_text(token)
+        #LRU: "verde" foi removido ao inserir "azul" ("casa" foi usado mais recentemente)
+        self.assertEqual(len(cleaner.dic_term_caches[cleaner.flags]), 2)
+        self.assertEqual(cleaner.cache_hits, 1)
+        self.assertEqual(cleaner.cache_misses, 4)
+        cleaner = self.create_cleaner(0)
+        cleaner.cached_preprocess_text("casa")
+        self.assertEqual(cleaner.cache_hits+cleaner.cache_misses, 0)
+
+    def test_pickle(self):
+        cleaner = self.create_cleaner()
+        cleaner.cached_preprocess_text("casas")
+        cleaner_copy = pickle.loads(pickle.dumps(cleaner))
+        self.assertEqual(cleaner_copy.cache_misses, 0)
+        self.assertEqual(cleaner_copy.cached_preprocess_text("casas"), cleaner.cached_preprocess_text("casas"))
+        self.assertEqual(cleaner.cache_hits, 1)
+
+    def test_tokenize(self):
+        cleaner = self.create_cleaner()
+        self.assertListEqual(cleaner.tokenize("Casa, guarda-chuva (d'água) 1.5 - AÇÃO!"),
+                             ["Casa", "guarda-chuva", "d'água", "1", "5", "AÇÃO"])
+
+    def test_remove_accents(self):
+        cleaner = self.create_cleaner()
+        self.assertEqual(cleaner.remove_accents("Ação É Über ñandú"), "Acao E Uber ñandu")
+        #todas as letras latinas (NFKD)
+        cleaner = Cleaner(stop_words_file="stopwords.txt", language="portuguese", perform_stop_words_removal=True,
+                          perform_accents_removal=True, perform_stemming=True, fold_all_accents=True)
+        self.assertEqual(cleaner.remove_accents("ação é über ñandú škoda łódź"), "acao e uber nandu skoda łodz")
+        self.assertListEqual(cleaner.fold_tokens(["Ação", "É", "casa"]), ["acao", "e", "casa"])
+        self.assertListEqual([cleaner.preprocess_text(token, folded_token) for token, folded_token
+                              in zip(["Ações", "Casas"], cleaner.fold_tokens(["Ações", "Casas"]))],
+                             [cleaner.preprocess_text("Ações"), cleaner.preprocess_text("Casas")])
+        #stop words comparadas antes da remoção dos acentos: "e" não é removido pela stop word "é"
+        self.assertEqual(cleaner.preprocess_text("e"), "e")
+
+    def test_html_backend(self):
+        with self.assertRaises(ValueError):
+            Cleaner(stop_words_file="stopwords.txt", language="portuguese", perform_stop_words_removal=True,
+                    perform_accents_removal=True, perform_stemming=True, html_backend="xml")
+        cleaner = self.create_cleaner()
+        html_doc = "<html><body><style>p {}</style><p>Casa <b>verde</b></p></body></html>"
+        for html_backend in HTML_BACKENDS:
+            cleaner.html_backend = html_backend
+            self.assertListEqual(cleaner.html_to_plain_text(html_doc).split(), ["Casa", "verde"])
+
 
 class IndexerTest(unittest.TestCase):
     def test_indexer(self):
@@ -22,6 +116,38 @@ class IndexerTest(unittest.TestCase):
                 self.assertTrue(occur.doc_id in dic_expected,f"O docid número {occur.doc_id} não deveria existir ou não deveria indexar o termo 'cas'")
                 self.assertEqual(dic_expected[occur.doc_id].term_freq,occur.term_freq, f"A frequencia do termo 'cas' no documento {occur.doc_id} deveria ser {occur.term_freq}")
     
+    def test_fast_tokenizer(self):
+        #mesmo resultado do test_indexer, sem o word_tokenize
+        obj_index = HashIndex()
+        HTMLIndexer(obj_index, fast_tokenizer=True).index_text_dir("index/docs_test")
+        self.assertSetEqual(set(obj_index.vocabulary), {'cas', 'ser', 'verd', 'ou', 'nao', 'eis', 'questa'})
+        self.assertListEqual([(occur.doc_id, occur.term_freq) for occur in obj_index.get_occurrence_list("cas")],
+                             [(100102, 2), (111, 1)])
+        for num_workers in [1, 2]:
+            parallel_index = HashIndex()
+            HTMLIndexer(parallel_index, num_workers=num_workers, fast_tokenizer=True).index_text_dir("index/docs_test")
+            self.assertListEqual(list(parallel_index.vocabulary), list(obj_index.vocabulary))
+
+    def test_fast_tokenizer_stop_words(self):
+        #os dois tokenizadores comparam as stop words antes da remoção dos acentos ("é" e "e")
+        plain_text = "É casa e Casas, é é e"
+        dic_expected = HTMLIndexer(HashIndex()).text_word_count(plain_text)
+        self.assertDictEqual(dic_expected, {"cas": 2, "e": 2})
+        self.assertDictEqual(HTMLIndexer(HashIndex(), fast_tokenizer=True).text_word_count(plain_text), dic_expected)
+
+    def test_parallel_indexer(self):
+        #mesmo índice da indexação sequencial (termos, term_ids e ocorrências)
+        serial_index = HashIndex()
+        HTMLIndexer(serial_index).index_text_dir("index/docs_test")
+        for num_workers, chunk_size in [(2, 1), (3, 2)]:
+            parallel_index = HashIndex()
+            HTMLIndexer(parallel_index, num_workers=num_workers, chunk_size=chunk_size).index_text_dir("index/docs_test")
+            self.assertListEqual(list(parallel_index.vocabulary), list(serial_index.vocabulary))
+            for term in serial_index.vocabulary:
+                self.assertEqual(parallel_index.get_term_id(term), serial_index.get_term_id(term))
+                self.assertListEqual([(occur.doc_id, occur.term_freq) for occur in parallel_index.get_occurrence_list(term)],
+                                     [(occur.doc_id, occur.term_freq) for occur in serial_index.get_occurrence_list(term)])
+
     def test_wiki_idx(self):
         wiki_idx = Index.read("wiki_hash.idx")
 
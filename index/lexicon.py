@@ -0,0 +1,203 @@
+from collections.abc import Mapping
+from typing import List
+import numpy as np
+
+
+def encode_varint(value:int, buffer:bytearray):
+    #7 bits por byte; o bit mais significativo indica que há mais bytes
+    while value >= 0x80:
+        buffer.append((value & 0x7F) | 0x80)
+        value >>= 7
+    buffer.append(value)
+
+
+def decode_varint(buffer:bytes, pos:int) -> (int, int):
+    value = 0
+    shift = 0
+    while True:
+        byte = buffer[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+
+
+class FrozenLexicon(Mapping):
+    """
+    Vocabulário imutável, criado ao final da indexação.
+    Os termos ficam ordenados e codificados em blocos de BLOCK_SIZE termos (front coding): o primeiro termo
+    do bloco é gravado por completo e os demais apenas como (tamanho do prefixo comum com o anterior, sufixo).
+    term_id, offset e doc_count de cada termo ficam em arrays (na ordem dos termos).
+    A busca de um termo é uma busca binária pelos primeiros termos de cada bloco seguida de uma
+    varredura do bloco.
+
+    Funciona como o dicionário dic_index (somente leitura): o valor de cada termo é criado sob demanda
+    como entry_class(term_id, offset, doc_count). Assim como no dicionário, a iteração (keys, items e values)
+    segue a ordem de inserção dos termos, ou seja, a ordem dos term_id; apenas terms_with_prefix retorna
+    os termos em ordem alfabética.
+    """
+    BLOCK_SIZE = 16
+
+    def __init__(self, lst_terms:List[str], term_ids, offsets, doc_counts, entry_class):
+        arr_terms = [term.encode("utf-8") for term in lst_terms]
+        #ordem dos bytes UTF-8 = ordem dos caracteres (code points)
+        order = sorted(range(len(arr_terms)), key=arr_terms.__getitem__)
+
+        blob = bytearray()
+        block_offsets = []
+        last_term = b""
+        for pos, idx in enumerate(order):
+            term = arr_terms[idx]
+            if pos % self.BLOCK_SIZE == 0:
+                block_offsets.append(len(blob))
+                prefix_len = 0
+            else:
+                prefix_len = FrozenLexicon.common_prefix_len(last_term, term)
+            encode_varint(prefix_len, blob)
+            encode_varint(len(term)-prefix_len, blob)
+            blob += term[prefix_len:]
+            last_term = term
+
+        order = np.array(order, dtype=np.int64)
+        self.blob = bytes(blob)
+        self.block_offsets = np.array(block_offsets, dtype=np.int64)
+        self.term_ids = np.asarray(term_ids, dtype=np.uint32)[order] if len(order) > 0 else np.zeros(0, dtype=np.uint32)
+        self.offsets = np.asarray(offsets, dtype=np.int64)[order] if len(order) > 0 else np.zeros(0, dtype=np.int64)
+        self.doc_counts = np.asarray(doc_counts, dtype=np.uint32)[order] if len(order) > 0 else np.zeros(0, dtype=np.uint32)
+        self.entry_class = entry_class
+
+    @staticmethod
+    def from_arrays(blob:bytes, block_offsets:np.ndarray, term_ids:np.ndarray, offsets:np.ndarray,
+                    doc_counts:np.ndarray, entry_class) -> "FrozenLexicon":
+        """
+        Recria o vocabulário a partir dos arrays já codificados (ex.: lidos do disco)
+        """
+        lexicon = FrozenLexicon.__new__(FrozenLexicon)
+        lexicon.blob = bytes(blob)
+        lexicon.block_offsets = np.asarray(block_offsets, dtype=np.int64)
+        lexicon.term_ids = np.asarray(term_ids, dtype=np.uint32)
+        lexicon.offsets = np.asarray(offsets, dtype=np.int64)
+        lexicon.doc_counts = np.asarray(doc_counts, dtype=np.uint32)
+        lexicon.entry_class = entry_class
+        return lexicon
+
+    @staticmethod
+    def common_prefix_len(term_a:bytes, term_b:bytes) -> int:
+        max_len = min(len(term_a), len(term_b))
+        pos = 0
+        while pos < max_len and term_a[pos] == term_b[pos]:
+            pos += 1
+        return pos
+
+    def block_first_term(self, block:int) -> bytes:
+        pos = int(self.block_offsets[block])
+        _, pos = decode_varint(self.blob, pos)
+        term_len, pos = decode_varint(self.blob, pos)
+        return self.blob[pos:pos+term_len]
+
+    def iter_block(self, block:int):
+        """
+        Retorna (posição, termo) dos termos a partir do inicio do bloco block até o fim do vocabulário
+        """
+        position = block*self.BLOCK_SIZE
+        pos = int(self.block_offsets[block]) if block < len(self.block_offsets) else len(self.blob)
+        term = b""
+        while pos < len(self.blob):
+            prefix_len, pos = decode_varint(self.blob, pos)
+            suffix_len, pos = decode_varint(self.blob, pos)
+            term = term[:prefix_len] + self.blob[pos:pos+suffix_len]
+            pos += suffix_len
+            yield position, term
+            position += 1
+
+    def find_block(self, term:bytes) -> int:
+        #ultimo bloco cujo primeiro termo é menor ou igual a term
+        low, high = 0, len(self.block_offsets)-1
+        block = 0
+        while low <= high:
+            mid = (low+high)//2
+            if self.block_first_term(mid) <= term:
+                block = mid
+                low = mid+1
+            else:
+                high = mid-1
+        return block
+
+    def position(self, term:str) -> int:
+        """
+        Posição (ordinal) do termo no vocabulário ordenado, ou -1 caso não exista
+        """
+        if len(self.block_offsets) == 0:
+            return -1
+        term_bytes = term.encode("utf-8")
+        block = self.find_block(term_bytes)
+        for position, block_term in self.iter_block(block):
+            if block_term == term_bytes:
+                return position
+            if block_term > term_bytes or position >= (block+1)*self.BLOCK_SIZE-1:
+                return -1
+        return -1
+
+    def entry(self, position:int):
+        return self.entry_class(int(self.term_ids[position]), int(self.offsets[position]), int(self.doc_counts[position]))
+
+    def terms_with_prefix(self, prefix:str) -> List[str]:
+        """
+        Termos (em ordem) que começam com prefix
+        """
+        if len(self.block_offsets) == 0:
+            return []
+        prefix_bytes = prefix.encode("utf-8")
+        lst_terms = []
+        for _, term in self.iter_block(self.find_block(prefix_bytes)):
+            if term.startswith(prefix_bytes):
+                lst_terms.append(term.decode("utf-8"))
+            elif term > prefix_bytes:
+                break
+        return lst_terms
+
+    def get(self, term:str, default=None):
+        position = self.position(term)
+        return default if position < 0 else self.entry(position)
+
+    def __getitem__(self, term:str):
+        position = self.position(term)
+        if position < 0:
+            raise KeyError(term)
+        return self.entry(position)
+
+    def __contains__(self, term) -> bool:
+        return isinstance(term, str) and self.position(term) >= 0
+
+    def sorted_terms(self) -> List[str]:
+        #todos os termos, em ordem alfabética (uma única decodificação do texto)
+        if len(self.block_offsets) == 0:
+            return []
+        return [term.decode("utf-8") for _, term in self.iter_block(0)]
+
+    def id_order(self) -> List[int]:
+        #posições dos termos na ordem dos term_id
+        return np.argsort(self.term_ids, kind="stable").tolist()
+
+    def __iter__(self):
+        lst_terms = self.sorted_terms()
+        for position in self.id_order():
+            yield lst_terms[position]
+
+    def __len__(self) -> int:
+        return len(self.term_ids)
+
+    def items(self):
+        #evita uma busca por termo
+        lst_terms = self.sorted_terms()
+        for position in self.id_order():
+            yield lst_terms[position], self.entry(position)
+
+    def values(self):
+        for position in self.id_order():
+            yield self.entry(position)
+
+    @property
+    def nbytes(self) -> int:
+        return len(self.blob)+self.block_offsets.nbytes+self.term_ids.nbytes+self.offsets.nbytes+self.doc_counts.nbytes
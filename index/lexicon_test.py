@@ -0,0 +1,67 @@
+from index.lexicon import *
+from index.structure import TermFilePosition
+import pickle
+import unittest
+
+
+class LexiconTest(unittest.TestCase):
+    def setUp(self):
+        #termos com prefixos em comum, ocupando vários blocos
+        self.lst_terms = [f"termo{i:03d}" for i in range(100)] + ["casa", "casamento", "ação", "açúcar", "z"]
+        self.lexicon = FrozenLexicon(self.lst_terms, range(len(self.lst_terms)),
+                                     [i*10 for i in range(len(self.lst_terms))],
+                                     [i+1 for i in range(len(self.lst_terms))], TermFilePosition)
+
+    def test_varint(self):
+        buffer = bytearray()
+        for value in [0, 127, 128, 300, 1 << 40]:
+            encode_varint(value, buffer)
+        pos = 0
+        for value in [0, 127, 128, 300, 1 << 40]:
+            decoded, pos = decode_varint(buffer, pos)
+            self.assertEqual(decoded, value)
+        self.assertEqual(pos, len(buffer))
+
+    def test_lookup(self):
+        self.assertEqual(len(self.lexicon), len(self.lst_terms))
+        #iteração na ordem dos term_id (ordem de inserção), busca de prefixos em ordem alfabética
+        self.assertListEqual(list(self.lexicon), self.lst_terms)
+        self.assertListEqual([term for term, _ in self.lexicon.items()], self.lst_terms)
+        self.assertListEqual([entry.term_id for entry in self.lexicon.values()], list(range(len(self.lst_terms))))
+        self.assertListEqual(self.lexicon.sorted_terms(), sorted(self.lst_terms))
+        for term_id, term in enumerate(self.lst_terms):
+            entry = self.lexicon[term]
+            self.assertEqual(entry.term_id, term_id)
+            self.assertEqual(entry.term_file_start_pos, term_id*10)
+            self.assertEqual(entry.doc_count_with_term, term_id+1)
+        for term in ["", "a", "casam", "termo1000", "termo0505", "zz"]:
+            self.assertNotIn(term, self.lexicon)
+            self.assertIsNone(self.lexicon.get(term))
+        with self.assertRaises(KeyError):
+            self.lexicon["cas"]
+
+    def test_front_coding(self):
+        self.assertLess(len(self.lexicon.blob), sum(len(term.encode("utf-8")) for term in self.lst_terms),
+                        "Os prefixos em comum não devem ser repetidos")
+        self.assertEqual(len(self.lexicon.block_offsets), -(-len(self.lst_terms)//FrozenLexicon.BLOCK_SIZE))
+
+    def test_terms_with_prefix(self):
+        self.assertListEqual(self.lexicon.terms_with_prefix("casa"), ["casa","casamento"])
+        self.assertListEqual(self.lexicon.terms_with_prefix("termo01"), [f"termo{i:03d}" for i in range(10,20)])
+        self.assertListEqual(self.lexicon.terms_with_prefix("aç"), ["ação","açúcar"])
+        self.assertListEqual(self.lexicon.terms_with_prefix("b"), [])
+        self.assertEqual(len(self.lexicon.terms_with_prefix("")), len(self.lst_terms))
+
+    def test_empty_and_pickle(self):
+        empty = FrozenLexicon([], [], [], [], TermFilePosition)
+        self.assertEqual(len(empty), 0)
+        self.assertNotIn("casa", empty)
+        self.assertListEqual(empty.terms_with_prefix("c"), [])
+
+        lexicon = pickle.loads(pickle.dumps(self.lexicon))
+        self.assertListEqual(list(lexicon), list(self.lexicon))
+        self.assertEqual(lexicon["casa"].term_id, self.lexicon["casa"].term_id)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,45 @@
+import numpy as np
+
+
+class LiveDocs:
+    """
+    Bitmap dos documentos excluídos: 1 bit por doc_id (bit doc_id%8 do byte doc_id//8).
+    Os doc_ids além do fim do bitmap estão vivos, assim, um índice sem exclusões não ocupa memória
+    """
+    def __init__(self, bits:np.ndarray=None):
+        self.bits = np.zeros(0, dtype=np.uint8) if bits is None else np.array(bits, dtype=np.uint8)
+        self.deleted_count = int(np.unpackbits(self.bits).sum())
+
+    def delete(self, doc_id:int) -> bool:
+        """
+        Marca o documento como excluído. Retorna falso caso ele já estivesse excluído
+        """
+        if not self.is_live(doc_id):
+            return False
+        byte = doc_id >> 3
+        if byte >= len(self.bits):
+            #cresce em potências de 2 (amortizado)
+            new_bits = np.zeros(max(byte+1, 2*len(self.bits)), dtype=np.uint8)
+            new_bits[:len(self.bits)] = self.bits
+            self.bits = new_bits
+        self.bits[byte] |= 1 << (doc_id & 7)
+        self.deleted_count += 1
+        return True
+
+    def is_live(self, doc_id:int) -> bool:
+        byte = doc_id >> 3
+        return byte >= len(self.bits) or not (self.bits[byte] >> (doc_id & 7)) & 1
+
+    def live_mask(self, doc_ids:np.ndarray) -> np.ndarray:
+        """
+        Máscara (vetorizada) dos documentos vivos de doc_ids
+        """
+        doc_ids = np.asarray(doc_ids, dtype=np.int64)
+        bytes_pos = doc_ids >> 3
+        in_bitmap = bytes_pos < len(self.bits)
+        mask = np.ones(len(doc_ids), dtype=bool)
+        mask[in_bitmap] = ((self.bits[bytes_pos[in_bitmap]] >> (doc_ids[in_bitmap] & 7)) & 1) == 0
+        return mask
+
+    def deleted_doc_ids(self) -> np.ndarray:
+        return np.flatnonzero(np.unpackbits(self.bits, bitorder="little")).astype(np.int64)
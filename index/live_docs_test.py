@@ -0,0 +1,90 @@
+from index.live_docs import LiveDocs
+from index.structure import *
+from index.postings import intersect_cursors
+import numpy as np
+import unittest
+
+
+class LiveDocsTest(unittest.TestCase):
+    def test_delete(self):
+        live_docs = LiveDocs()
+        self.assertTrue(live_docs.is_live(100))
+        self.assertTrue(live_docs.delete(100))
+        self.assertFalse(live_docs.delete(100), "O documento já estava excluído")
+        self.assertTrue(live_docs.delete(3))
+        self.assertFalse(live_docs.is_live(100))
+        self.assertFalse(live_docs.is_live(3))
+        self.assertTrue(live_docs.is_live(101))
+        self.assertTrue(live_docs.is_live(10**6))
+        self.assertEqual(live_docs.deleted_count, 2)
+        self.assertListEqual(live_docs.deleted_doc_ids().tolist(), [3, 100])
+        self.assertListEqual(live_docs.live_mask(np.array([1, 3, 99, 100, 10**6])).tolist(),
+                             [True, False, True, False, True])
+        #1 bit por doc_id
+        self.assertLessEqual(len(live_docs.bits), 2*(100//8+1))
+        self.assertEqual(LiveDocs(live_docs.bits).deleted_count, 2)
+
+
+class DeletionTest(unittest.TestCase):
+    def index_docs(self, index):
+        for doc_id in range(1, 41):
+            for term in range(doc_id%4, 12, 2):
+                index.index(f"termo{term}", doc_id, doc_id%3+1)
+        #termo presente apenas no documento 7
+        index.index("raro", 7, 1)
+
+    def expected_postings(self, set_deleted) -> dict:
+        expected = HashIndex()
+        self.index_docs(expected)
+        dic_postings = {}
+        for term in expected.vocabulary:
+            lst_postings = [(occur.doc_id, occur.term_freq) for occur in expected.get_occurrence_list(term)
+                            if occur.doc_id not in set_deleted]
+            if lst_postings:
+                dic_postings[term] = lst_postings
+        return dic_postings
+
+    def check_deletion(self, index):
+        self.index_docs(index)
+        index.finish_indexing()
+        set_deleted = {7, 8, 21}
+        for doc_id in set_deleted:
+            self.assertTrue(index.delete_document(doc_id))
+        self.assertFalse(index.delete_document(7))
+        self.assertFalse(index.delete_document(999), "Documento inexistente")
+
+        #antes da compactação: as ocorrências continuam no índice, mas são filtradas nas consultas
+        self.assertEqual(index.document_count, 40)
+        self.assertEqual(index.document_count_with_term("raro"), 1)
+        self.assertEqual(len(index.live_occurrences(index.get_occurrence_list("raro"))), 0)
+        lst_cursors = [index.postings_cursor("termo0"), index.postings_cursor("termo2")]
+        self.assertNotIn(8, intersect_cursors(lst_cursors))
+
+        index.compact()
+        self.assertFalse(index.has_deletions)
+        self.assertEqual(index.document_count, 37)
+        self.assertNotIn("raro", index.vocabulary)
+        dic_expected = self.expected_postings(set_deleted)
+        self.assertCountEqual(index.vocabulary, dic_expected.keys())
+        for term, lst_postings in dic_expected.items():
+            self.assertEqual(index.document_count_with_term(term), len(lst_postings))
+            self.assertListEqual([(occur.doc_id, occur.term_freq) for occur in index.get_occurrence_list(term)],
+                                 lst_postings)
+        #novos termos recebem term_ids distintos dos existentes
+        index.index("novo", 50, 1)
+        self.assertNotIn(index.get_term_id("novo"), [index.get_term_id(term) for term in dic_expected])
+        return index
+
+    def test_hash_index(self):
+        self.check_deletion(HashIndex())
+
+    def test_file_index(self):
+        for postings_codec in [None, "vbyte"]:
+            index = self.check_deletion(FileIndex(postings_codec=postings_codec))
+            index.close_reader()
+            for str_file in index.lst_run_files:
+                os.remove(str_file)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,99 @@
+from typing import List
+import json
+import os
+
+MANIFEST_FILE = "manifest.json"
+#termos (um JSON por linha, em ordem de term_id) e documentos (um doc_id por linha) já gravados em runs
+VOCABULARY_FILE = "vocabulary.jsonl"
+DOCUMENTS_FILE = "documents.txt"
+MANIFEST_VERSION = 1
+
+
+class BuildManifest:
+    """
+    Manifesto de uma indexação (FileIndex) em andamento, gravado no diretório de trabalho work_dir.
+    A cada run concluído é gravado (de forma atômica: arquivo temporário + os.replace) o estado da indexação:
+    os runs completos, o contador de arquivos e a quantidade de termos e documentos já gravados.
+    Os termos e documentos são acrescentados aos arquivos VOCABULARY_FILE e DOCUMENTS_FILE; as linhas além das
+    quantidades registradas no manifesto (gravadas antes de uma falha) são descartadas ao retomar a indexação
+    """
+    def __init__(self, work_dir:str):
+        self.work_dir = work_dir
+        os.makedirs(work_dir, exist_ok=True)
+        self.terms_written = 0
+        self.documents_written = 0
+
+    def path(self, str_file:str) -> str:
+        return os.path.join(self.work_dir, str_file)
+
+    def load(self) -> dict:
+        """
+        Estado do ultimo run concluído ou None caso não exista uma indexação a ser retomada
+        """
+        if not os.path.exists(self.path(MANIFEST_FILE)):
+            return None
+        with open(self.path(MANIFEST_FILE), encoding="utf-8") as manifest_file:
+            dic_state = json.load(manifest_file)
+        if dic_state.get("version") != MANIFEST_VERSION:
+            raise ValueError(f"Versão do manifesto não suportada: {dic_state.get('version')}")
+        return dic_state
+
+    def read_terms(self, count:int) -> List[str]:
+        lst_lines = self.read_lines(VOCABULARY_FILE, count)
+        self.terms_written = count
+        return [json.loads(line) for line in lst_lines]
+
+    def read_documents(self, count:int) -> List[int]:
+        lst_lines = self.read_lines(DOCUMENTS_FILE, count)
+        self.documents_written = count
+        return [int(line) for line in lst_lines]
+
+    def read_lines(self, str_file:str, count:int) -> List[str]:
+        #lê as count primeiras linhas e descarta as demais
+        lst_lines = []
+        with open(self.path(str_file), "a+b") as lines_file:
+            lines_file.seek(0)
+            for _ in range(count):
+                line = lines_file.readline()
+                if not line.endswith(b"\n"):
+                    raise ValueError(f"{self.path(str_file)} possui menos linhas que as registradas no manifesto")
+                lst_lines.append(line.decode("utf-8"))
+            lines_file.truncate(lines_file.tell())
+        return lst_lines
+
+    def append_terms(self, lst_terms:List[str]):
+        self.append_lines(VOCABULARY_FILE, [json.dumps(term) for term in lst_terms])
+        self.terms_written += len(lst_terms)
+
+    def append_documents(self, lst_doc_ids:List[int]):
+        self.append_lines(DOCUMENTS_FILE, [str(doc_id) for doc_id in lst_doc_ids])
+        self.documents_written += len(lst_doc_ids)
+
+    def append_lines(self, str_file:str, lst_lines:List[str]):
+        with open(self.path(str_file), "a", encoding="utf-8") as lines_file:
+            lines_file.write("".join(f"{line}\n" for line in lst_lines))
+
+    def state(self, lst_run_files:List[str], idx_file_counter:int) -> dict:
+        return {"version":MANIFEST_VERSION,
+                "runs":[os.path.basename(str_run) for str_run in lst_run_files],
+                "idx_file_counter":idx_file_counter,
+                "terms":self.terms_written,
+                "documents":self.documents_written}
+
+    def save(self, dic_state:dict):
+        str_tmp = self.path(f"{MANIFEST_FILE}.tmp")
+        with open(str_tmp, "w", encoding="utf-8") as manifest_file:
+            json.dump(dic_state, manifest_file)
+            manifest_file.flush()
+            os.fsync(manifest_file.fileno())
+        os.replace(str_tmp, self.path(MANIFEST_FILE))
+
+    def remove(self):
+        """
+        Indexação concluída: o manifesto é excluído (uma nova indexação no mesmo diretório começa do zero)
+        """
+        for str_file in [MANIFEST_FILE, VOCABULARY_FILE, DOCUMENTS_FILE]:
+            if os.path.exists(self.path(str_file)):
+                os.remove(self.path(str_file))
+        self.terms_written = 0
+        self.documents_written = 0
@@ -5,9 +5,14 @@ from datetime import datetime
 import math
 import tracemalloc
 import unittest
+import os
 from random import randrange,seed
 
-from util.performance import CheckPerformance
+from util.performance import CheckPerformance, CheckTime
+from index.indexer import HTMLIndexer
+from index.html_text import HTML_BACKENDS
+from collections import Counter
+from itertools import islice
 
 
 
@@ -60,6 +65,133 @@ class FilePerformanceTest(PerformanceTest):
     def setUp(self):
         self.index = FileIndex()
 
+class CompressionPerformanceTest(unittest.TestCase):
+    """
+    Compara o tamanho do arquivo final e a vazão de decodificação (ocorrências por segundo) de cada codec
+    """
+    NUM_DOCS = 20000
+    NUM_TERM_PER_DOC = 100
+
+    def create_index(self, postings_codec:str) -> FileIndex:
+        index = FileIndex(postings_codec=postings_codec)
+        seed(10)
+        for doc_i in range(CompressionPerformanceTest.NUM_DOCS):
+            for term_j in set(randrange(0,2000) for _ in range(CompressionPerformanceTest.NUM_TERM_PER_DOC)):
+                index.index(f"termo{term_j}", doc_i, randrange(1,10))
+        index.finish_indexing()
+        return index
+
+    def test_codecs(self):
+        raw_size = None
+        for postings_codec in [None, "vbyte", "packed"]:
+            index = self.create_index(postings_codec)
+            file_size = os.path.getsize(index.str_idx_file_name)
+            raw_size = raw_size or file_size
+            print(f"Codec {postings_codec or 'registros'}: {file_size:,} bytes ({raw_size/file_size:.2f}x)")
+
+            check_time = CheckTime()
+            num_postings = sum(len(lst_occur) for _, lst_occur in index.iter_postings())
+            check_time.print_delta(f"Decodificação ({postings_codec or 'registros'})", num_postings)
+            os.remove(index.str_idx_file_name)
+
+class TokenizerPerformanceTest(unittest.TestCase):
+    """
+    Compara o word_tokenize (nltk) com o tokenizador rápido (fast_tokenizer do HTMLIndexer): documentos por segundo
+    e diferenças entre os vocabulários obtidos no index/docs_test e em uma amostra da wiki (caso ela exista)
+    """
+    WIKI_PATH = "wiki"
+    WIKI_SAMPLE_DOCS = 2000
+
+    def read_texts(self, path:str, max_docs:int=None) -> list:
+        #texto de cada documento (a extração do HTML não entra na medição)
+        indexer = HTMLIndexer(HashIndex())
+        lst_texts = []
+        for _, str_file in islice(indexer.html_files(path), max_docs):
+            with open(str_file, "r", encoding='utf-8') as file:
+                lst_texts.append(indexer.cleaner.html_to_plain_text(file.read()))
+        return lst_texts
+
+    def vocabulary(self, lst_texts:list, fast_tokenizer:bool) -> Counter:
+        indexer = HTMLIndexer(None, fast_tokenizer=fast_tokenizer)
+        indexer.cleaner.clear_cache()
+        str_tokenizer = "rápido" if fast_tokenizer else "word_tokenize"
+        check_time = CheckTime()
+        vocabulary = Counter()
+        for text in lst_texts:
+            vocabulary.update(indexer.text_word_count(text))
+        check_time.print_delta(f"Tokenização ({str_tokenizer})", len(lst_texts))
+        return vocabulary
+
+    def report(self, path:str, max_docs:int=None) -> dict:
+        lst_texts = self.read_texts(path, max_docs)
+        vocabulary = self.vocabulary(lst_texts, False)
+        fast_vocabulary = self.vocabulary(lst_texts, True)
+        set_missing = vocabulary.keys()-fast_vocabulary.keys()
+        set_extra = fast_vocabulary.keys()-vocabulary.keys()
+        num_same_freq = sum(1 for term, freq in vocabulary.items() if fast_vocabulary.get(term) == freq)
+        print(f"{path}: {len(lst_texts)} documentos, {len(vocabulary)} termos (word_tokenize), "
+              f"{len(fast_vocabulary)} termos (rápido)")
+        print(f"Termos com a mesma frequência: {num_same_freq} ({num_same_freq/max(len(vocabulary),1):.2%})")
+        print(f"Termos apenas no word_tokenize: {len(set_missing)} ex.: {sorted(set_missing, key=vocabulary.get)[-20:]}")
+        print(f"Termos apenas no rápido: {len(set_extra)} ex.: {sorted(set_extra, key=fast_vocabulary.get)[-20:]}")
+        return {"missing":set_missing, "extra":set_extra, "same_freq":num_same_freq}
+
+    def test_docs_test(self):
+        dic_report = self.report("index/docs_test")
+        self.assertEqual(len(dic_report["missing"])+len(dic_report["extra"]), 0)
+
+    def test_wiki_sample(self):
+        if not os.path.isdir(TokenizerPerformanceTest.WIKI_PATH):
+            self.skipTest(f"Diretório {TokenizerPerformanceTest.WIKI_PATH} não encontrado")
+        self.report(TokenizerPerformanceTest.WIKI_PATH, TokenizerPerformanceTest.WIKI_SAMPLE_DOCS)
+
+
+class HTMLExtractionPerformanceTest(unittest.TestCase):
+    """
+    Compara os extratores de texto do HTML (index.html_text): documentos por segundo e palavras iguais às
+    do BeautifulSoup, no index/docs_test e em uma amostra da wiki (caso ela exista)
+    """
+    WIKI_PATH = "wiki"
+    WIKI_SAMPLE_DOCS = 2000
+
+    def read_docs(self, path:str, max_docs:int=None) -> list:
+        lst_docs = []
+        for _, str_file in islice(HTMLIndexer(HashIndex()).html_files(path), max_docs):
+            with open(str_file, "r", encoding='utf-8') as file:
+                lst_docs.append(file.read())
+        return lst_docs
+
+    def report(self, path:str, max_docs:int=None) -> dict:
+        lst_docs = self.read_docs(path, max_docs)
+        dic_texts = {}
+        for backend, extract in HTML_BACKENDS.items():
+            check_time = CheckTime()
+            dic_texts[backend] = [extract(html_doc) for html_doc in lst_docs]
+            check_time.print_delta(f"Extração ({backend})", len(lst_docs))
+
+        dic_same_docs = {}
+        lst_expected = [Counter(text.split()) for text in dic_texts["bs4"]]
+        for backend, lst_texts in dic_texts.items():
+            lst_words = [Counter(text.split()) for text in lst_texts]
+            dic_same_docs[backend] = sum(1 for words, expected in zip(lst_words, lst_expected) if words == expected)
+            #palavras a menos: em geral, conteúdo das tags descartadas (ex.: script e style)
+            missing = sum((expected-words for words, expected in zip(lst_words, lst_expected)), Counter())
+            extra = sum((words-expected for words, expected in zip(lst_words, lst_expected)), Counter())
+            print(f"{path} ({backend}): {dic_same_docs[backend]}/{len(lst_docs)} documentos com as mesmas palavras, "
+                  f"{sum(missing.values())} palavras a menos ex.: {[word for word, _ in missing.most_common(20)]}, "
+                  f"{sum(extra.values())} a mais ex.: {[word for word, _ in extra.most_common(20)]}")
+        return dic_same_docs
+
+    def test_docs_test(self):
+        dic_same_docs = self.report("index/docs_test")
+        self.assertTrue(all(num_docs == 3 for num_docs in dic_same_docs.values()))
+
+    def test_wiki_sample(self):
+        if not os.path.isdir(HTMLExtractionPerformanceTest.WIKI_PATH):
+            self.skipTest(f"Diretório {HTMLExtractionPerformanceTest.WIKI_PATH} não encontrado")
+        self.report(HTMLExtractionPerformanceTest.WIKI_PATH, HTMLExtractionPerformanceTest.WIKI_SAMPLE_DOCS)
+
+
 def test():
     for i in range(10):
         clear_output(wait=True)
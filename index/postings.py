@@ -0,0 +1,143 @@
+from typing import Callable, List
+import numpy as np
+
+
+def postings_columns(occurrences) -> (np.ndarray, np.ndarray):
+    """
+    Retorna as colunas (doc_ids, term_freqs) de uma lista de ocorrências (TermPostings ou lista de TermOccurrence)
+    como arrays NumPy
+    """
+    if hasattr(occurrences, "doc_ids"):
+        return np.asarray(occurrences.doc_ids, dtype=np.int64), np.asarray(occurrences.term_freqs, dtype=np.int64)
+    arr_doc_ids = np.fromiter((occur.doc_id for occur in occurrences), dtype=np.int64, count=len(occurrences))
+    arr_term_freqs = np.fromiter((occur.term_freq for occur in occurrences), dtype=np.int64, count=len(occurrences))
+    return arr_doc_ids, arr_term_freqs
+
+
+class PostingsCursor:
+    """
+    Cursor sobre a lista de ocorrências de um termo (ordenada por doc_id).
+    doc_id e term_freq são os da ocorrência atual; ao final da lista, doc_id é None.
+    Esta classe percorre uma lista já em memória (um único bloco).
+    live_docs (LiveDocs, opcional): os documentos excluídos são desconsiderados pela intersect_cursors
+    """
+    def __init__(self, term_id:int, doc_ids=None, term_freqs=None):
+        self.term_id = term_id
+        self.block_doc_ids = np.zeros(0, dtype=np.uint32) if doc_ids is None else np.asarray(doc_ids)
+        self.block_term_freqs = np.zeros(0, dtype=np.uint32) if term_freqs is None else np.asarray(term_freqs)
+        self.doc_count = len(self.block_doc_ids)
+        self.pos = 0
+        self.blocks_read = 1 if self.doc_count > 0 else 0
+        self.live_docs = None
+
+    @staticmethod
+    def from_occurrences(term_id:int, occurrences) -> "PostingsCursor":
+        if hasattr(occurrences, "doc_ids"):
+            return PostingsCursor(term_id, occurrences.doc_ids, occurrences.term_freqs)
+        return PostingsCursor(term_id, np.array([occur.doc_id for occur in occurrences], dtype=np.uint32),
+                              np.array([occur.term_freq for occur in occurrences], dtype=np.uint32))
+
+    @property
+    def doc_id(self) -> int:
+        return int(self.block_doc_ids[self.pos]) if self.pos < len(self.block_doc_ids) else None
+
+    @property
+    def term_freq(self) -> int:
+        return int(self.block_term_freqs[self.pos]) if self.pos < len(self.block_term_freqs) else None
+
+    def next_block(self) -> bool:
+        return False
+
+    def skip_to_block(self, doc_id:int) -> bool:
+        """
+        Posiciona o cursor no bloco que pode conter doc_id. Retorna falso caso nenhum bloco o contenha
+        """
+        return False
+
+    def next(self) -> int:
+        self.pos += 1
+        if self.pos >= len(self.block_doc_ids):
+            self.next_block()
+        return self.doc_id
+
+    def advance_to(self, doc_id:int) -> int:
+        """
+        Avança até a primeira ocorrência com doc_id maior ou igual ao informado e retorna o seu doc_id
+        (None caso não exista). Os blocos cujo ultimo doc_id é menor que doc_id não são lidos
+        """
+        if self.pos >= len(self.block_doc_ids):
+            return None
+        if self.block_doc_ids[-1] < doc_id and not self.skip_to_block(doc_id):
+            self.pos = len(self.block_doc_ids)
+            return None
+        self.pos = max(self.pos, int(np.searchsorted(self.block_doc_ids, doc_id)))
+        return self.doc_id
+
+
+class BlockPostingsCursor(PostingsCursor):
+    """
+    Cursor sobre uma lista de ocorrências gravada em blocos de block_size ocorrências.
+    skips são as entradas de salto (codec.SKIP_DTYPE) dos blocos do termo e
+    read_block(block, count) lê as colunas (doc_ids, term_freqs) do bloco de número block
+    """
+    def __init__(self, term_id:int, doc_count:int, skips:np.ndarray, block_size:int,
+                 read_block:Callable[[int, int], tuple]):
+        super().__init__(term_id)
+        self.doc_count = doc_count
+        self.skips = skips
+        self.skip_last_doc_ids = skips["last_doc_id"]
+        self.block_size = block_size
+        self.read_block = read_block
+        self.block = -1
+        if doc_count > 0:
+            self.load_block(0)
+
+    @property
+    def block_max_term_freq(self) -> int:
+        return int(self.skips["max_term_freq"][self.block])
+
+    def load_block(self, block:int):
+        count = min(self.block_size, self.doc_count-block*self.block_size)
+        self.block_doc_ids, self.block_term_freqs = self.read_block(block, count)
+        self.block = block
+        self.pos = 0
+        self.blocks_read += 1
+
+    def next_block(self) -> bool:
+        if self.block+1 >= len(self.skips):
+            return False
+        self.load_block(self.block+1)
+        return True
+
+    def skip_to_block(self, doc_id:int) -> bool:
+        block = self.block+1+int(np.searchsorted(self.skip_last_doc_ids[self.block+1:], doc_id))
+        if block >= len(self.skips):
+            return False
+        self.load_block(block)
+        return True
+
+
+def intersect_cursors(lst_cursors:List[PostingsCursor]) -> List[int]:
+    """
+    Documentos presentes em todas as listas (conjunção). A menor lista define os candidatos e as demais
+    avançam (advance_to) direto para eles, saltando os blocos sem candidatos
+    """
+    if not lst_cursors:
+        return []
+    lst_cursors = sorted(lst_cursors, key=lambda cursor: cursor.doc_count)
+    live_docs = lst_cursors[0].live_docs
+    lst_doc_ids = []
+    candidate = lst_cursors[0].doc_id
+    while candidate is not None:
+        for cursor in lst_cursors[1:]:
+            doc_id = cursor.advance_to(candidate)
+            if doc_id is None:
+                return lst_doc_ids
+            if doc_id != candidate:
+                candidate = lst_cursors[0].advance_to(doc_id)
+                break
+        else:
+            if live_docs is None or live_docs.is_live(candidate):
+                lst_doc_ids.append(candidate)
+            candidate = lst_cursors[0].next()
+    return lst_doc_ids
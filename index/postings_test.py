@@ -0,0 +1,79 @@
+from index.postings import *
+from index.structure import FileIndex, HashIndex
+from index.codec import SKIP_BLOCK_SIZE
+import unittest
+import os
+
+
+class PostingsCursorTest(unittest.TestCase):
+    def test_array_cursor(self):
+        cursor = PostingsCursor(0, [2,5,9,12], [1,2,3,4])
+        self.assertEqual(cursor.doc_id, 2)
+        self.assertEqual(cursor.next(), 5)
+        self.assertEqual(cursor.advance_to(5), 5, "advance_to não deve voltar nem sair do documento atual")
+        self.assertEqual(cursor.advance_to(6), 9)
+        self.assertEqual(cursor.term_freq, 3)
+        self.assertEqual(cursor.advance_to(13), None)
+        self.assertEqual(cursor.next(), None)
+        self.assertEqual(PostingsCursor(None).doc_id, None)
+
+    def test_intersect(self):
+        lst_cursors = [PostingsCursor(0, [1,3,5,7,9], [1]*5), PostingsCursor(1, [3,4,9], [1]*3),
+                       PostingsCursor(2, list(range(10)), [1]*10)]
+        self.assertListEqual(intersect_cursors(lst_cursors), [3,9])
+        self.assertListEqual(intersect_cursors([PostingsCursor(0, [1,2], [1,1]), PostingsCursor(1)]), [])
+
+
+class FilePostingsCursorTest(unittest.TestCase):
+    NUM_DOCS = 20*SKIP_BLOCK_SIZE
+
+    def setUp(self):
+        #tmp_occurrences_limit pequeno: vários runs intercalados
+        self.index = FileIndex(tmp_occurrences_limit_bytes=1000*FileIndex.TMP_OCCURRENCE_BYTES)
+        for doc_id in range(FilePostingsCursorTest.NUM_DOCS):
+            self.index.index("casa", doc_id, doc_id%7+1)
+            if doc_id % 1000 == 998:
+                self.index.index("raro", doc_id, 2)
+            if doc_id % 2 == 0:
+                self.index.index("par", doc_id, 1)
+        self.index.finish_indexing()
+
+    def tearDown(self):
+        self.index.close_reader()
+        os.remove(self.index.str_idx_file_name)
+
+    def test_skip_entries(self):
+        cursor = self.index.postings_cursor("casa")
+        self.assertIsInstance(cursor, BlockPostingsCursor)
+        self.assertEqual(len(cursor.skips), 20)
+        self.assertListEqual(cursor.skips["last_doc_id"].tolist(), [(i+1)*SKIP_BLOCK_SIZE-1 for i in range(20)])
+        self.assertEqual(cursor.block_max_term_freq, 7)
+
+        lst_doc_ids = []
+        while cursor.doc_id is not None:
+            lst_doc_ids.append(cursor.doc_id)
+            cursor.next()
+        self.assertListEqual(lst_doc_ids, list(range(FilePostingsCursorTest.NUM_DOCS)))
+
+    def test_intersect_skips_blocks(self):
+        for open_reader in [False, True]:
+            if open_reader:
+                self.index.open_reader()
+            lst_cursors = [self.index.postings_cursor(term) for term in ["casa","raro","par"]]
+            self.assertListEqual(intersect_cursors(lst_cursors), [998,1998])
+            self.assertLessEqual(lst_cursors[0].blocks_read, 3, "Os blocos sem candidatos não deveriam ser lidos")
+            self.assertListEqual(intersect_cursors([self.index.postings_cursor("raro"),
+                                                    self.index.postings_cursor("xuxu")]), [])
+
+    def test_hash_index_cursor(self):
+        index = HashIndex()
+        for doc_id in [1,4,8]:
+            index.index("casa", doc_id, 1)
+        index.finish_indexing()
+        cursor = index.postings_cursor("casa")
+        self.assertEqual(cursor.advance_to(2), 4)
+        self.assertEqual(cursor.doc_count, 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
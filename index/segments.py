@@ -0,0 +1,413 @@
+from typing import Callable, List
+from concurrent.futures import ThreadPoolExecutor
+import math
+import threading
+import numpy as np
+from index.structure import Index, HashIndex, TermFilePosition, TermPostings
+from index.live_docs import LiveDocs
+from index.doc_stats import DocumentStatsTable
+from index.postings import postings_columns
+
+
+class DocumentStats:
+    """
+    Estatísticas dos documentos de um segmento para o cálculo da norma tf-idf.
+    Com w = 1+log2(tf) e l = log2(df) de cada termo do documento, a norma ao quadrado é
+    Σ (w*(L-l))² = L²·Σw² - 2L·Σw²l + Σw²l², em que L = log2(N) (N: quantidade de documentos do índice).
+    Assim, a norma para qualquer N é obtida dos três somatórios (sum_w2, sum_w2_l e sum_w2_l2) e a alteração
+    do df de um termo atualiza apenas os somatórios dos documentos que o possuem.
+    As estatísticas de segmentos diferentes (documentos distintos) são combinadas por concatenação.
+    São mantidos também o tamanho (soma dos tf) e a quantidade de termos distintos de cada documento
+    """
+    def __init__(self, doc_ids:np.ndarray, sum_w2:np.ndarray, sum_w2_l:np.ndarray, sum_w2_l2:np.ndarray,
+                 lengths:np.ndarray, unique_terms:np.ndarray):
+        self.doc_ids = doc_ids
+        self.sum_w2 = sum_w2
+        self.sum_w2_l = sum_w2_l
+        self.sum_w2_l2 = sum_w2_l2
+        self.lengths = lengths
+        self.unique_terms = unique_terms
+
+    def columns(self) -> list:
+        return [self.sum_w2, self.sum_w2_l, self.sum_w2_l2, self.lengths, self.unique_terms]
+
+    @staticmethod
+    def from_index(index:Index, doc_freq:Callable[[str], int]) -> "DocumentStats":
+        """
+        Estatísticas dos documentos do índice (finalizado), sendo doc_freq(termo) o df do termo em todos os segmentos
+        """
+        doc_ids = np.array(sorted(index.set_documents), dtype=np.int64)
+        stats = DocumentStats(doc_ids, *[np.zeros(len(doc_ids)) for _ in range(5)])
+        stats.add_terms(index, {term:(None, math.log2(doc_freq(term))) for term in index.vocabulary
+                                if index.document_count_with_term(term) > 0})
+        return stats
+
+    def add_terms(self, index:Index, dic_log_dfs:dict):
+        """
+        Atualiza os somatórios dos documentos que possuem os termos de dic_log_dfs (termo -> (l anterior, novo l)).
+        Caso o l anterior seja None, o termo ainda não foi somado
+        """
+        arr_ordinals, arr_w2, arr_delta_l, arr_delta_l2, arr_term_freqs = [], [], [], [], []
+        for term, (old_log_df, new_log_df) in dic_log_dfs.items():
+            doc_ids, term_freqs = postings_columns(index.get_occurrence_list(term))
+            if len(doc_ids) == 0:
+                continue
+            w2 = np.square(1 + np.log2(term_freqs))
+            arr_ordinals.append(np.searchsorted(self.doc_ids, doc_ids))
+            arr_w2.append(w2 if old_log_df is None else np.zeros(len(w2)))
+            arr_term_freqs.append(term_freqs if old_log_df is None else np.zeros(len(w2)))
+            old_log_df = 0.0 if old_log_df is None else old_log_df
+            arr_delta_l.append(w2*(new_log_df-old_log_df))
+            arr_delta_l2.append(w2*(new_log_df*new_log_df-old_log_df*old_log_df))
+        if not arr_ordinals:
+            return
+        ordinals = np.concatenate(arr_ordinals)
+        self.sum_w2 += np.bincount(ordinals, weights=np.concatenate(arr_w2), minlength=len(self.doc_ids))
+        self.sum_w2_l += np.bincount(ordinals, weights=np.concatenate(arr_delta_l), minlength=len(self.doc_ids))
+        self.sum_w2_l2 += np.bincount(ordinals, weights=np.concatenate(arr_delta_l2), minlength=len(self.doc_ids))
+        term_freqs = np.concatenate(arr_term_freqs)
+        self.lengths += np.bincount(ordinals, weights=term_freqs, minlength=len(self.doc_ids))
+        self.unique_terms += np.bincount(ordinals, weights=term_freqs > 0, minlength=len(self.doc_ids))
+
+    @staticmethod
+    def combine(lst_stats:List["DocumentStats"]) -> "DocumentStats":
+        if not lst_stats:
+            return DocumentStats(np.zeros(0, dtype=np.int64), *[np.zeros(0) for _ in range(5)])
+        doc_ids = np.concatenate([stats.doc_ids for stats in lst_stats])
+        order = np.argsort(doc_ids, kind="stable")
+        return DocumentStats(doc_ids[order], *[np.concatenate(columns)[order]
+                                               for columns in zip(*[stats.columns() for stats in lst_stats])])
+
+    def norms(self, doc_count:int) -> np.ndarray:
+        log_n = math.log2(doc_count) if doc_count > 0 else 0.0
+        norm_sq = log_n*log_n*self.sum_w2 - 2*log_n*self.sum_w2_l + self.sum_w2_l2
+        return np.sqrt(np.maximum(norm_sq, 0))
+
+    def table(self, doc_count:int) -> DocumentStatsTable:
+        #estatísticas por documento (com as normas para doc_count documentos) no formato usado nas consultas
+        return DocumentStatsTable.from_columns(self.doc_ids, self.norms(doc_count), self.lengths, self.unique_terms)
+
+
+class Segment:
+    """
+    Segmento (índice finalizado) e as estatísticas dos seus documentos
+    """
+    def __init__(self, index:Index, stats:DocumentStats):
+        self.index = index
+        self.stats = stats
+
+    @property
+    def document_count(self) -> int:
+        return self.index.document_count
+
+
+class TieredMergePolicy:
+    """
+    Agrupa os segmentos em níveis (tiers) pela quantidade de documentos: segmentos com até min_segment_docs
+    documentos estão no nível 0 e cada nível seguinte possui segmentos merge_factor vezes maiores.
+    Quando um nível acumula merge_factor segmentos, eles são intercalados em um único segmento (do próximo nível),
+    assim, cada documento é regravado no máximo log(N) vezes
+    """
+    def __init__(self, merge_factor:int=10, min_segment_docs:int=1000):
+        self.merge_factor = merge_factor
+        self.min_segment_docs = min_segment_docs
+
+    def tier(self, doc_count:int) -> int:
+        if doc_count <= self.min_segment_docs:
+            return 0
+        return int(math.log(doc_count/self.min_segment_docs, self.merge_factor))
+
+    def find_merges(self, lst_segments:List[Segment]) -> List[List[Segment]]:
+        dic_tiers = {}
+        for segment in lst_segments:
+            dic_tiers.setdefault(self.tier(segment.document_count), []).append(segment)
+        lst_merges = []
+        for tier in sorted(dic_tiers):
+            lst_tier = dic_tiers[tier]
+            for pos in range(0, len(lst_tier)-self.merge_factor+1, self.merge_factor):
+                lst_merges.append(lst_tier[pos:pos+self.merge_factor])
+        return lst_merges
+
+
+class SegmentedIndex(Index):
+    """
+    Índice formado por segmentos independentes. Os documentos novos são indexados em um segmento ativo
+    (criado por segment_factory), que é finalizado e passa a ser pesquisado no finish_indexing.
+    As consultas (get_occurrence_list, document_count_with_term...) combinam todos os segmentos.
+    Os segmentos pequenos são intercalados, em segundo plano, segundo a merge_policy (TieredMergePolicy).
+
+    O dic_index mantém o term_id global e o df (em todos os segmentos finalizados) de cada termo, e cada segmento
+    mantém as estatísticas (DocumentStats) dos seus documentos: as normas são obtidas sem percorrer as listas
+    (ver document_stats)
+    """
+    def __init__(self, segment_factory:Callable[[], Index]=HashIndex, merge_policy:TieredMergePolicy=None,
+                 background_merge:bool=True, segment_max_docs:int=None):
+        """
+        segment_factory: cria o índice de cada segmento
+        segment_max_docs: caso informado, o segmento ativo é finalizado ao atingir essa quantidade de documentos
+        """
+        super().__init__()
+        self.segment_factory = segment_factory
+        self.merge_policy = TieredMergePolicy() if merge_policy is None else merge_policy
+        self.background_merge = background_merge
+        self.segment_max_docs = segment_max_docs
+
+        self.lst_segments = []
+        self.active_segment = None
+        #os segmentos são substituídos (lista nova) sob o lock: as consultas usam a lista vigente
+        self.segments_lock = threading.Lock()
+        #consultas em andamento e segmentos substituídos (merge ou compact): os arquivos desses segmentos são
+        #excluídos apenas quando nenhuma consulta em andamento puder lê-los
+        self.int_readers = 0
+        self.lst_retired_segments = []
+        self.set_merging = set()
+        self.merge_executor = None
+        self.lst_merge_futures = []
+
+    def index(self, term:str, doc_id:int, term_freq:int):
+        if self.active_segment is None:
+            self.active_segment = self.new_segment_index()
+        elif self.segment_max_docs is not None and doc_id not in self.active_segment.set_documents \
+                and self.active_segment.document_count >= self.segment_max_docs:
+            self.flush_segment()
+            self.active_segment = self.new_segment_index()
+        if term not in self.dic_index:
+            self.dic_index[term] = self.create_index_entry(len(self.dic_index))
+        self.active_segment.index(term, doc_id, term_freq)
+        self.set_documents.add(doc_id)
+
+    def new_segment_index(self) -> Index:
+        segment_index = self.segment_factory()
+        #as normas dependem do df global: as estatísticas dos documentos são mantidas em DocumentStats
+        segment_index.store_doc_stats = False
+        return segment_index
+
+    def get_term_id(self, term:str):
+        return self.dic_index[term].term_id
+
+    def create_index_entry(self, term_id:int) -> TermFilePosition:
+        #df do termo nos segmentos finalizados
+        return TermFilePosition(term_id, None, 0)
+
+    def add_index_occur(self, entry_dic_index, doc_id:int, term_id:int, term_freq:int):
+        raise NotImplementedError("As ocorrências são adicionadas ao segmento ativo (ver index)")
+
+    def document_count_with_term(self, term:str) -> int:
+        entry = self.dic_index.get(term)
+        return 0 if entry is None else entry.doc_count_with_term
+
+    def get_occurrence_list(self, term:str) -> TermPostings:
+        entry = self.dic_index.get(term)
+        if entry is None:
+            return []
+        arr_doc_ids, arr_term_freqs = [], []
+        lst_segments = self.acquire_segments()
+        try:
+            for segment in lst_segments:
+                doc_ids, term_freqs = postings_columns(segment.index.get_occurrence_list(term))
+                if len(doc_ids) > 0:
+                    arr_doc_ids.append(doc_ids)
+                    arr_term_freqs.append(term_freqs)
+        finally:
+            self.release_segments()
+        if not arr_doc_ids:
+            return TermPostings(entry.term_id, np.zeros(0, dtype=np.uint32), np.zeros(0, dtype=np.uint32))
+        #cópias (concatenate): as ocorrências retornadas não dependem dos arquivos dos segmentos
+        doc_ids, term_freqs = np.concatenate(arr_doc_ids), np.concatenate(arr_term_freqs)
+        if len(arr_doc_ids) > 1:
+            order = np.argsort(doc_ids, kind="stable")
+            doc_ids, term_freqs = doc_ids[order], term_freqs[order]
+        return TermPostings(entry.term_id, doc_ids.astype(np.uint32), term_freqs.astype(np.uint32))
+
+    def finish_indexing(self):
+        self.flush_segment()
+
+    def flush_segment(self):
+        """
+        Finaliza o segmento ativo e o adiciona aos segmentos pesquisados. O df dos seus termos é somado ao df global
+        e as estatísticas dos demais segmentos são atualizadas apenas nos documentos desses termos
+        """
+        segment_index, self.active_segment = self.active_segment, None
+        if segment_index is None or segment_index.document_count == 0:
+            return
+        segment_index.finish_indexing()
+        with self.segments_lock:
+            dic_log_dfs = {}
+            for term in segment_index.vocabulary:
+                segment_df = segment_index.document_count_with_term(term)
+                if segment_df == 0:
+                    continue
+                entry = self.dic_index[term]
+                if entry.doc_count_with_term > 0:
+                    dic_log_dfs[term] = (math.log2(entry.doc_count_with_term),
+                                         math.log2(entry.doc_count_with_term+segment_df))
+                entry.doc_count_with_term += segment_df
+            for segment in self.lst_segments:
+                segment.stats.add_terms(segment.index, dic_log_dfs)
+            stats = DocumentStats.from_index(segment_index, self.document_count_with_term)
+            self.lst_segments = self.lst_segments + [Segment(segment_index, stats)]
+        self.merge_segments()
+
+    def compact(self):
+        """
+        Finaliza o segmento ativo e remove dos segmentos as ocorrências dos documentos excluídos.
+        O df dos termos é reduzido e as estatísticas dos documentos que possuem esses termos são atualizadas.
+        Os termos sem ocorrências permanecem no vocabulário (com df 0), mantendo os term_id globais
+        """
+        self.flush_segment()
+        self.wait_merges()
+        if not self.has_deletions:
+            return
+        deleted_doc_ids = self.live_docs.deleted_doc_ids()
+        with self.segments_lock:
+            dic_old_dfs = {term:entry.doc_count_with_term for term, entry in self.dic_index.items()}
+            lst_segments = []
+            for segment in self.lst_segments:
+                segment_deleted = deleted_doc_ids[np.isin(deleted_doc_ids, segment.stats.doc_ids)]
+                if len(segment_deleted) > 0:
+                    self.compact_segment(segment, segment_deleted.tolist())
+                if segment.document_count > 0:
+                    lst_segments.append(segment)
+                else:
+                    self.lst_retired_segments.append(segment)
+            dic_log_dfs = {term:(math.log2(old_df), math.log2(self.dic_index[term].doc_count_with_term))
+                           for term, old_df in dic_old_dfs.items()
+                           if 0 < self.dic_index[term].doc_count_with_term != old_df}
+            for segment in lst_segments:
+                segment.stats.add_terms(segment.index, dic_log_dfs)
+            self.lst_segments = lst_segments
+            lst_retired = self.pop_retired_segments()
+        self.remove_segment_files(lst_retired)
+        self.remove_deleted_documents()
+
+    def compact_segment(self, segment:Segment, lst_deleted:List[int]):
+        dic_segment_dfs = {term:segment.index.document_count_with_term(term) for term in segment.index.vocabulary}
+        for doc_id in lst_deleted:
+            segment.index.delete_document(doc_id)
+        segment.index.compact()
+        for term, segment_df in dic_segment_dfs.items():
+            self.dic_index[term].doc_count_with_term -= segment_df-segment.index.document_count_with_term(term)
+        stats = segment.stats
+        mask = self.live_docs.live_mask(stats.doc_ids)
+        segment.stats = DocumentStats(stats.doc_ids[mask], *[column[mask] for column in stats.columns()])
+
+    def acquire_segments(self) -> List[Segment]:
+        """
+        Segmentos vigentes, para uma consulta. Os arquivos dos segmentos substituídos enquanto a consulta está em
+        andamento são mantidos até o release_segments
+        """
+        with self.segments_lock:
+            self.int_readers += 1
+            return self.lst_segments
+
+    def release_segments(self):
+        with self.segments_lock:
+            self.int_readers -= 1
+            lst_retired = self.pop_retired_segments()
+        self.remove_segment_files(lst_retired)
+
+    def pop_retired_segments(self) -> List[Segment]:
+        #chamado com o segments_lock: segmentos substituídos que não podem mais ser lidos por nenhuma consulta
+        if self.int_readers > 0:
+            return []
+        lst_retired, self.lst_retired_segments = self.lst_retired_segments, []
+        return lst_retired
+
+    @staticmethod
+    def remove_segment_files(lst_segments:List[Segment]):
+        for segment in lst_segments:
+            segment.index.remove_files()
+
+    @property
+    def searchable_document_count(self) -> int:
+        #documentos dos segmentos finalizados (os do segmento ativo ainda não são pesquisados nem possuem df)
+        with self.segments_lock:
+            return sum(segment.document_count for segment in self.lst_segments)
+
+    def document_stats(self) -> DocumentStats:
+        """
+        Estatísticas combinadas dos documentos de todos os segmentos finalizados
+        """
+        with self.segments_lock:
+            return DocumentStats.combine([segment.stats for segment in self.lst_segments])
+
+    def merge_segments(self):
+        """
+        Intercala os grupos de segmentos escolhidos pela merge_policy (em segundo plano, caso background_merge)
+        """
+        with self.segments_lock:
+            lst_merges = self.merge_policy.find_merges([segment for segment in self.lst_segments
+                                                        if segment not in self.set_merging])
+            for lst_group in lst_merges:
+                self.set_merging.update(lst_group)
+        for lst_group in lst_merges:
+            if self.background_merge:
+                if self.merge_executor is None:
+                    self.merge_executor = ThreadPoolExecutor(max_workers=1)
+                self.lst_merge_futures.append(self.merge_executor.submit(self.merge_group, lst_group))
+            else:
+                self.merge_group(lst_group)
+
+    def merge_group(self, lst_group:List[Segment]):
+        merged_index = self.merge_indexes([segment.index for segment in lst_group])
+        with self.segments_lock:
+            #as estatísticas são combinadas apenas agora: podem ter sido atualizadas durante o merge
+            stats = DocumentStats.combine([segment.stats for segment in lst_group])
+            self.lst_segments = [segment for segment in self.lst_segments if segment not in lst_group] + \
+                                [Segment(merged_index, stats)]
+            self.set_merging.difference_update(lst_group)
+            self.lst_retired_segments.extend(lst_group)
+            lst_retired = self.pop_retired_segments()
+        self.remove_segment_files(lst_retired)
+        #o novo segmento pode completar um nível
+        self.merge_segments()
+
+    def merge_indexes(self, lst_indexes:List[Index]) -> Index:
+        """
+        Novo índice (segment_factory) com as ocorrências dos índices informados, indexadas documento a documento
+        """
+        dic_term_pos = {}
+        arr_term_pos, arr_doc_ids, arr_term_freqs = [], [], []
+        for index in lst_indexes:
+            for term, occurrences in index.iter_postings():
+                doc_ids, term_freqs = postings_columns(occurrences)
+                term_pos = dic_term_pos.setdefault(term, len(dic_term_pos))
+                arr_term_pos.append(np.full(len(doc_ids), term_pos, dtype=np.int64))
+                arr_doc_ids.append(doc_ids)
+                arr_term_freqs.append(term_freqs)
+        merged_index = self.new_segment_index()
+        if arr_doc_ids:
+            lst_terms = list(dic_term_pos.keys())
+            term_pos, doc_ids, term_freqs = (np.concatenate(arr_term_pos), np.concatenate(arr_doc_ids),
+                                            np.concatenate(arr_term_freqs))
+            order = np.lexsort((term_pos, doc_ids))
+            for pos, doc_id, term_freq in zip(term_pos[order].tolist(), doc_ids[order].tolist(),
+                                              term_freqs[order].tolist()):
+                merged_index.index(lst_terms[pos], doc_id, term_freq)
+        merged_index.finish_indexing()
+        return merged_index
+
+    def wait_merges(self):
+        """
+        Aguarda os merges em segundo plano. Caso algum tenha falhado, a exceção é lançada aqui
+        """
+        while self.lst_merge_futures:
+            self.lst_merge_futures.pop(0).result()
+
+    def __getstate__(self):
+        self.wait_merges()
+        state = self.__dict__.copy()
+        state["segments_lock"] = None
+        state["merge_executor"] = None
+        state["lst_merge_futures"] = []
+        #os arquivos dos segmentos substituídos pertencem ao índice original
+        state["int_readers"] = 0
+        state["lst_retired_segments"] = []
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.segments_lock = threading.Lock()
+        self.__dict__.setdefault("live_docs", LiveDocs())
+        self.__dict__.setdefault("int_readers", 0)
+        self.__dict__.setdefault("lst_retired_segments", [])
@@ -0,0 +1,167 @@
+from index.segments import *
+from index.structure import HashIndex, FileIndex
+from functools import partial
+import unittest
+import math
+import os
+
+
+class SegmentedIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.lst_indexes = []
+
+    def tearDown(self):
+        #arquivos de ocorrências dos segmentos FileIndex
+        for index in self.lst_indexes:
+            index.wait_merges()
+            for segment in index.lst_segments:
+                segment.index.close_reader()
+                for str_file in segment.index.lst_run_files:
+                    if os.path.exists(str_file):
+                        os.remove(str_file)
+
+    def index_docs(self, index, lst_doc_ids):
+        for doc_id in lst_doc_ids:
+            for term in range(doc_id%7, 30, 3):
+                index.index(f"termo{term}", doc_id, doc_id%5+1)
+
+    def build(self, index, int_docs:int=60, int_segment_docs:int=10):
+        #cada finish_indexing cria um novo segmento
+        for start in range(0, int_docs, int_segment_docs):
+            self.index_docs(index, range(start, min(start+int_segment_docs, int_docs)))
+            index.finish_indexing()
+        return index
+
+    def expected_norms(self, expected:HashIndex) -> dict:
+        dic_norm_sq = {}
+        for term in expected.vocabulary:
+            idf = math.log2(expected.document_count/expected.document_count_with_term(term))
+            for occur in expected.get_occurrence_list(term):
+                weight = (1+math.log2(occur.term_freq))*idf
+                dic_norm_sq[occur.doc_id] = dic_norm_sq.get(occur.doc_id, 0)+weight*weight
+        return {doc_id:math.sqrt(norm_sq) for doc_id, norm_sq in dic_norm_sq.items()}
+
+    def check_same(self, index:SegmentedIndex, int_docs:int=60):
+        expected = HashIndex()
+        self.index_docs(expected, range(int_docs))
+        expected.finish_indexing()
+        self.assertEqual(index.document_count, expected.document_count)
+        self.assertCountEqual(index.vocabulary, expected.vocabulary)
+        for term in expected.vocabulary:
+            self.assertEqual(index.document_count_with_term(term), expected.document_count_with_term(term))
+            self.assertListEqual([(occur.doc_id, occur.term_freq) for occur in index.get_occurrence_list(term)],
+                                 [(occur.doc_id, occur.term_freq) for occur in expected.get_occurrence_list(term)])
+
+        stats = index.document_stats()
+        dic_expected_norms = self.expected_norms(expected)
+        self.assertListEqual(stats.doc_ids.tolist(), sorted(dic_expected_norms))
+        for doc_id, norm in zip(stats.doc_ids.tolist(), stats.norms(index.document_count).tolist()):
+            self.assertAlmostEqual(norm, dic_expected_norms[doc_id], places=7)
+        table = stats.table(index.document_count)
+        self.assertListEqual(table.lengths.tolist(), expected.doc_stats.lengths.tolist())
+        self.assertListEqual(table.unique_terms.tolist(), expected.doc_stats.unique_terms.tolist())
+
+    def test_search_all_segments(self):
+        index = self.build(SegmentedIndex(merge_policy=TieredMergePolicy(merge_factor=100), background_merge=False))
+        self.assertEqual(len(index.lst_segments), 6)
+        self.check_same(index)
+        #o term_id é o mesmo em todos os segmentos
+        self.assertListEqual([occur.term_id for occur in index.get_occurrence_list("termo3")],
+                             [index.get_term_id("termo3")]*index.document_count_with_term("termo3"))
+
+    def test_incremental_segment(self):
+        index = self.build(SegmentedIndex(merge_policy=TieredMergePolicy(merge_factor=100), background_merge=False))
+        #novos documentos: apenas um novo segmento é criado
+        self.index_docs(index, range(60, 65))
+        index.finish_indexing()
+        self.assertEqual(len(index.lst_segments), 7)
+        self.check_same(index, 65)
+
+    def test_segment_max_docs(self):
+        index = SegmentedIndex(merge_policy=TieredMergePolicy(merge_factor=100), background_merge=False,
+                               segment_max_docs=8)
+        self.index_docs(index, range(60))
+        index.finish_indexing()
+        self.assertEqual(len(index.lst_segments), 8)
+        self.check_same(index)
+
+    def test_tiered_merge(self):
+        for background_merge in [False, True]:
+            policy = TieredMergePolicy(merge_factor=3, min_segment_docs=5)
+            index = self.build(SegmentedIndex(merge_policy=policy, background_merge=background_merge), 60, 5)
+            index.wait_merges()
+            #12 segmentos de 5 documentos: 4 do nível 1 (15 documentos), dos quais 3 formam um do nível 2
+            self.assertCountEqual([segment.document_count for segment in index.lst_segments], [45, 15])
+            self.assertEqual(len(policy.find_merges(index.lst_segments)), 0)
+            self.check_same(index)
+
+    @staticmethod
+    def occurrence_files() -> set:
+        return {str_file for str_file in os.listdir(".") if str_file.startswith("occur_")}
+
+    def file_segments_index(self, background_merge:bool=True) -> SegmentedIndex:
+        index = SegmentedIndex(segment_factory=partial(FileIndex, tmp_occurrences_limit_bytes=120),
+                               merge_policy=TieredMergePolicy(merge_factor=3, min_segment_docs=5),
+                               background_merge=background_merge)
+        self.lst_indexes.append(index)
+        return index
+
+    def check_no_orphan_files(self, index:SegmentedIndex, set_previous_files:set):
+        #apenas os arquivos dos segmentos vigentes permanecem
+        set_segment_files = {str_file for segment in index.lst_segments for str_file in segment.index.lst_run_files}
+        self.assertSetEqual(self.occurrence_files()-set_previous_files, set_segment_files)
+
+    def test_file_segments(self):
+        #os runs do segmento ativo e dos merges em segundo plano são gravados no mesmo diretório
+        for background_merge in [True, True, True, False]:
+            set_previous_files = self.occurrence_files()
+            index = self.build(self.file_segments_index(background_merge), 60, 5)
+            index.wait_merges()
+            self.assertCountEqual([segment.document_count for segment in index.lst_segments], [45, 15])
+            self.check_same(index)
+            self.check_no_orphan_files(index, set_previous_files)
+
+    def test_retired_segment_files(self):
+        set_previous_files = self.occurrence_files()
+        index = self.build(self.file_segments_index(background_merge=False), 10, 5)
+        lst_old_segments = index.acquire_segments()
+        #o merge ocorre durante uma consulta: os arquivos dos segmentos intercalados são mantidos até o seu fim
+        self.index_docs(index, range(10, 15))
+        index.finish_indexing()
+        self.assertEqual(len(index.lst_segments), 1)
+        lst_old_files = [str_file for segment in lst_old_segments for str_file in segment.index.lst_run_files]
+        self.assertEqual(len(lst_old_files), 2)
+        self.assertTrue(all(os.path.exists(str_file) for str_file in lst_old_files))
+        index.release_segments()
+        self.check_no_orphan_files(index, set_previous_files)
+
+    def test_compact(self):
+        index = self.build(SegmentedIndex(merge_policy=TieredMergePolicy(merge_factor=100), background_merge=False))
+        #segmento 1 inteiro (documentos 10 a 19) e parte do segmento 3
+        set_deleted = set(range(10, 20)) | {33, 34}
+        for doc_id in set_deleted:
+            self.assertTrue(index.delete_document(doc_id))
+        self.assertNotIn(33, index.live_occurrences(index.get_occurrence_list("termo5")).doc_ids.tolist())
+        index.compact()
+        self.assertEqual(len(index.lst_segments), 5)
+
+        expected = HashIndex()
+        self.index_docs(expected, [doc_id for doc_id in range(60) if doc_id not in set_deleted])
+        self.assertEqual(index.document_count, expected.document_count)
+        for term in expected.vocabulary:
+            self.assertEqual(index.document_count_with_term(term), expected.document_count_with_term(term))
+            self.assertListEqual([(occur.doc_id, occur.term_freq) for occur in index.get_occurrence_list(term)],
+                                 [(occur.doc_id, occur.term_freq) for occur in expected.get_occurrence_list(term)])
+        stats = index.document_stats()
+        dic_expected_norms = self.expected_norms(expected)
+        self.assertListEqual(stats.doc_ids.tolist(), sorted(dic_expected_norms))
+        for doc_id, norm in zip(stats.doc_ids.tolist(), stats.norms(index.document_count).tolist()):
+            self.assertAlmostEqual(norm, dic_expected_norms[doc_id], places=7)
+
+    def test_merge_policy(self):
+        policy = TieredMergePolicy(merge_factor=10, min_segment_docs=100)
+        self.assertListEqual([policy.tier(doc_count) for doc_count in [1, 100, 999, 1000, 10000]], [0, 0, 0, 1, 2])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,338 @@
+"""
+Formato binário (versionado) do índice em disco.
+
+O índice é gravado em um diretório com os seguintes arquivos (inteiros big-endian):
+
+    header     magic (8 bytes: b"RIIDX\\0\\0\\0"), versão (u16), tipo do índice (u16: 1=HashIndex, 2=FileIndex),
+               layout das ocorrências (u32), num. de termos (u64), num. de documentos (u64), num. de ocorrências (u64)
+    lexicon    vocabulário congelado (FrozenLexicon), com os termos em ordem: num. de blocos (u64), tamanho do
+               texto (u64), posição de cada bloco no texto (u64), term_id (u32), doc_count_with_term (u32) e
+               offset (u64) de cada termo, seguidos do texto dos termos (UTF-8, front coding por bloco)
+    postings   LAYOUT_COLUMNS: coluna de doc_ids (u32) seguida da coluna de term_freqs (u32), agrupadas por termo
+               LAYOUT_RECORDS: registros de 12 bytes (doc_id, term_id, term_freq) - o arquivo do FileIndex
+               LAYOUT_VBYTE/LAYOUT_PACKED: arquivo do FileIndex compactado (ver index/compression.py)
+    documents  ids dos documentos (u32), ordenados
+    skips      (opcional, apenas FileIndex) entradas de salto dos blocos de ocorrências (codec.SKIP_DTYPE)
+    deleted    (opcional) bitmap dos documentos excluídos e ainda não removidos pelo compact (ver index/live_docs.py)
+    doc_stats.npy, doc_ordinals.npy
+               (opcional) estatísticas por documento e mapa doc_id -> ordinal, no formato .npy do NumPy
+               (ver index/doc_stats.py). Índices gravados sem esses arquivos as calculam ao serem consultados
+    term_idfs.npy, impact_*.npy
+               (opcional) idf de cada termo e listas de impacto (ver index/impacts.py), no formato .npy
+
+O offset do lexicon é a posição (em ocorrências, não em bytes) da primeira ocorrência do termo.
+A gravação é feita em um diretório temporário que, ao final, substitui o anterior; a leitura mapeia
+as ocorrências e as estatísticas dos documentos em memória (são lidas do disco apenas quando acessadas).
+"""
+from index.structure import Index, HashIndex, FileIndex, TermFilePosition
+from index.lexicon import FrozenLexicon
+from index.codec import RECORD_SIZE, SKIP_DTYPE
+from index.live_docs import LiveDocs
+from index.doc_stats import DocumentStatsTable
+from index.impacts import TermImpacts
+import numpy as np
+import pickle
+import shutil
+import struct
+import sys
+import os
+
+MAGIC = b"RIIDX\0\0\0"
+FORMAT_VERSION = 1
+
+KIND_HASH = 1
+KIND_FILE = 2
+
+LAYOUT_COLUMNS = 1
+LAYOUT_RECORDS = 2
+LAYOUT_VBYTE = 3
+LAYOUT_PACKED = 4
+#layout do arquivo compactado de cada codec
+CODEC_LAYOUTS = {"vbyte":LAYOUT_VBYTE, "packed":LAYOUT_PACKED}
+
+HEADER = struct.Struct(">8sHHIQQQ")
+LEXICON_COUNTS = struct.Struct(">QQ")
+
+HEADER_FILE = "header"
+LEXICON_FILE = "lexicon"
+POSTINGS_FILE = "postings"
+DOCUMENTS_FILE = "documents"
+SKIPS_FILE = "skips"
+DELETED_FILE = "deleted"
+
+
+class IndexHeader:
+    def __init__(self, kind:int, postings_layout:int, num_terms:int, num_documents:int, num_postings:int,
+                 version:int=FORMAT_VERSION):
+        self.version = version
+        self.kind = kind
+        self.postings_layout = postings_layout
+        self.num_terms = num_terms
+        self.num_documents = num_documents
+        self.num_postings = num_postings
+
+    def to_bytes(self) -> bytes:
+        return HEADER.pack(MAGIC, self.version, self.kind, self.postings_layout,
+                           self.num_terms, self.num_documents, self.num_postings)
+
+    @staticmethod
+    def from_bytes(header_bytes:bytes) -> "IndexHeader":
+        if len(header_bytes) != HEADER.size:
+            raise ValueError("Cabeçalho do índice incompleto")
+        magic, version, kind, postings_layout, num_terms, num_documents, num_postings = HEADER.unpack(header_bytes)
+        if magic != MAGIC:
+            raise ValueError("O arquivo não é um índice no formato binário")
+        if version > FORMAT_VERSION:
+            raise ValueError(f"Versão {version} do formato não suportada (máxima: {FORMAT_VERSION})")
+        return IndexHeader(kind, postings_layout, num_terms, num_documents, num_postings, version)
+
+
+def is_binary_index(str_path:str) -> bool:
+    str_header = os.path.join(str_path, HEADER_FILE)
+    if not os.path.isfile(str_header):
+        return False
+    with open(str_header, "rb") as header_file:
+        return header_file.read(len(MAGIC)) == MAGIC
+
+
+def write_index(index:Index, str_path:str):
+    """
+    Grava o índice (HashIndex ou FileIndex já finalizado) no diretório str_path. Caso str_path exista, ele deve
+    ser um índice no formato binário (outros arquivos e diretórios não são sobrescritos)
+    """
+    if os.path.exists(str_path) and not is_binary_index(str_path):
+        raise ValueError(f"{str_path} existe e não é um índice no formato binário: o índice não será gravado")
+    str_tmp_path = f"{str_path}.tmp"
+    if os.path.exists(str_tmp_path):
+        shutil.rmtree(str_tmp_path)
+    os.makedirs(str_tmp_path)
+
+    if isinstance(index, HashIndex):
+        header, lexicon, offset_unit = write_hash_postings(index, str_tmp_path)
+    elif isinstance(index, FileIndex):
+        header, lexicon, offset_unit = write_file_postings(index, str_tmp_path)
+    else:
+        raise TypeError(f"Tipo de índice não suportado: {type(index).__name__}")
+
+    write_lexicon(os.path.join(str_tmp_path, LEXICON_FILE), lexicon, offset_unit)
+
+    documents = np.array(sorted(index.set_documents), dtype=">u4")
+    write_file(os.path.join(str_tmp_path, DOCUMENTS_FILE), documents.tobytes())
+    header.num_documents = len(documents)
+    if index.has_deletions:
+        write_file(os.path.join(str_tmp_path, DELETED_FILE), index.live_docs.bits.tobytes())
+    if index.doc_stats is None:
+        #ex.: índice antigo lido via pickle
+        index.compute_stats()
+    if index.doc_stats is not None:
+        index.doc_stats.save(str_tmp_path)
+    if index.term_impacts is not None:
+        index.term_impacts.save(str_tmp_path)
+    #o cabeçalho é gravado por ultimo: um diretório sem cabeçalho não é um índice válido
+    write_file(os.path.join(str_tmp_path, HEADER_FILE), header.to_bytes())
+
+    replace_dir(str_tmp_path, str_path)
+
+
+def write_hash_postings(index:HashIndex, str_path:str) -> (IndexHeader, FrozenLexicon, int):
+    if not isinstance(index.dic_index, FrozenLexicon):
+        index.finish_indexing()
+
+    with open(os.path.join(str_path, POSTINGS_FILE), "wb") as postings_file:
+        postings_file.write(index.postings_doc_ids.astype(">u4").tobytes())
+        postings_file.write(index.postings_term_freqs.astype(">u4").tobytes())
+        sync_file(postings_file)
+
+    header = IndexHeader(KIND_HASH, LAYOUT_COLUMNS, len(index.dic_index), 0, int(index.postings_offsets[-1]))
+    return header, index.dic_index, 1
+
+
+def write_file_postings(index:FileIndex, str_path:str) -> (IndexHeader, FrozenLexicon, int):
+    if index.get_tmp_occur_size() > 0 or len(index.lst_run_files) > 1:
+        raise ValueError("O FileIndex deve ser finalizado (finish_indexing) antes de ser gravado")
+    if not isinstance(index.dic_index, FrozenLexicon):
+        #ex.: índice antigo lido via pickle
+        index.freeze_dic_index()
+
+    str_postings = os.path.join(str_path, POSTINGS_FILE)
+    if len(index.dic_index) > 0:
+        shutil.copyfile(index.str_idx_file_name, str_postings)
+    else:
+        open(str_postings, "wb").close()
+    if index.skip_entries is not None:
+        write_file(os.path.join(str_path, SKIPS_FILE), index.skip_entries.astype(SKIP_DTYPE).tobytes())
+
+    if index.postings_codec is None:
+        header = IndexHeader(KIND_FILE, LAYOUT_RECORDS, len(index.dic_index), 0,
+                             os.path.getsize(str_postings)//RECORD_SIZE)
+    else:
+        header = IndexHeader(KIND_FILE, CODEC_LAYOUTS[index.postings_codec], len(index.dic_index), 0,
+                             int(index.dic_index.doc_counts.sum()))
+    #o FileIndex guarda o offset em bytes; no arquivo de registros, o lexicon guarda a posição em registros
+    return header, index.dic_index, RECORD_SIZE if index.postings_codec is None else 1
+
+
+def write_lexicon(str_file:str, lexicon:FrozenLexicon, offset_unit:int):
+    with open(str_file, "wb") as lexicon_file:
+        lexicon_file.write(LEXICON_COUNTS.pack(len(lexicon.block_offsets), len(lexicon.blob)))
+        lexicon_file.write(lexicon.block_offsets.astype(">u8").tobytes())
+        lexicon_file.write(lexicon.term_ids.astype(">u4").tobytes())
+        lexicon_file.write(lexicon.doc_counts.astype(">u4").tobytes())
+        lexicon_file.write((lexicon.offsets//offset_unit).astype(">u8").tobytes())
+        lexicon_file.write(lexicon.blob)
+        sync_file(lexicon_file)
+
+
+def read_lexicon(str_file:str, header:IndexHeader, offset_unit:int) -> FrozenLexicon:
+    num_terms = header.num_terms
+    with open(str_file, "rb") as lexicon_file:
+        num_blocks, blob_size = LEXICON_COUNTS.unpack(lexicon_file.read(LEXICON_COUNTS.size))
+        block_offsets = np.frombuffer(lexicon_file.read(num_blocks*8), dtype=">u8")
+        term_ids = np.frombuffer(lexicon_file.read(num_terms*4), dtype=">u4")
+        doc_counts = np.frombuffer(lexicon_file.read(num_terms*4), dtype=">u4")
+        offsets = np.frombuffer(lexicon_file.read(num_terms*8), dtype=">u8").astype(np.int64)*offset_unit
+        blob = lexicon_file.read(blob_size)
+    return FrozenLexicon.from_arrays(blob, block_offsets, term_ids, offsets, doc_counts, TermFilePosition)
+
+
+def recover_path(str_path:str) -> str:
+    """
+    Diretório do índice gravado em str_path: caso a troca do replace_dir tenha sido interrompida após o índice
+    anterior ser renomeado, ele é lido de str_path.old
+    """
+    str_old_path = f"{str_path}.old"
+    if not os.path.exists(str_path) and is_binary_index(str_old_path):
+        return str_old_path
+    return str_path
+
+
+def read_index(str_path:str) -> Index:
+    """
+    Lê um índice gravado por write_index. As ocorrências não são carregadas: são mapeadas em memória
+    (HashIndex) ou lidas do arquivo postings sob demanda (FileIndex)
+    """
+    str_path = recover_path(str_path)
+    with open(os.path.join(str_path, HEADER_FILE), "rb") as header_file:
+        header = IndexHeader.from_bytes(header_file.read(HEADER.size))
+
+    offset_unit = RECORD_SIZE if header.postings_layout == LAYOUT_RECORDS else 1
+    lexicon = read_lexicon(os.path.join(str_path, LEXICON_FILE), header, offset_unit)
+    str_documents = os.path.join(str_path, DOCUMENTS_FILE)
+    documents = np.fromfile(str_documents, dtype=">u4", count=header.num_documents)
+    str_postings = os.path.join(str_path, POSTINGS_FILE)
+
+    if header.kind == KIND_HASH:
+        index = HashIndex()
+        index.postings_offsets = np.zeros(header.num_terms+1, dtype=np.int64)
+        index.postings_offsets[lexicon.term_ids.astype(np.int64)] = lexicon.offsets
+        index.postings_offsets[-1] = header.num_postings
+        if header.num_postings > 0:
+            postings = np.memmap(str_postings, dtype=">u4", mode="r", shape=(2, header.num_postings))
+            index.postings_doc_ids, index.postings_term_freqs = postings[0], postings[1]
+        else:
+            index.postings_doc_ids = np.zeros(0, dtype=np.uint32)
+            index.postings_term_freqs = np.zeros(0, dtype=np.uint32)
+        index.dic_index = lexicon
+    elif header.kind == KIND_FILE:
+        index = FileIndex()
+        index.dic_index = lexicon
+        str_skips = os.path.join(str_path, SKIPS_FILE)
+        if os.path.exists(str_skips):
+            index.skip_entries = np.fromfile(str_skips, dtype=SKIP_DTYPE)
+        #o arquivo postings é o arquivo final de ocorrências (somente leitura)
+        index.str_idx_file_name = str_postings
+        index.postings_file_size = os.path.getsize(str_postings)
+        for codec_name, layout in CODEC_LAYOUTS.items():
+            if header.postings_layout == layout:
+                index.postings_codec = codec_name
+                index.compressed_file = str_postings
+    else:
+        raise ValueError(f"Tipo de índice desconhecido: {header.kind}")
+
+    index.set_documents = set(documents.tolist())
+    str_deleted = os.path.join(str_path, DELETED_FILE)
+    if os.path.exists(str_deleted):
+        index.live_docs = LiveDocs(np.fromfile(str_deleted, dtype=np.uint8))
+    if DocumentStatsTable.exists(str_path):
+        index.doc_stats = DocumentStatsTable.load(str_path)
+    if TermImpacts.exists(str_path):
+        index.term_impacts = TermImpacts.load(str_path)
+    return index
+
+
+def write_file(str_file:str, content:bytes):
+    with open(str_file, "wb") as out_file:
+        out_file.write(content)
+        sync_file(out_file)
+
+
+def sync_file(out_file):
+    out_file.flush()
+    os.fsync(out_file.fileno())
+
+
+def replace_dir(str_new_path:str, str_path:str):
+    """
+    Substitui str_path por str_new_path. O índice anterior só é excluído após a troca
+    """
+    str_old_path = f"{str_path}.old"
+    if os.path.exists(str_old_path):
+        if os.path.exists(str_path):
+            remove_path(str_old_path)
+        else:
+            #troca anterior interrompida: o índice anterior volta para str_path até a nova troca
+            os.replace(str_old_path, str_path)
+    if os.path.exists(str_path):
+        os.replace(str_path, str_old_path)
+    os.replace(str_new_path, str_path)
+    if os.path.exists(str_old_path):
+        remove_path(str_old_path)
+
+
+def remove_path(str_path:str):
+    if os.path.isdir(str_path):
+        shutil.rmtree(str_path)
+    else:
+        os.remove(str_path)
+
+
+def pickle_to_binary(str_pickle:str, str_path:str):
+    """
+    Converte um índice serializado com pickle para o formato binário
+    """
+    with open(str_pickle, "rb") as arquivo:
+        index = pickle.load(arquivo)
+    write_index(index, str_path)
+
+
+def binary_to_pickle(str_path:str, str_pickle:str):
+    """
+    Converte um índice no formato binário para o formato antigo (pickle)
+    """
+    index = read_index(str_path)
+    if index.doc_stats is not None:
+        index.doc_stats = index.doc_stats.copy()
+    if index.term_impacts is not None:
+        index.term_impacts = index.term_impacts.copy()
+    if isinstance(index, HashIndex):
+        #as ocorrências mapeadas em memória são copiadas para serem serializadas
+        index.postings_doc_ids = np.array(index.postings_doc_ids, dtype=np.uint32)
+        index.postings_term_freqs = np.array(index.postings_term_freqs, dtype=np.uint32)
+    else:
+        #o FileIndex serializado referencia um arquivo de ocorrências ao lado do pickle
+        index.str_idx_file_name = f"{str_pickle}.occur"
+        index.lst_run_files = [index.str_idx_file_name]
+        shutil.copyfile(os.path.join(str_path, POSTINGS_FILE), index.str_idx_file_name)
+    with open(str_pickle, "wb") as arquivo:
+        pickle.dump(index, arquivo)
+
+
+if __name__ == "__main__":
+    #ex.: python -m index.storage to-binary wiki_hash.idx wiki_hash.bin
+    if len(sys.argv) != 4 or sys.argv[1] not in ("to-binary", "to-pickle"):
+        print("Uso: python -m index.storage [to-binary|to-pickle] <origem> <destino>")
+        sys.exit(1)
+    if sys.argv[1] == "to-binary":
+        pickle_to_binary(sys.argv[2], sys.argv[3])
+    else:
+        binary_to_pickle(sys.argv[2], sys.argv[3])
@@ -0,0 +1,224 @@
+from index.storage import *
+from index.structure import *
+from index.doc_stats import DOC_STATS_FILE, DOC_ORDINALS_FILE
+from index.postings import postings_columns
+from index.impacts import IDFS_FILE
+from index.index_structure_test import StructureTest
+import unittest
+import pickle
+import copyreg
+import shutil
+import os
+
+
+class BaselinePickle:
+    #serializado como um objeto do código original: FileIndex com apenas os atributos de state
+    def __init__(self, state:dict):
+        self.state = state
+
+    def __reduce__(self):
+        return copyreg._reconstructor, (FileIndex, object, None), self.state
+
+
+class StorageTest(unittest.TestCase):
+    PATH = "storage_test.idx"
+
+    def setUp(self):
+        self.index = HashIndex()
+        StructureTest.create_terms(self)
+
+    def tearDown(self):
+        StructureTest.tearDown(self)
+        for str_path in [StorageTest.PATH, f"{StorageTest.PATH}.old", f"{StorageTest.PATH}.pickle",
+                         f"{StorageTest.PATH}.pickle.occur"]:
+            if os.path.isdir(str_path):
+                shutil.rmtree(str_path)
+            elif os.path.exists(str_path):
+                os.remove(str_path)
+
+    def check_index(self, index, expected_type):
+        self.assertIsInstance(index, expected_type)
+        self.assertEqual(index.document_count, 3)
+        self.assertCountEqual(index.vocabulary, ["casa","vermelho","verde"])
+        for term in ["casa","vermelho","verde"]:
+            self.assertEqual(index.get_term_id(term), self.index.get_term_id(term))
+            self.assertEqual(index.document_count_with_term(term), self.index.document_count_with_term(term))
+            self.assertListEqual([(occur.doc_id, occur.term_freq) for occur in index.get_occurrence_list(term)],
+                                 [(occur.doc_id, occur.term_freq) for occur in self.index.get_occurrence_list(term)])
+        self.index.finish_indexing()
+        self.assertListEqual(index.doc_stats.records.tolist(), self.index.doc_stats.records.tolist())
+
+    def test_hash_index(self):
+        self.index.write(StorageTest.PATH)
+        self.assertTrue(is_binary_index(StorageTest.PATH))
+        self.assertCountEqual(os.listdir(StorageTest.PATH), [HEADER_FILE, LEXICON_FILE, POSTINGS_FILE, DOCUMENTS_FILE,
+                                                             DOC_STATS_FILE, DOC_ORDINALS_FILE, IDFS_FILE])
+        #6 ocorrências: doc_id e term_freq com 4 bytes cada
+        self.assertEqual(os.path.getsize(os.path.join(StorageTest.PATH, POSTINGS_FILE)), 6*8)
+        index = Index.read(StorageTest.PATH)
+        self.check_index(index, HashIndex)
+        #estatísticas dos documentos mapeadas em memória
+        self.assertIsInstance(index.doc_stats.records, np.memmap)
+
+    def test_file_index(self):
+        self.index = FileIndex()
+        StructureTest.create_terms(self)
+        self.index.write(StorageTest.PATH)
+        self.check_index(Index.read(StorageTest.PATH), FileIndex)
+
+    def test_replace_existing(self):
+        self.index.write(StorageTest.PATH)
+        self.index.write(StorageTest.PATH)
+        self.check_index(Index.read(StorageTest.PATH), HashIndex)
+        self.assertFalse(os.path.exists(f"{StorageTest.PATH}.tmp"))
+        self.assertFalse(os.path.exists(f"{StorageTest.PATH}.old"))
+
+    def test_refuse_overwrite(self):
+        #um arquivo (ex.: índice antigo serializado com pickle) não é sobrescrito
+        with open(StorageTest.PATH, "wb") as arquivo:
+            arquivo.write(b"indice antigo")
+        with self.assertRaises(ValueError):
+            self.index.write(StorageTest.PATH)
+        with open(StorageTest.PATH, "rb") as arquivo:
+            self.assertEqual(arquivo.read(), b"indice antigo")
+
+    def test_interrupted_replace(self):
+        #troca interrompida após o índice anterior ser renomeado para .old
+        str_old_path = f"{StorageTest.PATH}.old"
+        self.index.write(StorageTest.PATH)
+        os.replace(StorageTest.PATH, str_old_path)
+        self.check_index(Index.read(StorageTest.PATH), HashIndex)
+        self.index.write(StorageTest.PATH)
+        self.assertFalse(os.path.exists(str_old_path))
+        self.check_index(Index.read(StorageTest.PATH), HashIndex)
+
+    def test_pickle_conversion(self):
+        str_pickle = f"{StorageTest.PATH}.pickle"
+        for index in [self.index, FileIndex()]:
+            if isinstance(index, FileIndex):
+                self.index = index
+                StructureTest.create_terms(self)
+            self.index.write(StorageTest.PATH)
+            binary_to_pickle(StorageTest.PATH, str_pickle)
+            shutil.rmtree(StorageTest.PATH)
+            self.check_index(Index.read(str_pickle), type(index))
+
+            pickle_to_binary(str_pickle, StorageTest.PATH)
+            self.check_index(Index.read(StorageTest.PATH), type(index))
+
+    def baseline_file_pickle(self, str_pickle:str, lst_pending:List[TermOccurrence]):
+        """
+        FileIndex serializado pelo código original (sem __getstate__): lista temporária de TermOccurrence e
+        um único arquivo de ocorrências em registros
+        """
+        expected, self.index = self.index, FileIndex()
+        StructureTest.create_terms(self)
+        index, self.index = self.index, expected
+        str_occur_file = f"{str_pickle}.occur"
+        shutil.copyfile(index.str_idx_file_name, str_occur_file)
+        index.close_reader()
+        os.remove(index.str_idx_file_name)
+        lst_occurrences_tmp = [None]*10
+        lst_occurrences_tmp[:len(lst_pending)] = lst_pending
+        state = {"dic_index":{term:TermFilePosition(obj_term.term_id, obj_term.term_file_start_pos,
+                                                    obj_term.doc_count_with_term)
+                              for term, obj_term in index.dic_index.items()},
+                 "set_documents":set(index.set_documents), "lst_occurrences_tmp":lst_occurrences_tmp,
+                 "idx_file_counter":1, "str_idx_file_name":str_occur_file,
+                 "idx_tmp_occur_first_element":0, "idx_tmp_occur_last_element":len(lst_pending)-1}
+        with open(str_pickle, "wb") as arquivo:
+            pickle.dump(BaselinePickle(state), arquivo)
+
+    def test_baseline_pickle(self):
+        str_pickle = f"{StorageTest.PATH}.pickle"
+        self.baseline_file_pickle(str_pickle, [])
+        index = Index.read(str_pickle)
+        #índices antigos não possuem as estatísticas dos documentos
+        self.assertIsNone(index.doc_stats)
+        index.compute_stats()
+        self.check_index(index, FileIndex)
+        pickle_to_binary(str_pickle, StorageTest.PATH)
+        self.check_index(Index.read(StorageTest.PATH), FileIndex)
+
+        #ocorrências ainda não gravadas no arquivo
+        self.baseline_file_pickle(str_pickle, [TermOccurrence(4, 0, 5)])
+        index = Index.read(str_pickle)
+        index.finish_indexing()
+        self.assertListEqual([(occur.doc_id, occur.term_freq) for occur in index.get_occurrence_list("casa")],
+                             [(1, 10), (2, 3), (4, 5)])
+        index.close_reader()
+        os.remove(index.str_idx_file_name)
+
+    def test_deleted_documents(self):
+        for index in [HashIndex(), FileIndex()]:
+            self.index = index
+            StructureTest.create_terms(self)
+            self.index.finish_indexing()
+            self.index.delete_document(2)
+            self.index.write(StorageTest.PATH)
+            index_read = Index.read(StorageTest.PATH)
+            self.assertFalse(index_read.live_docs.is_live(2))
+            self.assertTrue(index_read.live_docs.is_live(1))
+            #o índice gravado não é alterado pela compactação do índice lido
+            index_read.compact()
+            self.assertEqual(index_read.document_count, 2)
+            self.assertEqual(Index.read(StorageTest.PATH).document_count, 3)
+            if isinstance(index_read, FileIndex):
+                index_read.close_reader()
+                os.remove(index_read.str_idx_file_name)
+
+    def test_add_documents(self):
+        #índice lido, novos documentos e finish_indexing: as ocorrências gravadas são mantidas
+        for postings_codec in [None, "vbyte", "packed"]:
+            self.index = FileIndex(postings_codec=postings_codec)
+            StructureTest.create_terms(self)
+            self.index.write(StorageTest.PATH)
+            index_read = Index.read(StorageTest.PATH)
+            index_read.index("casa", 4, 2)
+            index_read.index("azul", 4, 1)
+            index_read.finish_indexing()
+
+            expected = HashIndex()
+            for term, occurrences in self.index.iter_postings():
+                for doc_id, term_freq in zip(*[column.tolist() for column in postings_columns(occurrences)]):
+                    expected.index(term, doc_id, term_freq)
+            expected.index("casa", 4, 2)
+            expected.index("azul", 4, 1)
+            expected.finish_indexing()
+            self.assertEqual(index_read.document_count, 4)
+            self.assertCountEqual(index_read.vocabulary, expected.vocabulary)
+            for term in expected.vocabulary:
+                self.assertListEqual([(occur.doc_id, occur.term_freq) for occur in index_read.get_occurrence_list(term)],
+                                     [(occur.doc_id, occur.term_freq) for occur in expected.get_occurrence_list(term)])
+            #o índice gravado não é alterado
+            self.check_index(Index.read(StorageTest.PATH), FileIndex)
+            index_read.close_reader()
+            os.remove(index_read.str_idx_file_name)
+            self.index.close_reader()
+            os.remove(self.index.str_idx_file_name)
+
+    def test_impacts(self):
+        self.index = HashIndex()
+        self.index.impact_bits = 8
+        StructureTest.create_terms(self)
+        self.index.finish_indexing()
+        self.index.write(StorageTest.PATH)
+        term_impacts = Index.read(StorageTest.PATH).term_impacts
+        self.assertTrue(term_impacts.has_impacts)
+        self.assertIsInstance(term_impacts.impacts, np.memmap)
+        for term in ["casa","vermelho","verde"]:
+            term_id = self.index.get_term_id(term)
+            self.assertListEqual(term_impacts.impact_postings(term_id)[0].tolist(),
+                                 self.index.term_impacts.impact_postings(term_id)[0].tolist())
+
+    def test_unsupported_version(self):
+        self.index.write(StorageTest.PATH)
+        header = IndexHeader(KIND_HASH, LAYOUT_COLUMNS, 0, 0, 0, version=FORMAT_VERSION+1)
+        with open(os.path.join(StorageTest.PATH, HEADER_FILE), "wb") as header_file:
+            header_file.write(header.to_bytes())
+        with self.assertRaises(ValueError):
+            Index.read(StorageTest.PATH)
+
+
+if __name__ == "__main__":
+    unittest.main()
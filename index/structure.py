@@ -3,18 +3,49 @@ from typing import List, Set, Union
 from abc import abstractmethod
 from functools import total_ordering
 from os import path
+from array import array
+from concurrent.futures import ThreadPoolExecutor
 import os
 import json
 import gc
 import pickle
+import mmap
+import shutil
+import threading
+import numpy as np
+from index.codec import OCCURRENCE_RECORD, RECORD_SIZE, RECORD_DTYPE, SKIP_BLOCK_SIZE, OccurrenceReader, \
+                        OccurrenceWriter, TermDirectory, decode_occurrences, encode_occurrences, \
+                        merge_occurrence_files, unpack_occurrences
+from index.lexicon import FrozenLexicon
+from index.postings import PostingsCursor, BlockPostingsCursor
+from index.compression import POSTINGS_CODECS, CompressedPostingsWriter
+from index.manifest import BuildManifest
+from index.live_docs import LiveDocs
+from index.doc_stats import DocumentStatsTable
+from index.impacts import TermImpacts
+from functools import partial
+from itertools import islice
 
 
 class Index:
     def __init__(self):
         self.dic_index = {}
         self.set_documents = set()
+        #documentos excluídos (delete_document) cujas ocorrências ainda não foram removidas (compact)
+        self.live_docs = LiveDocs()
+        #estatísticas dos documentos (ver index/doc_stats.py), calculadas no finish_indexing caso store_doc_stats
+        self.doc_stats = None
+        self.store_doc_stats = True
+        #tabela de idf e, caso impact_bits seja informado, listas de impacto quantizadas (ver index/impacts.py)
+        self.term_impacts = None
+        self.impact_bits = None
 
     def index(self, term:str, doc_id:int, term_freq:int):
+        if not isinstance(self.dic_index, dict):
+            #vocabulário congelado pelo finish_indexing: volta a ser um dicionário
+            self.dic_index = self.thaw_dic_index()
+            self.doc_stats = None
+            self.term_impacts = None
         if term not in self.dic_index:
             int_term_id = len(self.dic_index)
             self.dic_index[term] = self.create_index_entry(int_term_id)
@@ -32,12 +63,74 @@ class Index:
     def document_count(self) -> int:
         return len(self.set_documents)
 
+    def terms_with_prefix(self, prefix:str) -> List[str]:
+        """
+        Termos do vocabulário (em ordem) que começam com prefix
+        """
+        if isinstance(self.dic_index, FrozenLexicon):
+            return self.dic_index.terms_with_prefix(prefix)
+        return sorted(term for term in self.dic_index if term.startswith(prefix))
+
+    @property
+    def has_deletions(self) -> bool:
+        return self.live_docs.deleted_count > 0
+
+    def delete_document(self, doc_id:int) -> bool:
+        """
+        Marca o documento como excluído: a partir de então, ele é desconsiderado nas consultas (ver live_occurrences).
+        As suas ocorrências são removidas apenas pelo compact. Retorna falso caso o documento não exista
+        ou já tenha sido excluído
+        """
+        if doc_id not in self.set_documents:
+            return False
+        return self.live_docs.delete(doc_id)
+
+    def live_occurrences(self, occurrences):
+        """
+        Lista de ocorrências sem os documentos excluídos
+        """
+        if not self.has_deletions:
+            return occurrences
+        if hasattr(occurrences, "doc_ids"):
+            doc_ids = np.asarray(occurrences.doc_ids)
+            mask = self.live_docs.live_mask(doc_ids)
+            return TermPostings(occurrences.term_id, doc_ids[mask], np.asarray(occurrences.term_freqs)[mask])
+        return [occur for occur in occurrences if self.live_docs.is_live(occur.doc_id)]
+
+    def remove_deleted_documents(self):
+        #após o compact: os documentos excluídos deixam de existir no índice
+        self.set_documents.difference_update(self.live_docs.deleted_doc_ids().tolist())
+        self.live_docs = LiveDocs()
+
+    def compact(self):
+        """
+        Remove fisicamente as ocorrências dos documentos excluídos, atualizando set_documents e o df dos termos
+        """
+        raise NotImplementedError("Voce deve criar uma subclasse e a mesma deve sobrepor este método")
+
+    def remove_files(self):
+        #exclui os arquivos criados pelo índice (ex.: segmento substituído no merge), que não deve mais ser usado
+        pass
+
+    def thaw_dic_index(self) -> dict:
+        #mantém a ordem de inserção igual à ordem dos term_id
+        return dict(sorted(self.dic_index.items(), key=lambda item: item[1].term_id))
+
     def write(self, arq_index: str):
-        with open(arq_index,"wb") as arquivo:
-            pickle.dump(self, arquivo)
+        """
+        Grava o índice no formato binário versionado (diretório arq_index, ver index/storage.py)
+        """
+        from index.storage import write_index
+        write_index(self, arq_index)
     
     @staticmethod
     def read(arq_index: str):
+        """
+        Lê um índice no formato binário ou, caso arq_index seja um arquivo antigo, via pickle
+        """
+        from index.storage import is_binary_index, read_index, recover_path
+        if is_binary_index(recover_path(arq_index)):
+            return read_index(arq_index)
         with open(arq_index,"rb") as arquivo:
             return pickle.load(arquivo)
 
@@ -87,9 +180,34 @@ class Index:
     def document_count_with_term(self,term:str) -> int:
          raise NotImplementedError("Voce deve criar uma subclasse e a mesma deve sobrepor este método")
 
+    def postings_cursor(self, term:str) -> PostingsCursor:
+        """
+        Cursor (next/advance_to) sobre a lista de ocorrências do termo
+        """
+        term_id = self.get_term_id(term) if term in self.dic_index else None
+        cursor = PostingsCursor.from_occurrences(term_id, self.get_occurrence_list(term))
+        cursor.live_docs = self.live_docs if self.has_deletions else None
+        return cursor
+
+    def iter_postings(self):
+        """
+        Percorre, uma única vez, a lista de ocorrências de cada termo do vocabulário.
+        Retorna tuplas (termo, lista de ocorrências)
+        """
+        for term in self.vocabulary:
+            yield term, self.get_occurrence_list(term)
+
     def finish_indexing(self):
         pass
 
+    def compute_stats(self):
+        #uma passada pelas listas de ocorrências do índice finalizado (e outra para as listas de impacto)
+        if not self.store_doc_stats:
+            self.doc_stats = self.term_impacts = None
+            return
+        self.doc_stats = DocumentStatsTable.from_index(self)
+        self.term_impacts = TermImpacts.from_index(self, self.doc_stats, self.impact_bits)
+
     def __str__(self):
         arr_index = []
         for str_term in self.vocabulary:
@@ -133,24 +251,156 @@ class TermOccurrence:
         return str(self)
 
 
+class TermPostings:
+    """
+    Lista de ocorrências de um termo armazenada em colunas compactas (doc_id e term_freq, 4 bytes cada).
+    O term_id é guardado uma única vez e os objetos TermOccurrence são criados apenas quando acessados.
+    Durante a indexação as colunas são array('I') (crescem por append); após o finish_indexing
+    são visões (somente leitura) dos arrays NumPy do HashIndex.
+    """
+    __slots__ = ("term_id", "doc_ids", "term_freqs")
+
+    def __init__(self, term_id:int, doc_ids=None, term_freqs=None):
+        self.term_id = term_id
+        self.doc_ids = array("I") if doc_ids is None else doc_ids
+        self.term_freqs = array("I") if term_freqs is None else term_freqs
+
+    def append(self, doc_id:int, term_freq:int):
+        if not isinstance(self.doc_ids, array):
+            #lista congelada: volta a ser expansível
+            self.doc_ids = array("I", self.doc_ids.tolist())
+            self.term_freqs = array("I", self.term_freqs.tolist())
+        self.doc_ids.append(doc_id)
+        self.term_freqs.append(term_freq)
+
+    def occurrence(self, pos:int) -> TermOccurrence:
+        return TermOccurrence(int(self.doc_ids[pos]), self.term_id, int(self.term_freqs[pos]))
+
+    def __len__(self):
+        return len(self.doc_ids)
+
+    def __getitem__(self, pos):
+        if isinstance(pos, slice):
+            return [self.occurrence(i) for i in range(*pos.indices(len(self)))]
+        if pos < 0:
+            pos += len(self)
+        if pos < 0 or pos >= len(self):
+            raise IndexError("posição inexistente na lista de ocorrências")
+        return self.occurrence(pos)
+
+    def __iter__(self):
+        for doc_id, term_freq in zip(self.doc_ids, self.term_freqs):
+            yield TermOccurrence(int(doc_id), self.term_id, int(term_freq))
+
+    def __eq__(self, other):
+        try:
+            return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+        except TypeError:
+            return False
+
+    def __str__(self):
+        return str(list(self))
+
+    def __repr__(self):
+        return str(self)
+
+
 #HashIndex é subclasse de Index
 class HashIndex(Index):
 
     def get_term_id(self, term:str):
-        return self.dic_index[term][0].term_id
+        return self.dic_index[term].term_id
 
-    def create_index_entry(self, termo_id:int) -> List:
-        return []
+    def create_index_entry(self, termo_id:int) -> TermPostings:
+        return TermPostings(termo_id)
 
-    def add_index_occur(self, entry_dic_index:List, doc_id:int, term_id:int, term_freq:int):
-        entry_dic_index.append(TermOccurrence(doc_id, term_id, term_freq))
+    def add_index_occur(self, entry_dic_index:TermPostings, doc_id:int, term_id:int, term_freq:int):
+        entry_dic_index.append(doc_id, term_freq)
 
     def get_occurrence_list(self,term: str)->List:
-        return self.dic_index[term] if term in self.dic_index else []
+        entry = self.dic_index.get(term)
+        if entry is None:
+            return []
+        return self.frozen_postings(entry) if isinstance(entry, TermFilePosition) else entry
 
     def document_count_with_term(self,term:str) -> int:
-        return len(self.dic_index[term])  if term in self.dic_index else 0
+        entry = self.dic_index.get(term)
+        if entry is None:
+            return 0
+        return entry.doc_count_with_term if isinstance(entry, TermFilePosition) else len(entry)
 
+    def finish_indexing(self):
+        """
+        Congela as listas de ocorrências em arrays contíguos (estilo CSR): as ocorrências do termo de id t
+        estão nas posições postings_offsets[t]:postings_offsets[t+1] de postings_doc_ids/postings_term_freqs.
+        O dic_index passa a ser um FrozenLexicon cujas entradas (TermFilePosition) guardam, em term_file_start_pos,
+        a posição da primeira ocorrência do termo nesses arrays
+        """
+        if not isinstance(self.dic_index, dict):
+            return
+        lst_terms = list(self.dic_index.keys())
+        lst_entries = list(self.dic_index.values())
+        term_ids = np.array([entry.term_id for entry in lst_entries], dtype=np.int64)
+        doc_counts = np.zeros(len(lst_entries), dtype=np.int64)
+        doc_counts[term_ids] = [len(entry) for entry in lst_entries]
+        self.postings_offsets = np.zeros(len(lst_entries)+1, dtype=np.int64)
+        np.cumsum(doc_counts, out=self.postings_offsets[1:])
+
+        self.postings_doc_ids = np.empty(self.postings_offsets[-1], dtype=np.uint32)
+        self.postings_term_freqs = np.empty(self.postings_offsets[-1], dtype=np.uint32)
+        for entry in lst_entries:
+            start, end = self.postings_offsets[entry.term_id], self.postings_offsets[entry.term_id+1]
+            self.postings_doc_ids[start:end] = entry.doc_ids
+            self.postings_term_freqs[start:end] = entry.term_freqs
+        self.postings_doc_ids.flags.writeable = False
+        self.postings_term_freqs.flags.writeable = False
+
+        self.dic_index = FrozenLexicon(lst_terms, term_ids, self.postings_offsets[term_ids], doc_counts[term_ids],
+                                       TermFilePosition)
+        self.compute_stats()
+
+    def compact(self):
+        """
+        Remove as ocorrências dos documentos excluídos. Os termos sem ocorrências são removidos do vocabulário
+        e os demais renumerados (na mesma ordem). Caso o índice esteja finalizado, os arrays são recriados
+        """
+        if not self.has_deletions:
+            return
+        is_frozen = not isinstance(self.dic_index, dict)
+        dic_index = {}
+        for term, entry in sorted(self.dic_index.items(), key=lambda item: item[1].term_id):
+            postings = self.live_occurrences(self.frozen_postings(entry) if isinstance(entry, TermFilePosition) else entry)
+            if len(postings) > 0:
+                dic_index[term] = TermPostings(len(dic_index), postings.doc_ids, postings.term_freqs)
+        self.dic_index = dic_index
+        self.remove_deleted_documents()
+        if is_frozen:
+            self.finish_indexing()
+
+    def frozen_postings(self, entry:"TermFilePosition") -> TermPostings:
+        #fatia dos arrays congelados (sem cópia)
+        start = entry.term_file_start_pos
+        end = start+entry.doc_count_with_term
+        return TermPostings(entry.term_id, self.postings_doc_ids[start:end], self.postings_term_freqs[start:end])
+
+    def thaw_dic_index(self) -> dict:
+        return {term:self.frozen_postings(entry) for term, entry in self.dic_index.items()}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.__dict__.setdefault("live_docs", LiveDocs())
+        self.__dict__.setdefault("doc_stats", None)
+        self.__dict__.setdefault("store_doc_stats", True)
+        self.__dict__.setdefault("term_impacts", None)
+        self.__dict__.setdefault("impact_bits", None)
+        if not isinstance(self.dic_index, dict) or len(self.dic_index) == 0:
+            return
+        #indices antigos: listas de TermOccurrence
+        for term, entry in self.dic_index.items():
+            if isinstance(entry, list):
+                self.dic_index[term] = TermPostings(entry[0].term_id,
+                                                    array("I", [occur.doc_id for occur in entry]),
+                                                    array("I", [occur.term_freq for occur in entry]))
 
 
 class TermFilePosition:
@@ -172,16 +422,75 @@ class TermFilePosition:
 class FileIndex(Index):
 
     TMP_OCCURRENCES_LIMIT = 339000#1000000
-
-    def __init__(self):
+    #bytes por ocorrência da lista temporária (term_id, doc_id e term_freq com 4 bytes cada)
+    TMP_OCCURRENCE_BYTES = 12
+    #quantidade máxima de runs intercalados de uma só vez
+    MERGE_FAN_IN = 16
+
+    def __init__(self, tmp_occurrences_limit_bytes:int=None, background_flush:bool=False, postings_codec:str=None,
+                 work_dir:str=None):
+        """
+        tmp_occurrences_limit_bytes: memória (em bytes) das ocorrências mantidas em memória antes de gravar um run.
+        Caso não seja informada, são mantidas até TMP_OCCURRENCES_LIMIT ocorrências
+        background_flush: se verdadeiro, a ordenação e gravação de cada run é feita em uma thread
+        enquanto a indexação continua em uma segunda lista temporária (no máximo duas listas em memória)
+        postings_codec: codec do arquivo final de ocorrências (ver index/compression.py: "vbyte" ou "packed").
+        Caso não seja informado, o arquivo final é gravado em registros de 12 bytes
+        work_dir: diretório de trabalho dos runs. Caso seja informado, a indexação é retomável: a cada run concluído
+        é gravado um manifesto (ver index/manifest.py) e, caso work_dir possua o manifesto de uma indexação
+        interrompida, ela é retomada a partir do ultimo run concluído (ver open_build)
+        """
         super().__init__()
-        self.lst_occurrences_tmp = [None]*FileIndex.TMP_OCCURRENCES_LIMIT
+        if postings_codec is not None and postings_codec not in POSTINGS_CODECS:
+            raise ValueError(f"Codec desconhecido: {postings_codec} (disponíveis: {', '.join(POSTINGS_CODECS)})")
+        if tmp_occurrences_limit_bytes is None:
+            self.tmp_occurrences_limit = self.TMP_OCCURRENCES_LIMIT
+        else:
+            self.tmp_occurrences_limit = max(1, tmp_occurrences_limit_bytes//FileIndex.TMP_OCCURRENCE_BYTES)
+
+        #lista temporária de ocorrências: colunas paralelas (term_id, doc_id, term_freq)
+        self.arr_tmp_term_ids = np.empty(self.tmp_occurrences_limit, dtype=np.uint32)
+        self.arr_tmp_doc_ids = np.empty(self.tmp_occurrences_limit, dtype=np.uint32)
+        self.arr_tmp_term_freqs = np.empty(self.tmp_occurrences_limit, dtype=np.uint32)
         self.idx_file_counter = 0
         self.str_idx_file_name = "occur_idx_file"
 
         self.idx_tmp_occur_first_element = 0
         self.idx_tmp_occur_last_element  = -1
-        
+
+        #arquivos de ocorrências ordenados (runs) ainda não intercalados
+        self.lst_run_files = []
+        self.merge_fan_in = FileIndex.MERGE_FAN_IN
+        #diretório dos termos (TermDirectory) de cada run, montado na gravação
+        self.dic_run_directories = {}
+        #entradas de salto (codec.SKIP_DTYPE) dos blocos do arquivo final
+        self.skip_entries = None
+
+        #arquivo final compactado
+        self.postings_codec = postings_codec
+        self.compressed_file = None
+        self.postings_file_size = 0
+
+        #gravação dos runs em segundo plano
+        self.background_flush = background_flush
+        self.flush_executor = None
+        self.flush_future = None
+        self.arr_spare_buffers = None
+
+        #leitura do arquivo final mapeado em memória (ver open_reader)
+        self.reader_lock = threading.Lock()
+        self.mmap_idx_file = None
+        self.mmap_records = None
+
+        #indexação retomável: documento sendo indexado, posição da sua primeira ocorrência na lista temporária
+        #e documentos concluídos ainda não registrados no manifesto
+        self.work_dir = work_dir
+        self.manifest = None
+        self.current_doc_id = None
+        self.current_doc_start = 0
+        self.lst_finished_docs = []
+        if work_dir is not None:
+            self.open_build(work_dir)
 
     def get_term_id(self, term:str):
         return self.dic_index[term].term_id
@@ -190,161 +499,727 @@ class FileIndex(Index):
         return  TermFilePosition(term_id)
 
     def add_index_occur(self, entry_dic_index:TermFilePosition,  doc_id:int, term_id:int, term_freq:int):
+        if doc_id != self.current_doc_id:
+            self.start_document(doc_id)
         self.idx_tmp_occur_last_element += 1
-        self.lst_occurrences_tmp[self.idx_tmp_occur_last_element] = TermOccurrence(doc_id,term_id,term_freq)
+        pos = self.idx_tmp_occur_last_element
+        self.arr_tmp_term_ids[pos] = term_id
+        self.arr_tmp_doc_ids[pos] = doc_id
+        self.arr_tmp_term_freqs[pos] = term_freq
         
-        if self.get_tmp_occur_size() >= self.TMP_OCCURRENCES_LIMIT:
+        if self.get_tmp_occur_size() >= self.tmp_occurrences_limit:
             self.save_tmp_occurrences()
 
+    def start_document(self, doc_id:int):
+        #as ocorrências de cada documento são indexadas em sequência (ex.: HTMLIndexer.index_text)
+        if self.manifest is not None and self.current_doc_id is not None:
+            self.lst_finished_docs.append(self.current_doc_id)
+        self.current_doc_id = doc_id
+        self.current_doc_start = self.idx_tmp_occur_last_element+1
+
+    def finish_document(self):
+        if self.manifest is not None and self.current_doc_id is not None:
+            self.lst_finished_docs.append(self.current_doc_id)
+        self.current_doc_id = None
+
     def get_tmp_occur_size(self):
         return  self.idx_tmp_occur_last_element - self.idx_tmp_occur_first_element + 1
     
     def next_from_list(self) -> TermOccurrence:
 
         if self.get_tmp_occur_size() > 0:
-            next_occur = self.lst_occurrences_tmp[self.idx_tmp_occur_first_element]
+            pos = self.idx_tmp_occur_first_element
+            next_occur = TermOccurrence(int(self.arr_tmp_doc_ids[pos]), int(self.arr_tmp_term_ids[pos]), int(self.arr_tmp_term_freqs[pos]))
             self.idx_tmp_occur_first_element += 1
             return next_occur
         else:
             return None
-        #return self.lst_occurrences_tmp.pop(0) if len(self.lst_occurrences_tmp)>0 else None
 
     def next_from_file(self,file_idx) -> TermOccurrence:
         #next_from_file = pickle.load(file_idx)
-        bytes_doc_id = file_idx.read(4)
-        if not bytes_doc_id:
+        bytes_occur = file_idx.read(RECORD_SIZE)
+        if not bytes_occur:
             return None
-        doc_id = int.from_bytes(bytes_doc_id,byteorder="big")
-        term_id = int.from_bytes(file_idx.read(4),byteorder="big")
-        term_freq = int.from_bytes(file_idx.read(4),byteorder="big")
+        doc_id, term_id, term_freq = OCCURRENCE_RECORD.unpack(bytes_occur)
 
         return TermOccurrence(doc_id, term_id, term_freq)
 
+    @staticmethod
+    def sorted_occurrences_records(term_ids:np.ndarray, doc_ids:np.ndarray, term_freqs:np.ndarray) -> np.ndarray:
+        """
+        Ordena (por term_id e doc_id) as ocorrências e as converte para o formato de registros do arquivo
+        """
+        order = np.lexsort((doc_ids, term_ids))
+        return encode_occurrences(doc_ids[order], term_ids[order], term_freqs[order])
+
+    def tmp_occurrences_records(self) -> np.ndarray:
+        return self.sorted_occurrences_records(*self.tmp_occurrences_columns())
 
-    def save_tmp_occurrences(self):
+    def tmp_occurrences_columns(self) -> (np.ndarray, np.ndarray, np.ndarray):
+        #ocorrências ocupadas da lista temporária (sem cópia)
+        first, last = self.idx_tmp_occur_first_element, self.idx_tmp_occur_last_element+1
+        return self.arr_tmp_term_ids[first:last], self.arr_tmp_doc_ids[first:last], self.arr_tmp_term_freqs[first:last]
 
+    @staticmethod
+    def write_run(str_file_name:str, term_ids:np.ndarray, doc_ids:np.ndarray, term_freqs:np.ndarray) -> TermDirectory:
+        term_directory = TermDirectory(SKIP_BLOCK_SIZE)
+        with OccurrenceWriter(str_file_name, term_directory=term_directory) as idx_file:
+            idx_file.write(FileIndex.sorted_occurrences_records(term_ids, doc_ids, term_freqs))
+        return term_directory
+
+    def flush_run(self, str_file_name:str, term_ids:np.ndarray, doc_ids:np.ndarray, term_freqs:np.ndarray,
+                  dic_checkpoint:dict=None):
+        #o run é gravado em um arquivo temporário, renomeado apenas ao ser concluído
+        str_tmp_file = f"{str_file_name}.tmp"
+        term_directory = self.write_run(str_tmp_file, term_ids, doc_ids, term_freqs)
+        os.replace(str_tmp_file, str_file_name)
+        self.dic_run_directories[str_file_name] = term_directory
+        if dic_checkpoint is not None:
+            self.manifest.save(dic_checkpoint)
+
+    def save_tmp_occurrences(self):
+        """
+        Ordena as ocorrências da lista temporária e as grava em um novo arquivo (run) independente.
+        Os runs são intercalados apenas no merge_runs (chamado pelo finish_indexing)
+        """
 
         #Para eficiencia, todo o codigo deve ser feito com o garbage
         #collector desabilitado
         gc.disable()
-        #ordena pelo term_id, doc_id
-        self.lst_occurrences_tmp.sort(key=lambda e: (e is None, e))
-        #faz o ordenação externa
-        str_last_idx_file = self.str_idx_file_name
-        str_new_idx_file = f"occur_{self.idx_file_counter+1}.idx"
-        #10 MB de buffer
-        with open(str_new_idx_file,"wb") as idx_new_file:
-            #inicializa
-            file_last_idx = None
-            next_from_file = None
-            num_occur_saved = 0
-
-            if path.exists(str_last_idx_file):
-                file_size = os.path.getsize(str_last_idx_file)
-                file_last_idx = open(str_last_idx_file,"rb")
-                next_from_file = self.next_from_file(file_last_idx)
-            
-            next_from_list = self.next_from_list()
-
-            #enquanto tanto a lista quanto o arquivo possuirem entrada
-            while next_from_list and next_from_file:
-                #print(f"Comparando: {next_from_list} e {next_from_file} ")
-                if next_from_list>next_from_file:
-                    occur = next_from_file
-                    next_from_file = self.next_from_file(file_last_idx)
-                else:
-                    occur = next_from_list
-                    next_from_list = self.next_from_list()
-                #print(f"Adicionou {occur}")
-                occur.write(idx_new_file)
-                num_occur_saved += 1
-                #self.print_occurrence_writing_status(str_new_idx_file,(list_total-len(self.lst_occurrences_tmp))/list_total,\
-                #                                    idx_new_file.tell()/file_size)
-            #termina a lista (O arquivo ja tinha terminado)
-            while next_from_list:
-                next_from_list.write(idx_new_file)
-                next_from_list = self.next_from_list()
-                num_occur_saved += 1
-                #self.print_occurrence_writing_status(str_new_idx_file,(list_total-len(self.lst_occurrences_tmp))/list_total,1)
-            #termina o arquivo (a lista terminou )
-            while next_from_file:
-                next_from_file.write(idx_new_file)
-                next_from_file = self.next_from_file(file_last_idx)
-                num_occur_saved += 1
-                #self.print_occurrence_writing_status(str_new_idx_file,1, idx_new_file.tell()/file_size)
-            #print(f"{num_occur_saved} ocorrências salvas  no arquivo {str_new_idx_file}...")
-            #feche o arquivo, se necessário
-            if file_last_idx:
-                file_last_idx.close()
-                #exclui os arquivo de indice antigo
-                os.remove(str_last_idx_file)
-
-
-        #atualiza o contador
-        self.idx_file_counter += 1
+        try:
+            str_new_idx_file = self.next_idx_file_name()
+            #indexação retomável: o run termina no ultimo documento completo e o documento atual passa para o
+            #próximo run. O manifesto é gravado apenas quando o run não possui documentos incompletos
+            carried, dic_checkpoint = None, None
+            if self.manifest is not None:
+                carried = self.pop_current_document()
+                if carried is not None or self.current_doc_id is None:
+                    dic_checkpoint = self.checkpoint_state(self.lst_run_files+[str_new_idx_file])
+            if self.background_flush:
+                #aguarda o run anterior: sua lista temporária passa a ser a lista livre
+                self.wait_flush()
+                columns = self.tmp_occurrences_columns()
+                self.swap_tmp_buffers()
+                if self.flush_executor is None:
+                    self.flush_executor = ThreadPoolExecutor(max_workers=1)
+                self.flush_future = self.flush_executor.submit(self.flush_run, str_new_idx_file, *columns,
+                                                               dic_checkpoint)
+            else:
+                self.flush_run(str_new_idx_file, *self.tmp_occurrences_columns(), dic_checkpoint)
+        finally:
+            gc.enable()
+        self.lst_run_files.append(str_new_idx_file)
 
         #limpa a lista
-        self.idx_tmp_occur_last_element  = -1
-        self.idx_tmp_occur_first_element = 0
+        self.clear_tmp_occurrences()
+        if carried is not None:
+            self.push_occurrences(*carried)
         
         #atualiza o nome do arquivo de indice
         self.str_idx_file_name = str_new_idx_file
         #print(f"Nome do indice: {self.str_idx_file_name}")
-        gc.enable()
+
+    def clear_tmp_occurrences(self):
+        self.idx_tmp_occur_last_element  = -1
+        self.idx_tmp_occur_first_element = 0
+        self.current_doc_start = 0
+
+    def pop_current_document(self) -> (np.ndarray, np.ndarray, np.ndarray):
+        """
+        Retira da lista temporária as ocorrências do documento atual (colunas term_id, doc_id e term_freq).
+        Retorna None caso não exista documento atual ou caso ele ocupe toda a lista
+        """
+        if self.current_doc_id is None or self.current_doc_start <= self.idx_tmp_occur_first_element:
+            return None
+        start, end = self.current_doc_start, self.idx_tmp_occur_last_element+1
+        carried = (self.arr_tmp_term_ids[start:end].copy(), self.arr_tmp_doc_ids[start:end].copy(),
+                   self.arr_tmp_term_freqs[start:end].copy())
+        self.idx_tmp_occur_last_element = start-1
+        return carried
+
+    def push_occurrences(self, term_ids:np.ndarray, doc_ids:np.ndarray, term_freqs:np.ndarray):
+        #devolve à lista temporária as ocorrências retiradas pelo pop_current_document
+        start = self.idx_tmp_occur_last_element+1
+        end = start+len(term_ids)
+        self.arr_tmp_term_ids[start:end] = term_ids
+        self.arr_tmp_doc_ids[start:end] = doc_ids
+        self.arr_tmp_term_freqs[start:end] = term_freqs
+        self.idx_tmp_occur_last_element = end-1
+        self.current_doc_start = start
+
+    def swap_tmp_buffers(self):
+        if self.arr_spare_buffers is None:
+            self.arr_spare_buffers = tuple(np.empty(self.tmp_occurrences_limit, dtype=np.uint32) for _ in range(3))
+        arr_current = (self.arr_tmp_term_ids, self.arr_tmp_doc_ids, self.arr_tmp_term_freqs)
+        self.arr_tmp_term_ids, self.arr_tmp_doc_ids, self.arr_tmp_term_freqs = self.arr_spare_buffers
+        self.arr_spare_buffers = arr_current
+
+    def wait_flush(self):
+        """
+        Aguarda a gravação do run em segundo plano. Caso ela tenha falhado, a exceção é lançada aqui
+        """
+        if self.flush_future is not None:
+            future, self.flush_future = self.flush_future, None
+            future.result()
+
+    def next_idx_file_name(self) -> str:
+        """
+        Atualiza o contador e reserva o nome do próximo arquivo, criando-o vazio de forma atômica (O_EXCL): outros
+        índices no mesmo diretório (ex.: segmentos intercalados em outra thread) nunca escolhem o mesmo nome.
+        O arquivo temporário (nome + ".tmp") pertence a quem reservou o nome
+        """
+        while True:
+            self.idx_file_counter += 1
+            str_file_name = f"occur_{self.idx_file_counter}.idx"
+            if self.work_dir is not None:
+                str_file_name = os.path.join(self.work_dir, str_file_name)
+            try:
+                os.close(os.open(str_file_name, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            except FileExistsError:
+                continue
+            return str_file_name
+
+    def open_build(self, work_dir:str):
+        """
+        Abre o manifesto do diretório de trabalho. Caso exista uma indexação interrompida, são restaurados
+        o vocabulário, os documentos e os runs registrados no ultimo run concluído; os documentos restantes
+        devem ser indexados novamente (ex.: HTMLIndexer.index_text_dir ignora os que estão em set_documents).
+        Os runs e arquivos temporários não registrados no manifesto são excluídos
+        """
+        self.manifest = BuildManifest(work_dir)
+        dic_state = self.manifest.load()
+        if dic_state is None:
+            #nova indexação
+            self.manifest.remove()
+        else:
+            lst_terms = self.manifest.read_terms(dic_state["terms"])
+            self.dic_index = {term:self.create_index_entry(term_id) for term_id, term in enumerate(lst_terms)}
+            self.set_documents = set(self.manifest.read_documents(dic_state["documents"]))
+            self.idx_file_counter = dic_state["idx_file_counter"]
+            self.lst_run_files = [os.path.join(work_dir, str_run) for str_run in dic_state["runs"]]
+            if self.lst_run_files:
+                self.str_idx_file_name = self.lst_run_files[-1]
+        for str_file in os.listdir(work_dir):
+            str_path = os.path.join(work_dir, str_file)
+            if str_file.startswith("occur_") and str_path not in self.lst_run_files:
+                os.remove(str_path)
+
+    def checkpoint_state(self, lst_run_files:List[str]) -> dict:
+        #termos e documentos novos são acrescentados ao manifesto antes da gravação do estado
+        self.manifest.append_terms(list(islice(self.dic_index.keys(), self.manifest.terms_written, None)))
+        self.manifest.append_documents(self.lst_finished_docs)
+        self.lst_finished_docs = []
+        return self.manifest.state(lst_run_files, self.idx_file_counter)
+
+    def merge_runs(self) -> TermDirectory:
+        """
+        Ordenação externa: intercala os runs (k-way merge) em um único arquivo de ocorrências.
+        São intercalados até merge_fan_in arquivos por vez; caso existam mais runs,
+        o merge é feito em vários níveis.
+        Retorna o diretório dos termos do arquivo final, montado durante o ultimo merge
+        """
+        lst_runs = [self.decompress_postings(str_run) if str_run == self.compressed_file and len(self.lst_run_files) > 1
+                    else str_run for str_run in self.lst_run_files]
+        self.lst_run_files = list(lst_runs)
+        while len(lst_runs) > self.merge_fan_in:
+            lst_next_level = []
+            for pos in range(0, len(lst_runs), self.merge_fan_in):
+                lst_group = lst_runs[pos:pos+self.merge_fan_in]
+                str_merged = self.merge_run_group(lst_group)
+                lst_next_level.append(str_merged)
+                if str_merged not in lst_group:
+                    self.replace_runs(lst_group, str_merged)
+            lst_runs = lst_next_level
+
+        term_directory = TermDirectory(SKIP_BLOCK_SIZE)
+        lst_merged = []
+        if len(lst_runs) == 0:
+            #indice vazio
+            str_final_file = self.next_idx_file_name()
+            open(str_final_file, "wb").close()
+        elif len(lst_runs) == 1 and (self.postings_codec is None or lst_runs[0] == self.compressed_file):
+            str_final_file = lst_runs[0]
+            term_directory = self.dic_run_directories.get(str_final_file)
+            if term_directory is None:
+                #run gravado sem diretório (ex.: índice antigo serializado)
+                term_directory = TermDirectory.read(str_final_file, skip_block_size=SKIP_BLOCK_SIZE)
+        else:
+            writer_class = OccurrenceWriter
+            if self.postings_codec is not None:
+                #o ultimo merge grava o arquivo final já compactado
+                writer_class = partial(CompressedPostingsWriter, codec_name=self.postings_codec)
+            str_final_file = self.merge_run_group(lst_runs, term_directory, writer_class)
+            lst_merged = lst_runs
+        if self.postings_codec is not None:
+            self.compressed_file = str_final_file
+        #arquivo final concluído: o manifesto é excluído antes dos runs intercalados
+        if self.manifest is not None:
+            self.manifest.remove()
+        self.remove_runs(lst_merged)
+
+        self.lst_run_files = [str_final_file]
+        self.dic_run_directories = {str_final_file:term_directory}
+        self.str_idx_file_name = str_final_file
+        return term_directory
+
+    def merge_run_group(self, lst_group:List[str], term_directory:TermDirectory=None,
+                        writer_class=OccurrenceWriter) -> str:
+        if len(lst_group) == 1 and writer_class is OccurrenceWriter:
+            return lst_group[0]
+        str_new_idx_file = self.next_idx_file_name()
+        str_tmp_file = f"{str_new_idx_file}.tmp"
+        merge_occurrence_files(lst_group, str_tmp_file, term_directory=term_directory, writer_class=writer_class)
+        os.replace(str_tmp_file, str_new_idx_file)
+        return str_new_idx_file
+
+    def replace_runs(self, lst_group:List[str], str_merged:str):
+        #o manifesto passa a registrar o run intercalado antes da exclusão dos runs do grupo
+        self.lst_run_files = [str_run for str_run in self.lst_run_files if str_run not in lst_group] + [str_merged]
+        if self.manifest is not None:
+            self.manifest.save(self.checkpoint_state(self.lst_run_files))
+        self.remove_runs(lst_group)
+
+    def remove_files(self):
+        #runs e arquivo final criados por este índice (o arquivo final de um índice gravado não é excluído)
+        self.close_reader()
+        self.remove_runs([str_run for str_run in self.lst_run_files if os.path.exists(str_run)])
+        self.lst_run_files = []
+
+    def remove_runs(self, lst_group:List[str]):
+        #exclui os runs já intercalados
+        for str_run_file in lst_group:
+            os.remove(str_run_file)
+            self.dic_run_directories.pop(str_run_file, None)
+
+    def decompress_postings(self, str_file:str) -> str:
+        """
+        Regrava o arquivo final compactado em registros de 12 bytes, para ser intercalado com novos runs
+        """
+        term_ids, offsets, doc_counts = self.dic_run_directories[str_file].columns()
+        ends = np.append(offsets[1:], os.path.getsize(str_file))
+        codec = POSTINGS_CODECS[self.postings_codec]
+        str_new_idx_file = self.next_idx_file_name()
+        term_directory = TermDirectory(SKIP_BLOCK_SIZE)
+        with open(str_file, "rb") as idx_file, OccurrenceWriter(str_new_idx_file, term_directory=term_directory) as writer:
+            for term_id, start, end, doc_count in zip(term_ids.tolist(), offsets.tolist(), ends.tolist(), doc_counts.tolist()):
+                buffer = np.frombuffer(idx_file.read(end-start), dtype=np.uint8)
+                doc_ids, term_freqs = codec.decode_term(buffer, doc_count, SKIP_BLOCK_SIZE)
+                writer.write(encode_occurrences(doc_ids, np.full(doc_count, term_id, dtype=np.uint32), term_freqs))
+        os.remove(str_file)
+        self.dic_run_directories.pop(str_file, None)
+        self.dic_run_directories[str_new_idx_file] = term_directory
+        self.compressed_file = None
+        return str_new_idx_file
 
     def finish_indexing(self):
-        if len(self.lst_occurrences_tmp) > 0:
+        #o arquivo final será substituído
+        self.close_reader()
+        if not isinstance(self.dic_index, dict):
+            self.dic_index = self.thaw_dic_index()
+        self.finish_document()
+        if self.get_tmp_occur_size() > 0:
             self.save_tmp_occurrences()
-
-        #faça a navegação para obter o mapa de ids por termo
-        dic_ids_por_termo = {}
-        for str_term,obj_term in self.dic_index.items():
-            dic_ids_por_termo[obj_term.term_id] = obj_term
-        #print(dic_ids_por_termo)
-        with open(self.str_idx_file_name,'rb') as idx_file:
-            #navega nas ocorrencias
-            occur = self.next_from_file(idx_file)
-            obj_last_term = dic_ids_por_termo[occur.term_id]
-            obj_last_term.term_file_start_pos = 0
-            num_docs = 0
-            last_pos = 0
-            while occur != None:
-                if obj_last_term.term_id != occur.term_id:
-                    last_term_id = occur.term_id
-                    #atualiza o anterior com o numero de documentos
-                    obj_last_term.doc_count_with_term = num_docs
-
-                    #taualiza a posição do atual
-                    obj_term = dic_ids_por_termo[occur.term_id]
-                    obj_term.term_file_start_pos = last_pos
-
-                    #atualiza o last pos e o numdoc
-                    obj_last_term = obj_term
-                    num_docs = 1
-                else:
-                    num_docs += 1
-
-                #prepara para a proxima iteração
-                last_pos = idx_file.tell()
-                occur=self.next_from_file(idx_file)
-
-            obj_last_term.doc_count_with_term = num_docs
+        try:
+            self.wait_flush()
+        finally:
+            if self.flush_executor is not None:
+                self.flush_executor.shutdown()
+                self.flush_executor = None
+            self.arr_spare_buffers = None
+        term_directory = self.merge_runs()
+        self.skip_entries = term_directory.skips()
+        self.postings_file_size = os.path.getsize(self.str_idx_file_name)
+
+        #posição e df de cada termo vêm do diretório montado no merge (sem nova leitura do arquivo)
+        dir_term_ids, dir_offsets, dir_doc_counts = term_directory.columns()
+        lst_terms = list(self.dic_index.keys())
+        term_ids = np.array([obj_term.term_id for obj_term in self.dic_index.values()], dtype=np.int64)
+        offsets = np.zeros(len(term_ids), dtype=np.int64)
+        doc_counts = np.zeros(len(term_ids), dtype=np.int64)
+        if len(dir_term_ids) > 0:
+            pos = np.minimum(np.searchsorted(dir_term_ids, term_ids), len(dir_term_ids)-1)
+            found = dir_term_ids[pos] == term_ids
+            offsets[found] = dir_offsets[pos[found]]
+            doc_counts[found] = dir_doc_counts[pos[found]]
+        self.dic_index = FrozenLexicon(lst_terms, term_ids, offsets, doc_counts, TermFilePosition)
+        self.compute_stats()
+
+    def compact(self):
+        """
+        Regrava o arquivo final (o índice deve estar finalizado) sem as ocorrências dos documentos excluídos.
+        Os termos sem ocorrências são removidos do vocabulário e os demais renumerados, mantendo a ordem
+        dos term_id (e, assim, a ordem do arquivo)
+        """
+        if not self.has_deletions:
+            return
+        if not isinstance(self.dic_index, FrozenLexicon):
+            raise ValueError("O FileIndex deve ser finalizado (finish_indexing) antes de ser compactado")
+        str_new_idx_file = self.next_idx_file_name()
+        str_tmp_file = f"{str_new_idx_file}.tmp"
+        term_directory = TermDirectory(SKIP_BLOCK_SIZE)
+        dic_index = {}
+        with OccurrenceWriter(str_tmp_file, term_directory=term_directory) as idx_file:
+            #iter_postings percorre o arquivo em ordem de term_id
+            for term, postings in self.iter_postings():
+                postings = self.live_occurrences(postings)
+                if len(postings) == 0:
+                    continue
+                term_id = len(dic_index)
+                dic_index[term] = TermFilePosition(term_id)
+                idx_file.write(encode_occurrences(postings.doc_ids, np.full(len(postings), term_id, dtype=np.uint32),
+                                                  postings.term_freqs))
+        self.close_reader()
+        os.replace(str_tmp_file, str_new_idx_file)
+        #o arquivo anterior é excluído apenas se foi criado por este índice (e não lido de um índice gravado)
+        if self.str_idx_file_name in self.lst_run_files:
+            os.remove(self.str_idx_file_name)
+        self.lst_run_files = [str_new_idx_file]
+        self.dic_run_directories = {str_new_idx_file:term_directory}
+        self.str_idx_file_name = str_new_idx_file
+        self.compressed_file = None
+        self.dic_index = dic_index
+        self.remove_deleted_documents()
+        self.finish_indexing()
+
+    def thaw_dic_index(self) -> dict:
+        if not self.lst_run_files and self.postings_file_size > 0:
+            self.adopt_postings_file()
+        return super().thaw_dic_index()
+
+    def adopt_postings_file(self):
+        """
+        Índice lido do formato binário (ver storage.read_index): o arquivo final pertence ao diretório do índice gravado.
+        Antes de novos documentos serem indexados, ele é copiado e a cópia passa a ser um run, intercalado com os novos
+        runs no finish_indexing (os runs intercalados são excluídos)
+        """
+        self.close_reader()
+        str_run_file = self.next_idx_file_name()
+        shutil.copyfile(self.str_idx_file_name, str_run_file)
+        #diretório do run a partir do vocabulário e das entradas de salto lidos
+        term_ids = np.asarray(self.dic_index.term_ids, dtype=np.int64)
+        order = np.argsort(term_ids, kind="stable")
+        doc_counts = np.asarray(self.dic_index.doc_counts, dtype=np.int64)[order]
+        with_docs = doc_counts > 0
+        term_directory = TermDirectory(SKIP_BLOCK_SIZE)
+        term_directory.add_terms(term_ids[order][with_docs],
+                                 np.asarray(self.dic_index.offsets, dtype=np.int64)[order][with_docs],
+                                 doc_counts[with_docs])
+        if self.skip_entries is not None:
+            term_directory.add_skips(self.skip_entries)
+        if self.postings_codec is not None:
+            self.compressed_file = str_run_file
+        self.lst_run_files = [str_run_file]
+        self.dic_run_directories = {str_run_file:term_directory}
+        self.str_idx_file_name = str_run_file
+
+    def freeze_dic_index(self):
+        """
+        Substitui o dicionário de TermFilePosition pelo vocabulário congelado (FrozenLexicon)
+        """
+        lst_entries = list(self.dic_index.values())
+        self.dic_index = FrozenLexicon(list(self.dic_index.keys()),
+                                       [obj_term.term_id for obj_term in lst_entries],
+                                       [obj_term.term_file_start_pos or 0 for obj_term in lst_entries],
+                                       [obj_term.doc_count_with_term or 0 for obj_term in lst_entries],
+                                       TermFilePosition)
+
+    def open_reader(self):
+        """
+        Mapeia em memória (mmap) o arquivo final de ocorrências, uma única vez.
+        A partir de então, get_occurrence_list retorna visões (sem cópia) das ocorrências de cada termo,
+        podendo ser chamado por várias threads ao mesmo tempo
+        """
+        with self.reader_lock:
+            if self.mmap_records is not None:
+                return
+            #arquivo compactado: bytes; caso contrário, registros
+            dtype = RECORD_DTYPE if self.postings_codec is None else np.uint8
+            if os.path.getsize(self.str_idx_file_name) == 0:
+                self.mmap_records = np.zeros(0, dtype=dtype)
+                return
+            with open(self.str_idx_file_name, "rb") as idx_file:
+                self.mmap_idx_file = mmap.mmap(idx_file.fileno(), 0, access=mmap.ACCESS_READ)
+            self.mmap_records = np.frombuffer(self.mmap_idx_file, dtype=dtype)
+
+    def close_reader(self):
+        with self.reader_lock:
+            self.mmap_records = None
+            if self.mmap_idx_file is not None:
+                try:
+                    self.mmap_idx_file.close()
+                except BufferError:
+                    #ainda existem visões das ocorrências em uso: o mapeamento é liberado junto com elas
+                    pass
+                self.mmap_idx_file = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        #a gravação em segundo plano e o arquivo mapeado em memória não são serializados
+        state["flush_executor"] = None
+        state["flush_future"] = None
+        state["arr_spare_buffers"] = None
+        state["reader_lock"] = None
+        state["mmap_idx_file"] = None
+        state["mmap_records"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.reader_lock = threading.Lock()
+        #indices serializados antes das entradas de salto e da compactação
+        self.__dict__.setdefault("skip_entries", None)
+        self.__dict__.setdefault("dic_run_directories", {})
+        self.__dict__.setdefault("postings_codec", None)
+        self.__dict__.setdefault("compressed_file", None)
+        self.__dict__.setdefault("postings_file_size", 0)
+        self.__dict__.setdefault("work_dir", None)
+        self.__dict__.setdefault("manifest", None)
+        self.__dict__.setdefault("current_doc_id", None)
+        self.__dict__.setdefault("current_doc_start", 0)
+        self.__dict__.setdefault("lst_finished_docs", [])
+        self.__dict__.setdefault("live_docs", LiveDocs())
+        self.__dict__.setdefault("doc_stats", None)
+        self.__dict__.setdefault("store_doc_stats", True)
+        self.__dict__.setdefault("term_impacts", None)
+        self.__dict__.setdefault("impact_bits", None)
+        self.__dict__.setdefault("mmap_idx_file", None)
+        self.__dict__.setdefault("mmap_records", None)
+        self.__dict__.setdefault("merge_fan_in", FileIndex.MERGE_FAN_IN)
+        self.__dict__.setdefault("background_flush", False)
+        self.__dict__.setdefault("flush_executor", None)
+        self.__dict__.setdefault("flush_future", None)
+        self.__dict__.setdefault("arr_spare_buffers", None)
+        if "lst_run_files" not in self.__dict__:
+            #indices serializados pelo código original: um único arquivo de ocorrências (caso já gravado)
+            self.lst_run_files = [self.str_idx_file_name] if os.path.exists(self.str_idx_file_name) else []
+        if "arr_tmp_term_ids" not in self.__dict__:
+            self.restore_tmp_occurrences(self.__dict__.pop("lst_occurrences_tmp", None) or [])
+
+    def restore_tmp_occurrences(self, lst_occurrences_tmp:List[TermOccurrence]):
+        #lista temporária de objetos TermOccurrence (código original) convertida para as colunas
+        lst_pending = lst_occurrences_tmp[self.idx_tmp_occur_first_element:self.idx_tmp_occur_last_element+1]
+        self.tmp_occurrences_limit = max(FileIndex.TMP_OCCURRENCES_LIMIT, len(lst_pending))
+        self.arr_tmp_term_ids = np.empty(self.tmp_occurrences_limit, dtype=np.uint32)
+        self.arr_tmp_doc_ids = np.empty(self.tmp_occurrences_limit, dtype=np.uint32)
+        self.arr_tmp_term_freqs = np.empty(self.tmp_occurrences_limit, dtype=np.uint32)
+        self.arr_tmp_term_ids[:len(lst_pending)] = [occur.term_id for occur in lst_pending]
+        self.arr_tmp_doc_ids[:len(lst_pending)] = [occur.doc_id for occur in lst_pending]
+        self.arr_tmp_term_freqs[:len(lst_pending)] = [occur.term_freq for occur in lst_pending]
+        self.idx_tmp_occur_first_element = 0
+        self.idx_tmp_occur_last_element = len(lst_pending)-1
 
     def get_occurrence_list(self,term: str)->List:
-        if term not in self.dic_index:
+        obj_term = self.dic_index.get(term)
+        if obj_term is None:
             return []
-        obj_term = self.dic_index[term]
+        if self.postings_codec is not None:
+            return self.compressed_postings(obj_term)
+
+        mmap_records = self.mmap_records
+        if mmap_records is not None:
+            start = obj_term.term_file_start_pos//RECORD_SIZE
+            records = mmap_records[start:start+obj_term.doc_count_with_term]
+            return TermPostings(obj_term.term_id, records["doc_id"], records["term_freq"])
 
         with open(self.str_idx_file_name,'rb') as idx_file:
             idx_file.seek(obj_term.term_file_start_pos)
-            arr_occur = []
-            for i in range(obj_term.doc_count_with_term):
-                arr_occur.append(self.next_from_file(idx_file))
+            buffer = idx_file.read(obj_term.doc_count_with_term*RECORD_SIZE)
+            return [TermOccurrence(doc_id, term_id, term_freq) for doc_id, term_id, term_freq in unpack_occurrences(buffer)]
+
+    def compressed_postings(self, obj_term:TermFilePosition) -> TermPostings:
+        #os blocos do termo vão até o inicio do primeiro bloco do próximo termo
+        _, end_skip = self.term_skip_range(obj_term.term_id)
+        buffer = self.read_postings_bytes(obj_term.term_file_start_pos, self.skip_end_offset(end_skip))
+        doc_ids, term_freqs = POSTINGS_CODECS[self.postings_codec].decode_term(buffer, obj_term.doc_count_with_term,
+                                                                               SKIP_BLOCK_SIZE)
+        return TermPostings(obj_term.term_id, doc_ids, term_freqs)
+
+    def term_skip_range(self, term_id:int) -> (int, int):
+        #entradas de salto do termo: faixa contígua, ordenada por term_id
+        start, end = np.searchsorted(self.skip_entries["term_id"], [term_id, term_id+1]).tolist()
+        return start, end
+
+    def skip_end_offset(self, skip_pos:int) -> int:
+        return int(self.skip_entries["offset"][skip_pos]) if skip_pos < len(self.skip_entries) else self.postings_file_size
+
+    def read_postings_bytes(self, start:int, end:int) -> np.ndarray:
+        mmap_records = self.mmap_records
+        if mmap_records is not None:
+            return mmap_records[start:end]
+        with open(self.str_idx_file_name, "rb") as idx_file:
+            idx_file.seek(start)
+            return np.frombuffer(idx_file.read(end-start), dtype=np.uint8)
+
+    def postings_cursor(self, term:str) -> PostingsCursor:
+        obj_term = self.dic_index.get(term)
+        if obj_term is None or self.skip_entries is None:
+            return super().postings_cursor(term)
+        start, end = self.term_skip_range(obj_term.term_id)
+        cursor = BlockPostingsCursor(obj_term.term_id, obj_term.doc_count_with_term, self.skip_entries[start:end],
+                                     SKIP_BLOCK_SIZE, lambda block, count: self.read_postings_block(start+block, count))
+        cursor.live_docs = self.live_docs if self.has_deletions else None
+        return cursor
+
+    def read_postings_block(self, skip_pos:int, count:int) -> (np.ndarray, np.ndarray):
+        offset = int(self.skip_entries["offset"][skip_pos])
+        if self.postings_codec is not None:
+            buffer = self.read_postings_bytes(offset, self.skip_end_offset(skip_pos+1))
+            prev_doc_id = 0
+            if skip_pos > 0 and self.skip_entries["term_id"][skip_pos-1] == self.skip_entries["term_id"][skip_pos]:
+                prev_doc_id = int(self.skip_entries["last_doc_id"][skip_pos-1])
+            return POSTINGS_CODECS[self.postings_codec].decode_block(buffer, count, prev_doc_id)
+
+        mmap_records = self.mmap_records
+        if mmap_records is not None:
+            records = mmap_records[offset//RECORD_SIZE:offset//RECORD_SIZE+count]
+        else:
+            with open(self.str_idx_file_name, "rb") as idx_file:
+                idx_file.seek(offset)
+                records = decode_occurrences(idx_file.read(count*RECORD_SIZE))
+        return records["doc_id"], records["term_freq"]
+
+    def iter_postings(self):
+        #o arquivo está ordenado por term_id, assim, basta uma leitura sequencial (em blocos)
+        if len(self.dic_index) == 0:
+            return
+        if self.postings_codec is not None:
+            yield from self.iter_compressed_postings()
+            return
+        dic_termos_por_id = {obj_term.term_id:str_term for str_term,obj_term in self.dic_index.items()}
+        pending = None
+        with OccurrenceReader(self.str_idx_file_name) as idx_file:
+            for records in idx_file:
+                if pending is not None:
+                    records = np.concatenate([pending, records])
+                #o ultimo termo do bloco pode continuar no próximo bloco
+                term_ids = records["term_id"]
+                bounds = np.flatnonzero(term_ids[1:] != term_ids[:-1]) + 1
+                starts = [0] + bounds.tolist()
+                ends = bounds.tolist() + [len(records)]
+                for start, end in zip(starts[:-1], ends[:-1]):
+                    yield self.postings_from_records(dic_termos_por_id, records[start:end])
+                pending = records[starts[-1]:]
+        if pending is not None and len(pending) > 0:
+            yield self.postings_from_records(dic_termos_por_id, pending)
+
+    def iter_compressed_postings(self):
+        codec = POSTINGS_CODECS[self.postings_codec]
+        lst_items = sorted(self.dic_index.items(), key=lambda item: item[1].term_file_start_pos)
+        lst_ends = [obj_term.term_file_start_pos for _, obj_term in lst_items[1:]] + [self.postings_file_size]
+        with open(self.str_idx_file_name, "rb") as idx_file:
+            for (term, obj_term), end in zip(lst_items, lst_ends):
+                idx_file.seek(obj_term.term_file_start_pos)
+                buffer = np.frombuffer(idx_file.read(end-obj_term.term_file_start_pos), dtype=np.uint8)
+                doc_ids, term_freqs = codec.decode_term(buffer, obj_term.doc_count_with_term, SKIP_BLOCK_SIZE)
+                yield term, TermPostings(obj_term.term_id, doc_ids, term_freqs)
 
-            return arr_occur
+    @staticmethod
+    def postings_from_records(dic_termos_por_id, records:np.ndarray) -> (str, TermPostings):
+        term_id = int(records["term_id"][0])
+        return dic_termos_por_id[term_id], TermPostings(term_id, records["doc_id"], records["term_freq"])
 
     def document_count_with_term(self,term:str) -> int:
-        if term not in self.dic_index:
+        obj_term = self.dic_index.get(term)
+        if obj_term is None:
             return 0
-        obj_term = self.dic_index[term]
         return obj_term.doc_count_with_term
+
+
+class SpimiFileIndex(FileIndex):
+    """
+    FileIndex com inversão em memória (SPIMI): as ocorrências de cada bloco são agrupadas, à medida que são indexadas,
+    em um dicionário term_id -> lista de ocorrências (colunas array('I')). Ao atingir o limite do bloco, os termos são
+    ordenados e as listas gravadas em sequência, sem ordenar as ocorrências: como os documentos são indexados
+    em ordem de doc_id, a lista de cada termo já está ordenada. Caso algum documento chegue fora de ordem,
+    o bloco é ordenado por (term_id, doc_id) antes de ser gravado.
+    Os blocos são intercalados no finish_indexing, como os runs do FileIndex
+    """
+    def __init__(self, tmp_occurrences_limit_bytes:int=None, background_flush:bool=False, postings_codec:str=None,
+                 work_dir:str=None):
+        super().__init__(tmp_occurrences_limit_bytes, background_flush, postings_codec, work_dir)
+        #as listas temporárias do FileIndex não são usadas
+        self.arr_tmp_term_ids = self.arr_tmp_doc_ids = self.arr_tmp_term_freqs = None
+        self.dic_block_postings = {}
+        self.block_occurrences = 0
+        self.last_doc_id = -1
+        self.block_docs_in_order = True
+
+    def add_index_occur(self, entry_dic_index:TermFilePosition, doc_id:int, term_id:int, term_freq:int):
+        if doc_id != self.current_doc_id:
+            self.start_document(doc_id)
+        postings = self.dic_block_postings.get(term_id)
+        if postings is None:
+            postings = self.dic_block_postings[term_id] = TermPostings(term_id)
+        postings.append(doc_id, term_freq)
+        if doc_id < self.last_doc_id:
+            self.block_docs_in_order = False
+        self.last_doc_id = doc_id
+
+        self.block_occurrences += 1
+        if self.block_occurrences >= self.tmp_occurrences_limit:
+            self.save_tmp_occurrences()
+
+    def get_tmp_occur_size(self):
+        return self.block_occurrences
+
+    def next_from_list(self) -> TermOccurrence:
+        raise NotImplementedError("O SpimiFileIndex não mantém uma lista temporária de ocorrências")
+
+    def tmp_occurrences_columns(self) -> (np.ndarray, np.ndarray, np.ndarray):
+        #listas do bloco em ordem de term_id (cópia: o bloco é esvaziado em seguida)
+        lst_postings = [self.dic_block_postings[term_id] for term_id in sorted(self.dic_block_postings)]
+        if not lst_postings:
+            return tuple(np.zeros(0, dtype=np.uint32) for _ in range(3))
+        term_ids = np.repeat(np.array([postings.term_id for postings in lst_postings], dtype=np.uint32),
+                             [len(postings) for postings in lst_postings])
+        doc_ids = np.concatenate([np.frombuffer(postings.doc_ids, dtype=np.uint32) for postings in lst_postings])
+        term_freqs = np.concatenate([np.frombuffer(postings.term_freqs, dtype=np.uint32) for postings in lst_postings])
+        if not self.block_docs_in_order:
+            order = np.lexsort((doc_ids, term_ids))
+            term_ids, doc_ids, term_freqs = term_ids[order], doc_ids[order], term_freqs[order]
+        return term_ids, doc_ids, term_freqs
+
+    @staticmethod
+    def write_run(str_file_name:str, term_ids:np.ndarray, doc_ids:np.ndarray, term_freqs:np.ndarray) -> TermDirectory:
+        #as colunas já estão ordenadas por (term_id, doc_id)
+        term_directory = TermDirectory(SKIP_BLOCK_SIZE)
+        with OccurrenceWriter(str_file_name, term_directory=term_directory) as idx_file:
+            idx_file.write(encode_occurrences(doc_ids, term_ids, term_freqs))
+        return term_directory
+
+    def swap_tmp_buffers(self):
+        #as colunas do bloco são cópias: não há lista temporária a ser trocada
+        pass
+
+    def clear_tmp_occurrences(self):
+        self.dic_block_postings = {}
+        self.block_occurrences = 0
+        self.last_doc_id = -1
+        self.block_docs_in_order = True
+
+    def pop_current_document(self) -> (np.ndarray, np.ndarray, np.ndarray):
+        #as ocorrências do documento atual são as ultimas das listas em que ele aparece
+        if self.current_doc_id is None:
+            return None
+        lst_postings = [postings for postings in self.dic_block_postings.values()
+                        if postings.doc_ids[-1] == self.current_doc_id]
+        if len(lst_postings) >= self.block_occurrences:
+            return None
+        carried = (np.array([postings.term_id for postings in lst_postings], dtype=np.uint32),
+                   np.full(len(lst_postings), self.current_doc_id, dtype=np.uint32),
+                   np.array([postings.term_freqs.pop() for postings in lst_postings], dtype=np.uint32))
+        for postings in lst_postings:
+            postings.doc_ids.pop()
+            if len(postings) == 0:
+                del self.dic_block_postings[postings.term_id]
+        self.block_occurrences -= len(lst_postings)
+        return carried
+
+    def push_occurrences(self, term_ids:np.ndarray, doc_ids:np.ndarray, term_freqs:np.ndarray):
+        for term_id, doc_id, term_freq in zip(term_ids.tolist(), doc_ids.tolist(), term_freqs.tolist()):
+            postings = self.dic_block_postings.get(term_id)
+            if postings is None:
+                postings = self.dic_block_postings[term_id] = TermPostings(term_id)
+            postings.append(doc_id, term_freq)
+            self.last_doc_id = doc_id
+        self.block_occurrences += len(term_ids)
@@ -2,9 +2,9 @@ from collections import Counter
 from typing import List, Set,Mapping
 from nltk.tokenize import word_tokenize
 
-from util.time import CheckTime
+from util.performance import CheckTime
 from query.ranking_models import OPERATOR, BooleanRankingModel, RankingModel,VectorRankingModel, IndexPreComputedVals
-from index.structure import Index, TermOccurrence
+from index.structure import Index, FileIndex, TermOccurrence
 from index.indexer import Cleaner
 
 class QueryRunner:
@@ -83,8 +83,7 @@ class QueryRunner:
 				dic_count[term] += 1
 
 		for key, idx in dic_count.items():
-			occurrence_list = self.index.get_occurrence_list(key)
-			if occurrence_list:
+			if self.index.document_count_with_term(key) > 0:
 				map_term_occur[key] = TermOccurrence(
 					None, #doc_id
 					self.index.get_term_id(key), #doc_id
@@ -105,23 +104,29 @@ class QueryRunner:
 			if occur_list == None:
 				dic_terms[term] = []
 			else:
-				dic_terms[term] = occur_list
+				#desconsidera os documentos excluídos (delete_document)
+				dic_terms[term] = self.index.live_occurrences(occur_list)
 		return dic_terms
 	
-	def get_docs_term(self, query:str) -> List[int]:
+	def get_docs_term(self, query:str, k:int=None) -> List[int]:
 		"""
 			A partir do indice, retorna a lista de ids de documentos desta consulta
-			usando o modelo especificado pelo atributo ranking_model
+			usando o modelo especificado pelo atributo ranking_model.
+			Caso k seja informado, apenas os k primeiros documentos são retornados
 		"""
 		#Obtenha, para cada termo da consulta, sua ocorrencia por meio do método get_query_term_occurence
 		dic_query_occur = self.get_query_term_occurence(query)
 
 		#obtenha a lista de ocorrencia dos termos da consulta
-		dic_occur_per_term_query = self.get_occurrence_list_per_term(dic_query_occur.keys())
+		if isinstance(self.ranking_model, BooleanRankingModel) and self.ranking_model.operator == OPERATOR.AND:
+			#conjunção: cursores que saltam os blocos sem documentos em comum
+			dic_occur_per_term_query = {term:self.index.postings_cursor(term) for term in dic_query_occur.keys()}
+		else:
+			dic_occur_per_term_query = self.get_occurrence_list_per_term(dic_query_occur.keys())
 
 
 		#utilize o ranking_model para retornar o documentos ordenados considrando dic_query_occur e dic_occur_per_term_query
-		return self.ranking_model.get_ordered_docs(dic_query_occur, dic_occur_per_term_query)
+		return self.ranking_model.get_ordered_docs(dic_query_occur, dic_occur_per_term_query, k)
 
 	@staticmethod
 	def runQuery(query:str, indice:Index, indice_pre_computado:IndexPreComputedVals , map_relevantes:Mapping[str,Set[int]], cleaner: Cleaner):
@@ -159,7 +164,8 @@ class QueryRunner:
 		_query = query.replace(" ", "_")
 
 		#Utilize o método get_docs_term para obter a lista de documentos que responde esta consulta
-		docs_term = qr.get_docs_term(query)
+		#(apenas o top 50 é usado: precisão/revocação até @50 e as 10 primeiras respostas)
+		docs_term = qr.get_docs_term(query, k=50)
 		respostas = list(docs_term[0])
 		time_checker.print_delta(f"anwered with {len(respostas)} docs")
 
@@ -196,6 +202,9 @@ class QueryRunner:
 	def main():
 		#leia o indice (base da dados fornecida)
 		index = Index().read("wiki_hash.idx")
+		if isinstance(index, FileIndex):
+			#as listas de ocorrências passam a ser fatias do arquivo mapeado em memória
+			index.open_reader()
 
 		dict_docs_title = {}
 		with open("titlePerDoc.dat", encoding="utf8") as arq:
@@ -2,6 +2,11 @@ from typing import List
 from abc import abstractmethod
 from typing import List, Set,Mapping
 from index.structure import TermOccurrence
+from index.postings import PostingsCursor, intersect_cursors, postings_columns
+from index.doc_stats import DocumentStatsTable
+from index.impacts import TermImpacts
+from util.performance import CheckTime
+import heapq
 import math
 import numpy as np
 from enum import Enum
@@ -15,37 +20,104 @@ class IndexPreComputedVals():
         """
         Inicializa os atributos por meio do indice (idx):
             doc_count: o numero de documentos que o indice possui
-            document_norm: A norma por documento (cada termo é presentado pelo seu peso (tfxidf))
+            doc_stats: as estatísticas por documento (ver index/doc_stats.py), entre elas a norma
+            (cada termo é presentado pelo seu peso (tfxidf))
+            term_impacts: a tabela de idf por termo e, caso existam, as listas de impacto (ver index/impacts.py)
+
+        As estatísticas são calculadas no finish_indexing e gravadas junto com o índice (lidas mapeadas em memória);
+        são calculadas aqui apenas caso o índice não as possua (ex.: índices antigos)
         """
-        self.document_norm = {}
+        time_checker = CheckTime()
         doc_count = self.index.document_count
         print("Iniciando atributos por meio do idx...")
-        for doc_id in self.index.set_documents:
-            tf_idf_per_term = []
-            for term in self.index.vocabulary:
-                occurences = self.index.get_occurrence_list(term)
-                term_freq_query = [occur.term_freq for occur in occurences if occur.doc_id == doc_id and occur.term_id == self.index.get_term_id(term)]
 
-                term_freq = term_freq_query[0] if len(term_freq_query) > 0 else 0
-                num_docs_with_term = len(occurences)
-                
-                tf_idf_per_term.append(VectorRankingModel.tf_idf(doc_count, term_freq, num_docs_with_term))
-           
-            norm = math.sqrt(np.square(tf_idf_per_term).sum())
-            self.document_norm[doc_id] = norm
-        
+        if hasattr(self.index, "document_stats"):
+            #indice segmentado: as estatísticas dos segmentos são combinadas, sem percorrer as listas de ocorrências.
+            #Os documentos do segmento ativo não são considerados (o df dos termos é o dos segmentos finalizados)
+            doc_count = self.index.searchable_document_count
+            self.doc_stats = self.index.document_stats().table(doc_count)
+            time_checker.print_delta("Combinação das normas dos segmentos")
+        elif getattr(self.index, "doc_stats", None) is not None:
+            self.doc_stats = self.index.doc_stats
+        else:
+            self.doc_stats = DocumentStatsTable.from_index(self.index)
+            time_checker.print_delta("Precomputação das normas dos documentos")
+        self.term_impacts = getattr(self.index, "term_impacts", None)
+        if self.term_impacts is None:
+            #apenas a tabela de idf (obtida do df de cada termo, sem percorrer as listas de ocorrências)
+            self.term_impacts = TermImpacts.from_index(self.index, doc_count=doc_count)
         self.doc_count = doc_count
-        
+        self._document_norm = None
+        self.precompute_time = time_checker.total_seconds
+
+    @property
+    def document_norm(self) -> Mapping[int,float]:
+        #dicionário criado apenas quando acessado: as consultas usam diretamente a tabela (norms_of)
+        if self._document_norm is None:
+            self._document_norm = dict(zip(self.doc_stats.doc_ids.tolist(), self.doc_stats.norms.tolist()))
+        return self._document_norm
+
+    @document_norm.setter
+    def document_norm(self, document_norm:Mapping[int,float]):
+        #mantem a tabela consistente com o dicionário informado
+        self._document_norm = document_norm
+        self.doc_stats = DocumentStatsTable.from_columns(list(document_norm.keys()), list(document_norm.values()))
+
+    def norms_of(self, doc_ids:np.ndarray) -> (np.ndarray, np.ndarray):
+        """
+        Retorna as normas dos documentos doc_ids e uma máscara indicando quais deles possuem norma
+        """
+        return self.doc_stats.norms_of(doc_ids)
+
+    def term_id(self, term:str) -> int:
+        #term_id do termo no índice (None caso não exista)
+        if term not in self.index.dic_index:
+            return None
+        term_id = self.index.get_term_id(term)
+        return term_id if term_id < len(self.term_impacts.idfs) else None
+
+    def term_idf(self, term:str, num_docs_with_term:int) -> float:
+        """
+        idf do termo, obtido da tabela de idf. Termos ausentes do índice (ex.: listas de ocorrências
+        informadas diretamente) têm o idf calculado a partir de num_docs_with_term
+        """
+        term_id = self.term_id(term)
+        if term_id is None:
+            return VectorRankingModel.idf(self.doc_count, num_docs_with_term)
+        return float(self.term_impacts.idfs[term_id])
+
 class RankingModel():
     @abstractmethod
     def get_ordered_docs(self,query:Mapping[str,TermOccurrence],
-                              docs_occur_per_term:Mapping[str,List[TermOccurrence]]) -> (List[int], Mapping[int,float]):
+                              docs_occur_per_term:Mapping[str,List[TermOccurrence]], k:int=None) -> (List[int], Mapping[int,float]):
         raise NotImplementedError("Voce deve criar uma subclasse e a mesma deve sobrepor este método")
 
-    def rank_document_ids(self,documents_weight):
-        doc_ids = list(documents_weight.keys())
-        doc_ids.sort(key= lambda x:-documents_weight[x])
-        return doc_ids
+    def rank_document_ids(self,documents_weight, k:int=None):
+        """
+        Ordena os documentos pelo peso (decrescente). Empates são desfeitos pelo menor doc_id.
+        Caso k seja informado, apenas os k primeiros são selecionados (heap limitado a k elementos)
+        """
+        sort_key = lambda doc_id:(-documents_weight[doc_id], doc_id)
+        if k is None:
+            return sorted(documents_weight.keys(), key=sort_key)
+        return heapq.nsmallest(k, documents_weight.keys(), key=sort_key)
+
+    @staticmethod
+    def rank_document_arrays(doc_ids:np.ndarray, weights:np.ndarray, k:int=None) -> List[int]:
+        """
+        Versão vetorizada de rank_document_ids: seleciona os k maiores pesos com numpy.argpartition
+        e ordena apenas os candidatos (mesmo desempate: menor doc_id)
+        """
+        if k is not None and k < len(doc_ids):
+            if k <= 0:
+                return []
+            kth_weight = weights[np.argpartition(-weights, k-1)[:k]].min()
+            #mantem todos os empatados com o k-ésimo peso para que o desempate seja deterministico
+            candidates = np.flatnonzero(weights >= kth_weight)
+            doc_ids = doc_ids[candidates]
+            weights = weights[candidates]
+        order = np.lexsort((doc_ids, -weights))
+        return doc_ids[order[:k]].tolist()
 
 class OPERATOR(Enum):
   AND = 1
@@ -57,16 +129,21 @@ class BooleanRankingModel(RankingModel):
         self.operator = operator
 
     def intersection_all(self,map_lst_occurrences:Mapping[str,List[TermOccurrence]]) -> List[int]:
-        set_ids = set()
+        lst_cursors = list(map_lst_occurrences.values())
+        if lst_cursors and all(isinstance(cursor, PostingsCursor) for cursor in lst_cursors):
+            #listas percorridas com saltos (advance_to), sem serem lidas por completo
+            return set(intersect_cursors(lst_cursors))
+        #None: nenhuma lista intersectada ainda (uma interseção vazia permanece vazia)
+        set_ids = None
 
         for _, lst_occurrences in map_lst_occurrences.items():
             doc_ids = set([occur.doc_id for occur in lst_occurrences])
-            if not set_ids:
+            if set_ids is None:
                 set_ids = doc_ids
             else:
                 set_ids = set_ids & doc_ids
             
-        return set_ids
+        return set() if set_ids is None else set_ids
     
     def union_all(self,map_lst_occurrences:Mapping[str,List[TermOccurrence]]) -> List[int]:
         set_ids = set()
@@ -81,18 +158,37 @@ class BooleanRankingModel(RankingModel):
         return set_ids
 
     def get_ordered_docs(self,query:Mapping[str,TermOccurrence],
-                              map_lst_occurrences:Mapping[str,List[TermOccurrence]]) -> (List[int], Mapping[int,float]):
+                              map_lst_occurrences:Mapping[str,List[TermOccurrence]], k:int=None) -> (List[int], Mapping[int,float]):
         """Considere que map_lst_occurrences possui as ocorrencias apenas dos termos que existem na consulta"""
         if self.operator == OPERATOR.AND:
-            return self.intersection_all(map_lst_occurrences),None
+            set_ids = self.intersection_all(map_lst_occurrences)
         else:
-            return self.union_all(map_lst_occurrences),None
+            set_ids = self.union_all(map_lst_occurrences)
+
+        #sem pesos, os documentos são ordenados pelo doc_id (os k primeiros são os de menor doc_id)
+        if k is not None:
+            return heapq.nsmallest(k, set_ids),None
+        return sorted(set_ids),None
 
 #Atividade 2
 class VectorRankingModel(RankingModel):
+    #a partir deste número de ocorrências, os acumuladores são somados de forma vetorizada
+    SCATTER_ADD_MIN_POSTINGS = 2048
+    #ocorrências lidas de cada lista de impacto por rodada da avaliação com término antecipado
+    IMPACT_BLOCK_SIZE = 1024
+    #a máscara dos termos já vistos de cada documento é somada em float64 (exata até 2^53)
+    IMPACT_MAX_TERMS = 52
 
-    def __init__(self,idx_pre_comp_vals:IndexPreComputedVals):
+    def __init__(self,idx_pre_comp_vals:IndexPreComputedVals, use_impacts:bool=False):
+        """
+        use_impacts: caso o índice possua listas de impacto (ver index/impacts.py), as consultas são avaliadas
+        por elas (cosseno aproximado pelos impactos quantizados). Nesse caso, as ocorrências de cada termo são
+        as das listas de impacto do índice: as listas informadas em docs_occur_per_term indicam apenas os termos
+        """
         self.idx_pre_comp_vals = idx_pre_comp_vals
+        self.use_impacts = use_impacts
+        #ocorrências lidas na ultima consulta avaliada pelas listas de impacto
+        self.impact_postings_read = 0
 
     @staticmethod
     def tf(freq_term:int) -> float:
@@ -114,40 +210,182 @@ class VectorRankingModel(RankingModel):
         
         return tf*idf
 
-    def get_ordered_docs(self,query:Mapping[str,TermOccurrence],docs_occur_per_term:Mapping[str,List[TermOccurrence]]) -> (List[int], Mapping[int,float]):
-            
+    def get_ordered_docs(self,query:Mapping[str,TermOccurrence],docs_occur_per_term:Mapping[str,List[TermOccurrence]], k:int=None) -> (List[int], Mapping[int,float]):
+            """
+            Avalia a consulta termo a termo (term-at-a-time): apenas os documentos presentes nas listas
+            de ocorrências dos termos da consulta recebem um acumulador. Quando o total de ocorrências
+            é grande, a soma é feita de forma vetorizada (scatter-add com NumPy).
+            Caso k seja informado, apenas os k documentos de maior peso são ordenados e retornados.
+            """
+            term_impacts = self.idx_pre_comp_vals.term_impacts
+            if self.use_impacts and term_impacts is not None and term_impacts.has_impacts:
+                return self.get_ordered_docs_by_impact(query, docs_occur_per_term, k)
             doc_count = self.idx_pre_comp_vals.doc_count
-            doc_ids = self.idx_pre_comp_vals.document_norm.keys()
-
-            tf_idf = {}
-            num_docs_with_term_per_term = {}
 
-            for term, occurences in docs_occur_per_term.items():
-                num_docs_with_term_per_term[term] = len(occurences)
+            #(ocorrencias, idf, peso na consulta) dos termos da consulta presentes no indice
+            arr_query_terms = []
+            num_postings = 0
+            for term,occurence in query.items():
+                if term not in docs_occur_per_term:
+                    continue
+                occurences = docs_occur_per_term[term]
                 num_docs_with_term = len(occurences)
-                term_tf_idf = {}
-
-                for doc_id in doc_ids:
-                    term_freq_query = [occur.term_freq for occur in occurences if occur.doc_id == doc_id]
-                    
-                    term_freq = term_freq_query[0] if len(term_freq_query) > 0 else 0
-                    num_docs_with_term = len(occurences)
-
-                    term_tf_idf[doc_id] = VectorRankingModel.tf_idf(doc_count, term_freq, num_docs_with_term)
-                tf_idf[term] = term_tf_idf
-
-            documents_weight = {}
-            for doc_id in doc_ids:
-                sim = 0
-                for term,occurence in query.items():
-                    if term in num_docs_with_term_per_term:
-                        query_tf_idf = VectorRankingModel.tf_idf(doc_count, occurence.term_freq, num_docs_with_term_per_term.get(term, 0))
-                        sim += tf_idf[term][doc_id] * query_tf_idf
-                
-                if sim != 0:
-                    sim /= self.idx_pre_comp_vals.document_norm[doc_id]
-                    documents_weight[doc_id] = sim
+                if occurence.term_freq <= 0 or num_docs_with_term == 0:
+                    continue
+                #idf da tabela calculada na indexação
+                idf = self.idx_pre_comp_vals.term_idf(term, num_docs_with_term)
+                query_tf_idf = VectorRankingModel.tf(occurence.term_freq) * idf
+                if query_tf_idf == 0:
+                    continue
+                arr_query_terms.append((occurences, idf, query_tf_idf))
+                num_postings += num_docs_with_term
 
+            if num_postings >= self.SCATTER_ADD_MIN_POSTINGS:
+                doc_ids, weights = self.accumulate_scatter_add(arr_query_terms, doc_count)
+                documents_weight = dict(zip(doc_ids.tolist(), weights.tolist()))
+                #retona a lista de doc ids ordenados de acordo com o TF IDF
+                return self.rank_document_arrays(doc_ids, weights, k),documents_weight
+
+            documents_weight = self.accumulate_term_at_a_time(arr_query_terms, doc_count)
             #retona a lista de doc ids ordenados de acordo com o TF IDF
-            return self.rank_document_ids(documents_weight),documents_weight
+            return self.rank_document_ids(documents_weight, k),documents_weight
+
+    def accumulate_term_at_a_time(self, arr_query_terms:List, doc_count:int) -> Mapping[int,float]:
+        accumulators = {}
+        for occurences, idf, query_tf_idf in arr_query_terms:
+            for occur in occurences:
+                doc_tf_idf = (1 + math.log2(occur.term_freq)) * idf
+                accumulators[occur.doc_id] = accumulators.get(occur.doc_id, 0) + doc_tf_idf * query_tf_idf
+
+        #normas obtidas da tabela (acesso direto pelo ordinal do documento)
+        doc_ids = np.fromiter(accumulators.keys(), dtype=np.int64, count=len(accumulators))
+        sims = np.fromiter(accumulators.values(), dtype=np.float64, count=len(accumulators))
+        norms, found = self.idx_pre_comp_vals.norms_of(doc_ids)
+        mask = found & (sims != 0)
+        return dict(zip(doc_ids[mask].tolist(), (sims[mask] / norms[mask]).tolist()))
+
+    def accumulate_scatter_add(self, arr_query_terms:List, doc_count:int) -> (np.ndarray, np.ndarray):
+        if len(arr_query_terms) == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float64)
+        arr_doc_ids = []
+        arr_weights = []
+        for occurences, idf, query_tf_idf in arr_query_terms:
+            doc_ids, term_freqs = postings_columns(occurences)
+            arr_doc_ids.append(doc_ids)
+            arr_weights.append((1 + np.log2(term_freqs)) * idf * query_tf_idf)
+
+        #cada documento distinto recebe um acumulador; a soma segue a ordem dos termos da consulta
+        doc_ids, ordinals = np.unique(np.concatenate(arr_doc_ids), return_inverse=True)
+        sims = np.bincount(ordinals, weights=np.concatenate(arr_weights), minlength=len(doc_ids))
+
+        norms, found = self.idx_pre_comp_vals.norms_of(doc_ids)
+        mask = found & (sims != 0)
+        return doc_ids[mask], sims[mask] / norms[mask]
+
+    def get_ordered_docs_by_impact(self, query:Mapping[str,TermOccurrence], docs_occur_per_term:Mapping[str,List[TermOccurrence]],
+                                   k:int=None) -> (List[int], Mapping[int,float]):
+        """
+        Avalia a consulta pelas listas de impacto: o peso de um documento é a soma, para cada termo da consulta,
+        do peso do termo na consulta multiplicado pelo impacto (tf-idf/norma já quantizado) do documento.
+        Caso k seja informado, as listas são lidas em ordem de impacto e a leitura termina assim que os k
+        primeiros documentos estiverem definidos (ver accumulate_impact_ordered); nesse caso, são retornados
+        apenas os pesos desses k documentos
+        """
+        term_impacts = self.idx_pre_comp_vals.term_impacts
+        index = self.idx_pre_comp_vals.index
+        has_deletions = getattr(index, "has_deletions", False)
+        #(doc_ids, contribuições) em ordem de contribuição decrescente, um item por termo da consulta
+        lst_impact_terms = []
+        for term,occurence in query.items():
+            term_id = self.idx_pre_comp_vals.term_id(term) if term in docs_occur_per_term else None
+            if term_id is None or occurence.term_freq <= 0:
+                continue
+            query_tf_idf = VectorRankingModel.tf(occurence.term_freq) * term_impacts.idf(term_id)
+            if query_tf_idf == 0:
+                continue
+            doc_ids, impacts = term_impacts.impact_postings(term_id)
+            if has_deletions:
+                mask = index.live_docs.live_mask(doc_ids)
+                doc_ids, impacts = doc_ids[mask], impacts[mask]
+            lst_impact_terms.append((np.asarray(doc_ids, dtype=np.int64), impacts * query_tf_idf))
+
+        if k is not None and 0 < len(lst_impact_terms) <= self.IMPACT_MAX_TERMS:
+            doc_ids, weights = self.accumulate_impact_ordered(lst_impact_terms, k)
+        else:
+            self.impact_postings_read = sum(len(doc_ids) for doc_ids, _ in lst_impact_terms)
+            doc_ids, weights = self.sum_contributions(lst_impact_terms)
+        return self.rank_document_arrays(doc_ids, weights, k), dict(zip(doc_ids.tolist(), weights.tolist()))
+
+    @staticmethod
+    def sum_contributions(lst_impact_terms:List) -> (np.ndarray, np.ndarray):
+        #soma (na ordem dos termos da consulta) das contribuições de cada documento
+        if len(lst_impact_terms) == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float64)
+        doc_ids, ordinals = np.unique(np.concatenate([doc_ids for doc_ids, _ in lst_impact_terms]), return_inverse=True)
+        sims = np.bincount(ordinals, weights=np.concatenate([contribs for _, contribs in lst_impact_terms]),
+                           minlength=len(doc_ids))
+        mask = sims != 0
+        return doc_ids[mask], sims[mask]
+
+    def accumulate_impact_ordered(self, lst_impact_terms:List, k:int) -> (np.ndarray, np.ndarray):
+        """
+        Leitura das listas de impacto com término antecipado (no estilo do algoritmo NRA de Fagin): a cada rodada são
+        lidas IMPACT_BLOCK_SIZE ocorrências de cada termo. O peso parcial de um documento é um limite inferior do
+        seu peso e, somando as contribuições das próximas ocorrências (fronteira) dos termos em que ele ainda não foi
+        visto, obtém-se um limite superior. A leitura termina quando os k maiores pesos parciais estão completos
+        e são maiores que o limite superior de qualquer outro documento (lido ou não).
+        Retorna os k documentos e os seus pesos, somados na mesma ordem de sum_contributions
+        """
+        num_terms = len(lst_impact_terms)
+        positions = [0]*num_terms
+        acc_doc_ids = np.zeros(0, dtype=np.int64)
+        acc_lower = np.zeros(0, dtype=np.float64)
+        acc_seen = np.zeros(0, dtype=np.float64)
+        self.impact_postings_read = 0
+        while True:
+            arr_doc_ids, arr_contribs, arr_bits = [acc_doc_ids], [acc_lower], [acc_seen]
+            for term_pos, (doc_ids, contribs) in enumerate(lst_impact_terms):
+                start = positions[term_pos]
+                end = min(start+self.IMPACT_BLOCK_SIZE, len(doc_ids))
+                if start >= end:
+                    continue
+                arr_doc_ids.append(doc_ids[start:end])
+                arr_contribs.append(contribs[start:end])
+                arr_bits.append(np.full(end-start, float(1 << term_pos)))
+                positions[term_pos] = end
+                self.impact_postings_read += end-start
+            acc_doc_ids, ordinals = np.unique(np.concatenate(arr_doc_ids), return_inverse=True)
+            acc_lower = np.bincount(ordinals, weights=np.concatenate(arr_contribs), minlength=len(acc_doc_ids))
+            acc_seen = np.bincount(ordinals, weights=np.concatenate(arr_bits), minlength=len(acc_doc_ids))
+
+            frontier = [float(contribs[pos]) if pos < len(contribs) else 0.0
+                        for pos, (_, contribs) in zip(positions, lst_impact_terms)]
+            if sum(frontier) == 0:
+                #as ocorrências restantes não alteram os pesos
+                break
+            if len(acc_doc_ids) < k:
+                continue
+            seen = acc_seen.astype(np.int64)
+            acc_upper = acc_lower.copy()
+            for term_pos, term_frontier in enumerate(frontier):
+                acc_upper += np.where((seen >> term_pos) & 1 == 0, term_frontier, 0.0)
+            order = np.lexsort((acc_doc_ids, -acc_lower))
+            top, rest = order[:k], order[k:]
+            max_other = max(float(acc_upper[rest].max()) if len(rest) > 0 else 0.0, sum(frontier))
+            #margem relativa: empates (ou diferenças de arredondamento) exigem a leitura de mais ocorrências
+            if np.all(acc_upper[top] == acc_lower[top]) and acc_lower[top].min() > max_other*(1+1e-9):
+                acc_doc_ids = acc_doc_ids[top]
+                break
 
+        #pesos dos documentos selecionados somados na ordem dos termos (mesmo resultado da leitura completa)
+        weights = np.zeros(len(acc_doc_ids), dtype=np.float64)
+        for pos, (doc_ids, contribs) in zip(positions, lst_impact_terms):
+            if pos == 0:
+                continue
+            read_doc_ids = doc_ids[:pos]
+            sorter = np.argsort(read_doc_ids, kind="stable")
+            found_pos = np.minimum(np.searchsorted(read_doc_ids, acc_doc_ids, sorter=sorter), pos-1)
+            found = read_doc_ids[sorter[found_pos]] == acc_doc_ids
+            weights = weights + np.where(found, contribs[sorter[found_pos]], 0.0)
+        mask = weights != 0
+        return acc_doc_ids[mask], weights[mask]
@@ -1,5 +1,7 @@
 from query.ranking_models import IndexPreComputedVals,VectorRankingModel,BooleanRankingModel,  OPERATOR
 from index.structure import HashIndex,FileIndex,TermOccurrence
+from index.segments import SegmentedIndex
+import numpy as np
 import unittest
 
 class RankingModelTest(unittest.TestCase):
@@ -41,13 +43,55 @@ class RankingModelTest(unittest.TestCase):
                                     "times":TermOccurrence(None, 6, 1)}]
                                     ]
     def test_precomputed_vals(self):
-        index = FileIndex()
+        for index in [FileIndex(), HashIndex()]:
+            self.check_precomputed_vals(index)
+
+    def test_precomputed_vals_segments(self):
+        #os documentos 1 e 2 ficam em um segmento e o 3 em outro: as normas são combinadas
+        index = SegmentedIndex(background_merge=False)
         index.index("new",1,4)
         index.index("york",1,1)
         index.index("times",1,1)
         index.index("new",2,1)
         index.index("york",2,1)
         index.index("post",2,1)
+        index.finish_indexing()
+        self.check_precomputed_vals(index, False)
+
+    def test_precomputed_vals_active_segment(self):
+        #o documento 4 está no segmento ativo (ainda não finalizado): não é considerado no idf nem nas normas
+        index = SegmentedIndex(background_merge=False)
+        index.index("new",1,4)
+        index.index("york",1,1)
+        index.index("times",1,1)
+        index.index("new",2,1)
+        index.index("york",2,1)
+        index.index("post",2,1)
+        index.index("los",3,1)
+        index.index("angeles",3,1)
+        index.index("times",3,1)
+        index.finish_indexing()
+        index.index("new",4,1)
+        index.index("post",4,2)
+        self.assertEqual(index.document_count, 4)
+
+        expected = HashIndex()
+        self.check_precomputed_vals(expected)
+        precomp, expected_precomp = IndexPreComputedVals(index), IndexPreComputedVals(expected)
+        self.assertEqual(precomp.doc_count, 3)
+        for doc_id, norm in expected_precomp.document_norm.items():
+            self.assertAlmostEqual(precomp.document_norm[doc_id], norm)
+        for term in expected.vocabulary:
+            self.assertAlmostEqual(precomp.term_idf(term, None), expected_precomp.term_idf(term, None))
+
+    def check_precomputed_vals(self, index, index_first_docs:bool=True):
+        if index_first_docs:
+            index.index("new",1,4)
+            index.index("york",1,1)
+            index.index("times",1,1)
+            index.index("new",2,1)
+            index.index("york",2,1)
+            index.index("post",2,1)
         index.index("los",3,1)
         index.index("angeles",3,1)
         index.index("times",3,1)
@@ -59,7 +103,7 @@ class RankingModelTest(unittest.TestCase):
         
         self.assertEqual(precomp.doc_count,3,"Numero de documentos inesperado")
         for doc_id,norma_esperada in norma_esperada_per_doc.items():
-            self.assertAlmostEqual(norma_esperada, precomp.document_norm[doc_id], places=2,msg=f"Norma inesperada do documento {doc_id}")
+            self.assertAlmostEqual(norma_esperada, precomp.document_norm[doc_id], places=2,msg=f"Norma inesperada do documento {doc_id} ({type(index).__name__})")
             
     def obtem_index_for_query(self,map_query,map_index):
         map_index_for_query = {}
@@ -87,10 +131,36 @@ class RankingModelTest(unittest.TestCase):
                 set_response =  set(lst_response)
                 self.assertSetEqual(set_response, arr_set_esperado_or_per_query[idx][query_position],
                                     msg=f"Consulta com operador OR obteve um resultado inesperado ({set_response}) para o indice {idx} consulta {query_position}. Esperava-se: {arr_set_esperado_or_per_query[idx][query_position]} ")
+
+                #sempre uma lista ordenada pelo doc_id, com ou sem k
+                for k in [None, 1]:
+                    lst_response,_ = model_or.get_ordered_docs(map_query, map_index_for_query, k)
+                    self.assertIsInstance(lst_response, list)
+                    self.assertListEqual(lst_response, sorted(arr_set_esperado_or_per_query[idx][query_position])[:k])
                 
 
 
+    def test_boolean_model_disjoint_terms(self):
+        #AND de termos sem documentos em comum: vazio com listas ou cursores, mesmo com um terceiro termo
+        index = HashIndex()
+        for term, doc_id in [("casa", 1), ("verde", 2), ("azul", 1), ("azul", 2)]:
+            index.index(term, doc_id, 1)
+        index.finish_indexing()
+        model_and = BooleanRankingModel(OPERATOR.AND)
+        for lst_terms in [["casa", "verde"], ["casa", "verde", "azul"]]:
+            map_lists = {term:index.get_occurrence_list(term) for term in lst_terms}
+            map_cursors = {term:index.postings_cursor(term) for term in lst_terms}
+            for map_occurrences in [map_lists, map_cursors]:
+                lst_response, _ = model_and.get_ordered_docs({term:None for term in lst_terms}, map_occurrences)
+                self.assertListEqual(lst_response, [])
+
     def test_vector_model(self):
+        self.check_vector_model(scatter_add_min_postings=VectorRankingModel.SCATTER_ADD_MIN_POSTINGS)
+
+    def test_vector_model_scatter_add(self):
+        self.check_vector_model(scatter_add_min_postings=0)
+
+    def check_vector_model(self, scatter_add_min_postings:int):
         index = FileIndex()
         precomp = IndexPreComputedVals(index)
         
@@ -103,6 +173,7 @@ class RankingModelTest(unittest.TestCase):
             precomp.doc_count = len(arr_norm_por_index[idx].keys())
             for query_position, map_query in enumerate(self.arr_queries_per_idx[idx]):
                 vector_model  = VectorRankingModel(precomp)
+                vector_model.SCATTER_ADD_MIN_POSTINGS = scatter_add_min_postings
                 map_index_for_query = self.obtem_index_for_query(map_query,map_index)
                 lst_response, doc_weights = vector_model.get_ordered_docs(map_query, map_index_for_query)
                 self.assertListEqual(lst_response, arr_lst_esperado_per_query[idx][query_position],
@@ -115,5 +186,79 @@ class RankingModelTest(unittest.TestCase):
                         self.assertTrue(doc_id not in doc_weights, f"O documento {doc_id} não deveria ser recuperado da consulta {query_position} indice {idx}")
                     else:
                         self.assertAlmostEqual(peso, doc_weights[doc_id], places=2,msg=f"Peso inesperado do documento {doc_id} consulta {query_position} índice {idx}. Peso calculado:{doc_weights[doc_id]} deveria ser: {peso}")
+    def test_rank_top_k(self):
+        documents_weight = {7:0.5, 3:0.9, 5:0.5, 1:0.2, 9:0.5, 2:0.9}
+        lst_esperada = [2,3,5,7,9,1]
+        model = BooleanRankingModel(OPERATOR.AND)
+        doc_ids = np.array(list(documents_weight.keys()))
+        weights = np.array(list(documents_weight.values()))
+        self.assertListEqual(model.rank_document_ids(documents_weight), lst_esperada, "Empates devem ser desfeitos pelo menor doc_id")
+        for k in range(len(lst_esperada)+2):
+            self.assertListEqual(model.rank_document_ids(documents_weight, k), lst_esperada[:k], f"Top {k} inesperado (heap)")
+            self.assertListEqual(model.rank_document_arrays(doc_ids, weights, k), lst_esperada[:k], f"Top {k} inesperado (argpartition)")
+
+    def test_vector_model_top_k(self):
+        precomp = IndexPreComputedVals(FileIndex())
+        precomp.document_norm = {1:1.44,2:1.16,3:2.08,4:1.3}
+        precomp.doc_count = 4
+        map_query = self.arr_queries_per_idx[0][0]
+        map_index_for_query = self.obtem_index_for_query(map_query,self.arr_indexes[0])
+        for scatter_add_min_postings in [0, VectorRankingModel.SCATTER_ADD_MIN_POSTINGS]:
+            vector_model  = VectorRankingModel(precomp)
+            vector_model.SCATTER_ADD_MIN_POSTINGS = scatter_add_min_postings
+            lst_completa, _ = vector_model.get_ordered_docs(map_query, map_index_for_query)
+            for k in range(5):
+                lst_response, _ = vector_model.get_ordered_docs(map_query, map_index_for_query, k)
+                self.assertListEqual(lst_response, lst_completa[:k], f"Top {k} inesperado")
+
+    def impact_index(self, impact_bits:int):
+        #poucos documentos com tf alto em cada termo: as listas de impacto podem ser lidas apenas em parte
+        index = HashIndex()
+        index.impact_bits = impact_bits
+        for doc_id in range(1, 301):
+            for term in range(doc_id%7, 40, 5):
+                index.index(f"termo{term}", doc_id, 20 if doc_id%50 == term else doc_id%3+1)
+        index.finish_indexing()
+        return index
+
+    def test_vector_model_impacts(self):
+        index = self.impact_index(16)
+        precomp = IndexPreComputedVals(index)
+        self.assertTrue(precomp.term_impacts.has_impacts)
+        map_query = {"termo2":TermOccurrence(None, 0, 1), "termo7":TermOccurrence(None, 0, 2)}
+        map_occurrences = {term:index.get_occurrence_list(term) for term in map_query}
+        lst_exact, dic_exact = VectorRankingModel(precomp, use_impacts=False).get_ordered_docs(map_query, map_occurrences)
+        #por padrão, o cosseno é exato mesmo com as listas de impacto no índice
+        self.assertListEqual(VectorRankingModel(precomp).get_ordered_docs(map_query, map_occurrences)[0], lst_exact)
+        lst_impacts, dic_impacts = VectorRankingModel(precomp, use_impacts=True).get_ordered_docs(map_query, map_occurrences)
+        self.assertCountEqual(dic_impacts.keys(), dic_exact.keys())
+        for doc_id, peso in dic_exact.items():
+            self.assertAlmostEqual(dic_impacts[doc_id], peso, places=3, msg=f"Impacto inesperado do documento {doc_id}")
+        #pesos quantizados: apenas empates podem mudar de ordem
+        self.assertEqual(lst_impacts[0], lst_exact[0])
+
+    def test_vector_model_impacts_top_k(self):
+        index = self.impact_index(4)
+        precomp = IndexPreComputedVals(index)
+        map_query = {f"termo{term}":TermOccurrence(None, 0, term%2+1) for term in [2, 7, 12]}
+        map_occurrences = {term:index.get_occurrence_list(term) for term in map_query}
+        num_postings = sum(len(occurrences) for occurrences in map_occurrences.values())
+        vector_model = VectorRankingModel(precomp, use_impacts=True)
+        vector_model.IMPACT_BLOCK_SIZE = 4
+        lst_completa, dic_completo = vector_model.get_ordered_docs(map_query, map_occurrences)
+        self.assertEqual(vector_model.impact_postings_read, num_postings)
+        for k in [1, 2, 5, 50, 500]:
+            lst_response, dic_weights = vector_model.get_ordered_docs(map_query, map_occurrences, k)
+            self.assertListEqual(lst_response, lst_completa[:k], f"Top {k} inesperado")
+            for doc_id in lst_response:
+                self.assertEqual(dic_weights[doc_id], dic_completo[doc_id])
+            if k == 1:
+                self.assertLess(vector_model.impact_postings_read, num_postings, "A leitura deveria terminar antes")
+
+        #documentos excluídos não são retornados
+        index.delete_document(lst_completa[0])
+        lst_response, _ = vector_model.get_ordered_docs(map_query, map_occurrences, 2)
+        self.assertListEqual(lst_response, lst_completa[1:3])
+
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
@@ -7,11 +7,10 @@ if __name__ == "__main__":
                         perform_stop_words_removal=True,
                         perform_accents_removal=True,
                         perform_stemming=False)
-    indexer = HTMLIndexer(FileIndex())
+    #runs e manifesto em wiki_build: caso a indexação seja interrompida, ela é retomada do ultimo run concluído
+    indexer = HTMLIndexer(FileIndex(work_dir="wiki_build"), num_workers=os.cpu_count())
     indexer.index_text_dir("wiki")
-    counter = indexer.index.idx_file_counter
-
-    old_path = "occur_" + str(counter) + ".idx"
+    old_path = indexer.index.str_idx_file_name
     new_path = "wiki.idx"
     os.rename(old_path, new_path)
 
@@ -1,5 +1,12 @@
+"""
+Indexa os documentos do diretório wiki e grava o índice (formato binário, ver index/storage.py) em wiki_hash.idx.
+Caso wiki_hash.idx seja um índice antigo (pickle), ele é mantido em wiki_hash.idx.pickle: o write_index não
+sobrescreve arquivos que não são índices no formato binário. Para converter um índice antigo sem indexar
+novamente: python -m index.storage to-binary wiki_hash.idx wiki_hash.bin
+"""
 from index.indexer import *
 from index.structure import *
+from index.storage import is_binary_index
 
 if __name__ == "__main__":
     HTMLIndexer.cleaner = Cleaner(stop_words_file="stopwords.txt",
@@ -7,8 +14,11 @@ if __name__ == "__main__":
                         perform_stop_words_removal=True,
                         perform_accents_removal=True,
                         perform_stemming=False)
-    indexer = HTMLIndexer(HashIndex())
+    #um processo por núcleo para ler e processar os arquivos
+    indexer = HTMLIndexer(HashIndex(), num_workers=os.cpu_count())
     indexer.index_text_dir("wiki")
 
     path = "wiki_hash.idx"
-    indexer.index.write(path)
\ No newline at end of file
+    if os.path.exists(path) and not is_binary_index(path):
+        os.replace(path, f"{path}.pickle")
+    indexer.index.write(path)